@@ -0,0 +1,179 @@
+"""
+Benchmarks for winreglib, run against a `MemoryBackend` so they work on any platform:
+
+    python benchmarks/bench.py [--width 10] [--depth 3] [--latency 0.00002] [--filter walk] [--output bench_output.txt]
+
+Each benchmark reports operations per second and the backend calls each operation makes. `--latency` adds that many
+seconds to every backend call, to mimic the kernel round-trip of the real registry.
+"""
+import argparse
+import sys
+import time
+import os
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from winreglib import Instrumentation, MemoryBackend, RegPath, RegTransaction
+
+
+class LatencyBackend(MemoryBackend):
+    """A `MemoryBackend` where every primitive call takes at least `latency` seconds longer."""
+
+    def __init__(self,latency=0.0):
+        super().__init__()
+        self.latency=latency
+
+    def _wait(self):
+        # spin rather than sleep, sleeps are far coarser than a registry call
+        end=time.perf_counter()+self.latency
+        while time.perf_counter()<end: pass
+
+
+def _add_latency(name):
+    method=getattr(MemoryBackend,name)
+    def primitive(self,*args,**kwargs):
+        if self.latency: self._wait()
+        return method(self,*args,**kwargs)
+    primitive.__name__=name
+    return primitive
+
+for _name in Instrumentation.PRIMITIVES:
+    if _name!='notify_change': setattr(LatencyBackend,_name,_add_latency(_name))
+
+
+
+# ----------------------------------------
+# Benchmarks
+# ----------------------------------------
+ROOT=r'HKCU\Software\winreglib\bench'
+
+
+def build_tree(backend,width,depth,values=2):
+    """Creates a tree `depth` levels deep below ROOT with `width` subkeys per key and `values` values in each key."""
+    with RegTransaction(backend) as tx:
+        def add(path,level):
+            for i in range(values): tx.set(path,'value{}'.format(i),'data{}'.format(i))
+            if level<depth:
+                for i in range(width): add(r'{}\key{}'.format(path,i),level+1)
+        add(ROOT,0)
+    return RegPath(ROOT,backend=backend)
+
+
+def bench_path_init(backend,args):
+    return lambda:RegPath(r'HKCU\Software\winreglib\bench\key1\key2')
+
+def bench_path_truediv(backend,args):
+    p=RegPath(ROOT,backend=backend)
+    return lambda:p/'key1'/'key2'
+
+def bench_split_path(backend,args):
+    return lambda:RegPath._split_path(r'HKLM\Software\winreglib\bench\key1\key2')
+
+def bench_subkeys(backend,args):
+    p=build_tree(backend,args.width*10,1)
+    return lambda:list(p.subkeys())
+
+def bench_subvalues(backend,args):
+    p=build_tree(backend,1,0,values=args.width*10)
+    return lambda:list(p.subvalues())
+
+def bench_value_get(backend,args):
+    value=build_tree(backend,1,0).value('value0')
+    return value.get
+
+def bench_value_set(backend,args):
+    value=RegPath(ROOT,backend=backend).value('value0')
+    return lambda:value.set('data')
+
+def bench_read_all(backend,args):
+    p=build_tree(backend,1,0,values=args.width)
+    return p.read_all
+
+def bench_walk(backend,args):
+    p=build_tree(backend,args.width,args.depth)
+    return lambda:list(p.walk())
+
+def bench_walk_no_data(backend,args):
+    p=build_tree(backend,args.width,args.depth)
+    return lambda:list(p.walk(data=False))
+
+def bench_scan(backend,args):
+    p=build_tree(backend,args.width,args.depth)
+    return lambda:list(p.scan())
+
+def bench_delete_recursive(backend,args):
+    def delete():
+        p=build_tree(backend,args.width,args.depth)
+        # only time the delete
+        start=time.perf_counter()
+        p.delete(recurse=True)
+        return time.perf_counter()-start
+    delete.timed=True
+    return delete
+
+BENCHMARKS=[(name[6:],fn) for name,fn in sorted(globals().items()) if name.startswith('bench_')]
+
+
+
+# ----------------------------------------
+# Running
+# ----------------------------------------
+def run(name,fn,args):
+    """Returns (ops/sec, backend calls per op) for a benchmark."""
+    # count the backend calls of one operation, without latency
+    backend=LatencyBackend()
+    op=fn(backend,args)
+    with Instrumentation(backend) as stats:
+        op()
+    calls=stats.calls-(0 if not getattr(op,'timed',False) else _setup_calls(fn,args))
+
+    backend=LatencyBackend(args.latency)
+    op=fn(backend,args)
+    timed=getattr(op,'timed',False)
+    best=None
+    for repeat in range(args.repeat):
+        count,elapsed=0,0.0
+        while count==0 or elapsed<args.min_time:
+            if timed:
+                elapsed+=op()
+            else:
+                start=time.perf_counter()
+                op()
+                elapsed+=time.perf_counter()-start
+            count+=1
+        rate=count/elapsed
+        if best is None or rate>best: best=rate
+    return best,calls
+
+def _setup_calls(fn,args):
+    """The backend calls of a timed benchmark's untimed setup."""
+    backend=LatencyBackend()
+    with Instrumentation(backend) as stats:
+        build_tree(backend,args.width,args.depth)
+    return stats.calls
+
+
+def main(argv=None):
+    parser=argparse.ArgumentParser(description='Benchmarks winreglib against an in-memory backend.')
+    parser.add_argument('--width',type=int,default=10,help='subkeys per key of the trees walked and deleted')
+    parser.add_argument('--depth',type=int,default=3,help='levels of the trees walked and deleted')
+    parser.add_argument('--latency',type=float,default=0.0,help='seconds added to every backend call')
+    parser.add_argument('--repeat',type=int,default=3,help='runs of each benchmark, the best is reported')
+    parser.add_argument('--min-time',type=float,default=0.2,help='seconds each run lasts at least')
+    parser.add_argument('--filter',default='',help='only run benchmarks with this in their name')
+    parser.add_argument('--output',help='also write the results to this file')
+    args=parser.parse_args(argv)
+
+    lines=['{:<20} {:>14} {:>12}'.format('benchmark','ops/sec','calls/op')]
+    for name,fn in BENCHMARKS:
+        if args.filter not in name: continue
+        rate,calls=run(name,fn,args)
+        lines.append('{:<20} {:>14,.1f} {:>12}'.format(name,rate,calls))
+        print(lines[-1] if len(lines)>2 else '\n'.join(lines),flush=True)
+    if args.output:
+        with open(args.output,'w') as fout: fout.write('\n'.join(lines)+'\n')
+    return lines
+
+
+if __name__=='__main__':
+    main()
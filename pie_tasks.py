@@ -26,6 +26,12 @@ def test():
         cmd(r'python -m pytest -s tests')
 
 
+@task
+def benchmark():
+    with venv(r'venvs\test'):
+        cmd(r'python benchmarks\bench.py --output bench_output.txt')
+
+
 @task
 def register():
     cmd(r'python setup.py register')
@@ -0,0 +1,30 @@
+import importlib.util
+import os
+
+import pytest
+
+import winreglib
+from winreglib import Instrumentation, MemoryBackend, import_reg
+
+
+if importlib.util.find_spec('winreg') is None:
+    # these run against the live registry, which needs Windows and tests\data.reg imported
+    collect_ignore=['test_key_functions.py','test_path_manipulation.py','test_value_functions.py']
+
+
+@pytest.fixture
+def memory_backend():
+    """A `MemoryBackend` with tests\\data.reg imported, set as the default backend for the duration of the test."""
+    backend=MemoryBackend()
+    import_reg(os.path.join(os.path.dirname(__file__),'data.reg'),backend)
+    previous=winreglib.set_backend(backend)
+    yield backend
+    winreglib.set_backend(previous)
+
+@pytest.fixture
+def counting_backend():
+    """An empty `MemoryBackend` whose primitive calls are counted by the `Instrumentation` in its `calls` attribute."""
+    backend=MemoryBackend()
+    backend.calls=Instrumentation(backend)
+    with backend.calls:
+        yield backend
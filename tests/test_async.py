@@ -0,0 +1,84 @@
+import asyncio
+import concurrent.futures
+import threading
+
+import pytest
+
+import winreglib
+from winreglib import AsyncRegPath, RegPath
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_key_functions(memory_backend):
+    async def main():
+        p=AsyncRegPath(r'HKCU\Software\winreglib\test')
+        assert await p.exists()
+        assert [k.name async for k in p.subkeys()]==['subkey1','subkey2','subkey3']
+        assert [v.name async for v in p.subvalues()]==['','AnotherValue']
+        k=p/'newKey'
+        await k.create()
+        assert await k.exists()
+        await k.delete()
+        assert not await k.exists()
+    run(main())
+
+def test_value_functions(memory_backend):
+    async def main():
+        p=AsyncRegPath(r'HKCU\Software\winreglib\test')
+        assert await p.value('AnotherValue').get()==3
+        v=p.value('newValue')
+        assert not await v.exists()
+        await v.set('test')
+        assert await v.get()=='test'
+        assert v.type==winreglib.REG_SZ
+        assert (await p.read_all())['newValue']==('test',winreglib.REG_SZ)
+        await v.delete()
+        assert not await v.exists()
+    run(main())
+
+def test_walk_batches(memory_backend):
+    p=RegPath(r'HKCU\Software\winreglib\test')
+    for i in range(10): (p/'subkey2'/str(i)).create()
+    async def main():
+        return [str(path) async for path,names,values in AsyncRegPath(p,batch_size=3).walk()]
+    assert run(main())==[str(path) for path,names,values in p.walk()]
+
+def test_concurrent_reads(memory_backend):
+    executor=concurrent.futures.ThreadPoolExecutor(max_workers=4)
+    async def main():
+        p=AsyncRegPath(r'HKCU\Software\winreglib\test',executor=executor)
+        return await asyncio.gather(*[p.value('AnotherValue').get() for i in range(100)])
+    assert run(main())==[3]*100
+    executor.shutdown()
+
+def test_cancel_iteration_closes_generator(memory_backend):
+    closed=threading.Event()
+    p=RegPath(r'HKCU\Software\winreglib\test')
+    def subkeys():
+        try:
+            yield from p.subkeys()
+        finally:
+            closed.set()
+    async def main():
+        async def consume():
+            async for path in winreglib._iterate_in_executor(None,subkeys(),1):
+                await asyncio.sleep(10)
+        task=asyncio.ensure_future(consume())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    run(main())
+    assert closed.wait(1)
+
+def test_set_async_executor():
+    executor=concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    previous=winreglib.set_async_executor(executor)
+    try:
+        assert winreglib.get_async_executor() is executor
+    finally:
+        winreglib.set_async_executor(previous)
+        executor.shutdown()
@@ -0,0 +1,23 @@
+import pytest
+
+import winreglib
+from winreglib import RegPath, RegValue
+
+
+def test_get_values(memory_backend):
+    p=RegPath(r'HKCU\Software\winreglib\test')
+    p.value('expandValue').set(RegValue.ExpandingString('%TEMP%'))
+    values=p.get_values(['','anothervalue','expandValue','nonExistent'])
+    assert values['']==('this is default',winreglib.REG_SZ)
+    assert values['anothervalue']==(3,winreglib.REG_DWORD)
+    assert isinstance(values['expandValue'][0],RegValue.ExpandingString)
+    assert values['nonExistent']==(RegPath.UNSET_VALUE,None)
+
+def test_get_values_non_existent_key(memory_backend):
+    with pytest.raises(OSError):
+        RegPath(r'HKCU\Software\winreglib\test\nonExistent').get_values(['a'])
+
+def test_read_all(memory_backend):
+    p=RegPath(r'HKCU\Software\winreglib\test')
+    assert p.read_all()=={'':('this is default',winreglib.REG_SZ),'AnotherValue':(3,winreglib.REG_DWORD)}
+    assert (p/'subkey2').read_all()=={}
@@ -0,0 +1,26 @@
+import importlib.util
+import os
+
+
+def load_bench():
+    spec=importlib.util.spec_from_file_location('bench',os.path.join(os.path.dirname(os.path.dirname(__file__)),'benchmarks','bench.py'))
+    bench=importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(bench)
+    return bench
+
+
+def test_benchmarks_run(tmpdir):
+    bench=load_bench()
+    output=str(tmpdir.join('bench_output.txt'))
+    lines=bench.main(['--width','2','--depth','1','--repeat','1','--min-time','0','--output',output])
+    assert len(lines)==len(bench.BENCHMARKS)+1
+    assert open(output).read().splitlines()==lines
+
+def test_latency_backend():
+    bench=load_bench()
+    backend=bench.LatencyBackend(0.001)
+    p=bench.build_tree(backend,1,0)
+    start=bench.time.perf_counter()
+    p.value('value0').get()
+    # open, query and close
+    assert bench.time.perf_counter()-start>=0.003
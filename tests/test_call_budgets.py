@@ -0,0 +1,74 @@
+import pytest
+
+from winreglib import RegPath, RegTransaction, assert_backend_calls
+
+
+TEST=r'HKCU\Software\winreglib\test'
+
+
+def test_budget_exceeded(memory_backend):
+    with pytest.raises(AssertionError) as e:
+        with assert_backend_calls(max_open=1):
+            RegPath(TEST).exists()
+            RegPath(TEST).exists()
+    assert '2 open calls, more than the budget of 1' in str(e.value)
+    assert 'open_key, close_key, open_key, close_key' in str(e.value)
+
+def test_budget_log(memory_backend):
+    with assert_backend_calls(max_calls=3) as calls:
+        RegPath(TEST).value('').get()
+    assert calls.log==['open_key','query_value','close_key']
+
+
+def test_value_get(memory_backend):
+    with assert_backend_calls(max_open=1,max_query=1,max_calls=3):
+        RegPath(TEST).value('AnotherValue').get()
+
+def test_value_exists(memory_backend):
+    with assert_backend_calls(max_open=1,max_query=1,max_calls=3) as calls:
+        RegPath(TEST).value('AnotherValue').exists()
+    assert calls['query_value'].calls==0
+
+def test_value_set(memory_backend):
+    with assert_backend_calls(max_open=1,max_set=1,max_calls=3):
+        RegPath(TEST).value('new').set(1)
+
+def test_batch_reads(memory_backend):
+    with assert_backend_calls(max_open=1,max_close=1):
+        RegPath(TEST).get_values(['','AnotherValue','missing'])
+    with assert_backend_calls(max_open=1,max_close=1):
+        RegPath(TEST).read_all()
+
+def test_subkeys(memory_backend):
+    with assert_backend_calls(max_open=1,max_enum=3,max_query=1):
+        list(RegPath(TEST).subkeys())
+
+def test_walk_opens_each_key_once(memory_backend):
+    keys=len(list(RegPath(r'HKCU\Software').walk()))
+    with assert_backend_calls(max_open=keys) as calls:
+        list(RegPath(r'HKCU\Software').walk())
+    assert calls['close_key'].calls==keys
+
+def test_delete_opens_each_key_once(memory_backend):
+    p=RegPath(r'HKCU\Software\winreglib')
+    keys=len(list(p.walk()))
+    # and the parent of the key being deleted
+    with assert_backend_calls(max_open=keys+1,max_delete=keys,max_enum=keys-1):
+        p.delete(recurse=True)
+
+def test_transaction_opens_each_key_once(memory_backend):
+    with assert_backend_calls(max_open=2,max_set=20):
+        with RegTransaction() as tx:
+            for i in range(10):
+                tx.set(TEST,'a%d'%i,i)
+                tx.set(TEST+r'\subkey1','a%d'%i,i)
+
+def test_copy_opens_each_key_once(memory_backend):
+    keys=len(list(RegPath(TEST).walk()))
+    with assert_backend_calls(max_open=2*keys):
+        RegPath(TEST).copy_to(r'HKCU\Software\copy')
+
+def test_glob_opens_literals(memory_backend):
+    # the key globbed from and then straight to each literal
+    with assert_backend_calls(max_open=4,max_enum=0):
+        list(RegPath(r'HKCU\Software').glob(r'winreglib\test\subkey1'))
@@ -0,0 +1,56 @@
+import pytest
+
+from winreglib import MemoryBackend, RegPath
+
+
+TEST=r'HKCU\Software\winreglib\test'
+
+
+def tree(path):
+    return [(p.path[len(path.path):],sorted(names),sorted((v.name,v.value,v.type) for v in values)) for p,names,values in path.walk()]
+
+
+def test_copy_to(memory_backend):
+    src=RegPath(TEST)
+    (src/'subkey1'/'deep').value('v').set(b'\x01\x02')
+    dest=src.copy_to(r'HKLM\Software\copy')
+    assert dest==RegPath(r'HKLM\Software\copy')
+    assert tree(dest)==tree(src)
+    assert src.exists()
+
+def test_copy_to_non_recursive(memory_backend):
+    dest=RegPath(TEST).copy_to(r'HKCU\Software\copy',recursive=False)
+    assert dest.read_all()==RegPath(TEST).read_all()
+    assert list(dest.subkeys())==[]
+
+def test_copy_to_overwrites(memory_backend):
+    dest=RegPath(r'HKCU\Software\copy')
+    dest.value('AnotherValue').set('old')
+    dest.value('kept').set(1)
+    RegPath(TEST).copy_to(dest,recursive=False)
+    assert dest.value('AnotherValue').get()==3
+    assert dest.value('kept').get()==1
+
+def test_copy_to_other_backend(memory_backend):
+    other=MemoryBackend()
+    dest=RegPath(TEST).copy_to(RegPath(r'HKCU\Software\imported',backend=other))
+    assert dest.backend is other
+    assert tree(dest)==tree(RegPath(TEST))
+    assert not RegPath(r'HKCU\Software\imported').exists()
+
+def test_copy_into_itself(memory_backend):
+    with pytest.raises(ValueError):
+        RegPath(TEST).copy_to(TEST+r'\subkey1\copy')
+    # fine to another backend
+    RegPath(TEST).copy_to(RegPath(TEST+r'\subkey1\copy',backend=MemoryBackend()))
+
+def test_move_to(memory_backend):
+    before=tree(RegPath(TEST))
+    dest=RegPath(TEST).move_to(r'HKCU\Software\moved')
+    assert not RegPath(TEST).exists()
+    assert tree(dest)==before
+
+def test_rename(memory_backend):
+    renamed=RegPath(TEST+r'\subkey1').rename('renamed')
+    assert renamed==RegPath(TEST+r'\renamed')
+    assert [k.name for k in RegPath(TEST).subkeys()]==['renamed','subkey2','subkey3']
@@ -0,0 +1,44 @@
+import pytest
+
+from winreglib import HandlePool, RegPath, RegTransaction
+
+
+@pytest.fixture
+def backend(counting_backend):
+    backend=counting_backend
+    with RegTransaction(backend) as tx:
+        for i in range(20):
+            for j in range(5):
+                tx.set(r'HKCU\Software\tree\k%d\k%d\leaf'%(i,j),'v',i*j)
+    return backend
+
+
+def test_delete_recursive(backend):
+    p=RegPath(r'HKCU\Software\tree',backend=backend)
+    backend.calls.reset()
+    p.delete(recurse=True)
+    # the parent, the key and then each key below it once
+    assert backend.calls['open_key'].calls==2+20+20*5+20*5
+    assert not p.exists()
+    assert RegPath(r'HKCU\Software',backend=backend).exists()
+
+def test_delete_recursive_workers(backend):
+    p=RegPath(r'HKCU\Software\tree',backend=backend)
+    p.delete(recurse=True,workers=4)
+    assert not p.exists()
+    assert list(RegPath(r'HKCU\Software',backend=backend).subkeys())==[]
+
+def test_delete_non_recursive_with_subkeys(backend):
+    with pytest.raises(PermissionError):
+        RegPath(r'HKCU\Software\tree',backend=backend).delete()
+
+def test_delete_non_existent(backend):
+    RegPath(r'HKCU\Software\nonExistent',backend=backend).delete(recurse=True)
+    RegPath(r'HKCU\nonExistent\deeper',backend=backend).delete(recurse=True)
+
+def test_delete_invalidates_pool(backend):
+    backend.handle_pool=HandlePool(backend)
+    p=RegPath(r'HKCU\Software\tree\k1\k1\leaf',backend=backend)
+    assert p.value('v').get()==1
+    RegPath(r'HKCU\Software\tree',backend=backend).delete(recurse=True)
+    assert not p.exists()
@@ -0,0 +1,57 @@
+import pytest
+
+from winreglib import RegPath, RegTransaction
+
+
+@pytest.fixture
+def software(counting_backend):
+    backend=counting_backend
+    with RegTransaction(backend) as tx:
+        for vendor in ('Alpha','Beta','Gamma'):
+            for app in ('Uninstall','Other'):
+                tx.create(r'HKLM\Software\{}\Microsoft\Windows\CurrentVersion\{}\{}App'.format(vendor,app,vendor))
+        tx.create(r'HKLM\Software\Beta\Microsoft\Windows\CurrentVersion\Uninstall\BetaTool')
+    backend.calls.reset()
+    return RegPath(r'HKLM\Software',backend=backend)
+
+
+def names(paths):
+    return sorted(p.path for p in paths)
+
+
+def test_glob_wildcards(software):
+    assert names(software.glob(r'*\Microsoft\Windows\CurrentVersion\Uninstall\*'))==[
+        r'Software\Alpha\Microsoft\Windows\CurrentVersion\Uninstall\AlphaApp',
+        r'Software\Beta\Microsoft\Windows\CurrentVersion\Uninstall\BetaApp',
+        r'Software\Beta\Microsoft\Windows\CurrentVersion\Uninstall\BetaTool',
+        r'Software\Gamma\Microsoft\Windows\CurrentVersion\Uninstall\GammaApp',
+    ]
+    # only the two wildcard levels were listed: Software, then each vendor's Uninstall key
+    assert software.backend.calls['enum_key'].calls==3+(1+2+1)
+
+def test_glob_ignores_case(software):
+    assert names(software.glob(r'b*\MICROSOFT\windows\currentversion\uninstall\*tool'))==[
+        r'Software\Beta\MICROSOFT\windows\currentversion\uninstall\BetaTool']
+    assert names(software.glob(r'[ab]???'))==[r'Software\Beta']
+
+def test_glob_literal_missing(software):
+    assert list(software.glob(r'*\Nope\*'))==[]
+    assert list(RegPath(r'HKLM\Nope',backend=software.backend).glob('*'))==[]
+
+def test_glob_recursive(software):
+    assert names(software.glob(r'**\*Tool'))==[r'Software\Beta\Microsoft\Windows\CurrentVersion\Uninstall\BetaTool']
+    assert names(software.rglob('?etaApp'))==[r'Software\Beta\Microsoft\Windows\CurrentVersion\Other\BetaApp',
+        r'Software\Beta\Microsoft\Windows\CurrentVersion\Uninstall\BetaApp']
+    everything=list(software.glob('**'))
+    assert everything[0]==software
+    assert len(everything)==len(list(software.walk()))
+
+def test_glob_no_duplicates(software):
+    matches=list(software.glob(r'**\Microsoft\**\*App'))
+    assert len(matches)==len(set(matches))==6
+
+def test_glob_invalid(software):
+    with pytest.raises(ValueError):
+        list(software.glob(''))
+    with pytest.raises(ValueError):
+        list(software.glob(r'a**\b'))
@@ -0,0 +1,90 @@
+import threading
+
+import pytest
+
+from winreglib import HandlePool, RegPath
+
+
+def opens(backend):
+    return backend.calls['open_key'].calls+backend.calls['create_key'].calls
+
+def closes(backend):
+    return backend.calls['close_key'].calls
+
+
+@pytest.fixture
+def backend(counting_backend):
+    backend=counting_backend
+    p=RegPath(r'HKCU\Software\winreglib\test',backend=backend)
+    p.value('AnotherValue').set(3)
+    (p/'subkey1').create()
+    backend.calls.reset()
+    backend.handle_pool=HandlePool(backend,max_size=2)
+    return backend
+
+
+def test_reuses_handles(backend):
+    p=RegPath(r'HKCU\Software\winreglib\test',backend=backend)
+    for i in range(10):
+        assert p.value('AnotherValue').get()==3
+        assert p.exists()
+    assert opens(backend)==1
+    assert closes(backend)==0
+    assert backend.handle_pool.hits==19
+
+def test_keyed_by_access(backend):
+    p=RegPath(r'HKCU\Software\winreglib\test',backend=backend)
+    p.value('AnotherValue').get()
+    p.value('AnotherValue').set(4)
+    p.value('AnotherValue').set(5)
+    assert opens(backend)==2
+    assert RegPath(r'HKCU\SOFTWARE\winreglib\TEST',backend=backend).value('AnotherValue').get()==5
+    assert opens(backend)==2
+
+def test_lru_eviction(backend):
+    p=RegPath(r'HKCU\Software\winreglib\test',backend=backend)
+    for k in (p,p/'subkey1',p.parent):
+        k.exists()
+    assert len(backend.handle_pool)==2
+    assert closes(backend)==1
+    p.parent.exists()
+    assert opens(backend)==3
+    p.exists()
+    assert opens(backend)==4
+
+def test_in_use_handles_not_closed(backend):
+    pool=backend.handle_pool
+    handles=[pool.acquire(0x80000001,path) for path in (r'Software',r'Software\winreglib',r'Software\winreglib\test')]
+    assert closes(backend)==0
+    pool.close_all()
+    assert len(pool)==0
+    assert closes(backend)==0
+    for handle in handles:
+        assert pool.release(handle)
+    assert closes(backend)==3
+    assert not pool.release(handles[0])
+
+def test_delete_invalidates(backend):
+    p=RegPath(r'HKCU\Software\winreglib\test',backend=backend)/'newKey'
+    p.value('newValue').set('test')
+    assert p.value('newValue').exists()
+    p.delete()
+    assert not p.exists()
+    p.value('newValue').set('again')
+    assert p.value('newValue').get()=='again'
+
+def test_threads(backend):
+    p=RegPath(r'HKCU\Software\winreglib\test',backend=backend)
+    errors=[]
+    def read():
+        try:
+            for i in range(200):
+                assert p.value('AnotherValue').get()==3
+                assert (p/'subkey1').exists()
+        except Exception as e:
+            errors.append(e)
+    threads=[threading.Thread(target=read) for i in range(8)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert not errors
+    assert not backend.handle_pool._leased
@@ -0,0 +1,216 @@
+import struct
+
+import pytest
+
+from winreglib import HiveBackend, RegPath
+
+
+# ----------------------------------------
+# a minimal regf writer to make test hives
+# ----------------------------------------
+class HiveWriter(object):
+    def __init__(self):
+        # the first hbin's header, cells start after it
+        self.bins=bytearray(b'hbin'+bytes(28))
+
+    def cell(self,data):
+        offset=len(self.bins)
+        size=(len(data)+4+7)//8*8
+        self.bins+=struct.pack('<i',-size)+data+bytes(size-4-len(data))
+        return offset
+
+    def value(self,name,type,data):
+        name=name.encode('latin-1')
+        if len(data)<=4:
+            size,data_offset=len(data)|0x80000000,int.from_bytes(data.ljust(4,b'\0'),'little')
+        elif len(data)>16344:
+            segments=[self.cell(data[i:i+16344]) for i in range(0,len(data),16344)]
+            segment_list=self.cell(struct.pack('<{}I'.format(len(segments)),*segments))
+            size,data_offset=len(data),self.cell(b'db'+struct.pack('<HI',len(segments),segment_list))
+        else:
+            size,data_offset=len(data),self.cell(data)
+        return self.cell(struct.pack('<2sHIIIH2x',b'vk',len(name),size,data_offset,type,1)+name)
+
+    def key(self,name,values=(),subkeys=(),list_type=b'lh'):
+        # hives keep subkeys sorted by upper cased name
+        subkeys=sorted(subkeys,key=lambda subkey:subkey[0].upper())
+        subkey_offsets=[self.key(*subkey) for subkey in subkeys]
+        subkey_list=0
+        if subkey_offsets and list_type==b'ri':
+            # split the subkeys over two li lists
+            half=len(subkey_offsets)//2
+            lists=[self.cell(b'li'+struct.pack('<H{}I'.format(len(part)),len(part),*part)) for part in (subkey_offsets[:half],subkey_offsets[half:])]
+            subkey_list=self.cell(b'ri'+struct.pack('<H2I',2,*lists))
+        elif subkey_offsets and list_type==b'li':
+            subkey_list=self.cell(b'li'+struct.pack('<H{}I'.format(len(subkey_offsets)),len(subkey_offsets),*subkey_offsets))
+        elif subkey_offsets:
+            subkey_list=self.cell(list_type+struct.pack('<H',len(subkey_offsets))+b''.join(struct.pack('<II',o,0) for o in subkey_offsets))
+        value_offsets=[self.value(*value) for value in values]
+        value_list=self.cell(struct.pack('<{}I'.format(len(value_offsets)),*value_offsets)) if value_offsets else 0
+        encoded=name.encode('utf-16-le') if not name.isascii() else name.encode('latin-1')
+        max_subkey_name=max((len(subkey[0]) for subkey in subkeys),default=0)*2
+        max_value_name=max((len(value[0]) for value in values),default=0)*2
+        max_value_data=max((len(value[2]) for value in values),default=0)
+        nk=struct.pack('<2sHQ4x4xI4xI4xII4x4xI4xII4xHH',b'nk',0x20 if name.isascii() else 0,132000000000000000,
+            len(subkey_offsets),subkey_list,len(value_offsets),value_list,max_subkey_name,max_value_name,max_value_data,len(encoded),0)
+        return self.cell(nk+encoded)
+
+    def write(self,filename,root):
+        root_offset=self.key(*root)
+        self.bins+=bytes(-len(self.bins)%4096)
+        self.bins[8:12]=struct.pack('<I',len(self.bins))
+        base=bytearray(4096)
+        base[0:4]=b'regf'
+        base[0x14:0x1C]=struct.pack('<II',1,5)
+        base[0x24:0x2C]=struct.pack('<II',root_offset,len(self.bins))
+        with open(filename,'wb') as fout:
+            fout.write(base+self.bins)
+
+
+def sz(s):
+    return (s+'\0').encode('utf-16-le')
+
+
+@pytest.fixture
+def hive(tmpdir):
+    filename=str(tmpdir.join('SOFTWARE'))
+    HiveWriter().write(filename,('ROOT',(),[
+        ('winreglib',(),[
+            ('test',[('',1,sz('this is default')),('AnotherValue',4,struct.pack('<I',3)),('big',3,bytes(range(256))*100),('multi',7,sz('a')+sz('b')+b'\0\0')],[
+                ('subkey1',[('',1,sz('with stuff'))]),
+                ('subkey2',),
+                ('subkey3',),
+            ],b'li'),
+            ('many',(),[('k{:02}'.format(i),) for i in range(10)],b'ri'),
+            ('ünicode',[('q',11,struct.pack('<Q',2**40))]),
+        ]),
+    ]))
+    backend=HiveBackend(filename,r'HKLM\Software')
+    yield backend
+    backend.close()
+
+
+def test_open(hive):
+    p=RegPath(r'HKLM\Software\winreglib\test',backend=hive)
+    assert p.exists()
+    assert (p/'SUBKEY1').exists()
+    assert not (p/'nonExistent').exists()
+    assert not RegPath(r'HKCU\Software\winreglib',backend=hive).exists()
+    assert not RegPath(r'HKLM\System',backend=hive).exists()
+
+def test_enumerate(hive):
+    p=RegPath(r'HKLM\Software\winreglib',backend=hive)
+    assert [k.name for k in p.subkeys()]==['many','test','ünicode']
+    assert [k.name for k in (p/'many').subkeys()]==['k{:02}'.format(i) for i in range(10)]
+    assert [v.name for v in (p/'test').subvalues()]==['','AnotherValue','big','multi']
+    assert [k.name for k in RegPath('HKLM',backend=hive).subkeys()]==['Software']
+
+def test_values(hive):
+    p=RegPath(r'HKLM\Software\winreglib\test',backend=hive)
+    assert p.value('').get()=='this is default'
+    assert p.value('anothervalue').get()==3
+    assert p.value('big').get()==bytes(range(256))*100
+    assert p.value('multi').get()==['a','b']
+    assert (p/'subkey1').value('').get()=='with stuff'
+    assert (p.parent/'ünicode').value('q').get()==2**40
+    assert not p.value('nonExistent').exists()
+
+def test_info(hive):
+    p=RegPath(r'HKLM\Software\winreglib\test',backend=hive)
+    assert (p.subkey_count(),p.value_count())==(3,4)
+    assert p.info().max_value_name_length==len('AnotherValue')
+    assert p.info().max_value_data_length==25600
+    assert p.last_write_time()==132000000000000000
+
+def test_value_info(hive):
+    p=RegPath(r'HKLM\Software\winreglib\test',backend=hive)
+    assert [(v.name,v.type,v.size) for v in p.subvalues(data=False)]==[('',1,32),('AnotherValue',4,4),('big',3,25600),('multi',7,10)]
+    assert p.value('BIG').stat().size==25600
+    assert not p.value('nonExistent').exists()
+
+def test_walk(hive):
+    walked=[path.path for path,names,values in RegPath('HKLM',backend=hive).walk()]
+    assert walked[:4]==['','Software',r'Software\winreglib',r'Software\winreglib\many']
+    assert len(walked)==19
+
+def test_read_only(hive):
+    p=RegPath(r'HKLM\Software\winreglib\test',backend=hive)
+    with pytest.raises(PermissionError):
+        p.value('new').set(1)
+    with pytest.raises(PermissionError):
+        (p/'subkey2').delete()
+    with pytest.raises(PermissionError):
+        p.value('AnotherValue').delete()
+
+def test_not_a_hive(tmpdir):
+    filename=str(tmpdir.join('bad'))
+    with open(filename,'wb') as fout: fout.write(bytes(8192))
+    with pytest.raises(ValueError):
+        HiveBackend(filename,r'HKLM\Software')
+
+def test_hand_built_hive(tmpdir):
+    # laid out by hand rather than with HiveWriter, so the reader's offsets are checked against the format itself
+    data=bytearray(0x2000)
+    def put(offset,fmt,*values):
+        struct.pack_into(fmt,data,offset,*values)
+    # base block: signature, major and minor version, root cell offset and hive bins size
+    put(0x0000,'<4s',b'regf')
+    put(0x0014,'<II',1,5)
+    put(0x0024,'<II',0x20,0x1000)
+    # hbin header, cell offsets are relative to it
+    put(0x1000,'<4sII',b'hbin',0,0x1000)
+    # root nk cell at 0x20: size, signature, flags (compressed name), last write, subkey count and list, value count
+    # and list, max subkey name/value name/value data lengths, name length and name
+    cell=0x1020
+    put(cell,'<i',-0x58)
+    put(cell+0x04,'<2sH',b'nk',0x20)
+    put(cell+0x08,'<Q',131000000000000000)
+    put(cell+0x04+0x14,'<I',1)
+    put(cell+0x04+0x1C,'<I',0xD0)
+    put(cell+0x04+0x24,'<II',1,0x100)
+    put(cell+0x04+0x34,'<I',6)
+    put(cell+0x04+0x3C,'<II',6,4)
+    put(cell+0x04+0x48,'<H',4)
+    put(cell+0x04+0x4C,'<4s',b'ROOT')
+    # subkey nk cell at 0x78
+    cell=0x1078
+    put(cell,'<i',-0x58)
+    put(cell+0x04,'<2sH',b'nk',0x20)
+    put(cell+0x04+0x48,'<H',3)
+    put(cell+0x04+0x4C,'<3s',b'Sub')
+    # lf subkey list at 0xD0: count, then (offset, name hint) pairs
+    put(0x10D0,'<i2sHI4s',-0x10,b'lf',1,0x78,b'Sub\0')
+    # vk cell at 0xE0: name length, data size (the high bit for data held in the offset field), data, type, flags
+    # (compressed name), name
+    put(0x10E0,'<i2sHIIIH2x3s',-0x20,b'vk',3,0x80000004,42,4,1,b'Val')
+    # value list at 0x100
+    put(0x1100,'<iI',-0x8,0xE0)
+    filename=str(tmpdir.join('HAND'))
+    with open(filename,'wb') as fout: fout.write(data)
+
+    with HiveBackend(filename,r'HKLM\Software') as backend:
+        p=RegPath(r'HKLM\Software',backend=backend)
+        assert [k.name for k in p.subkeys()]==['Sub']
+        assert (p/'SUB').exists()
+        assert p.read_all()=={'Val':(42,4)}
+        assert p.info()==(1,1,131000000000000000,3,3,4)
+
+
+def test_wide_keys(tmpdir):
+    filename=str(tmpdir.join('WIDE'))
+    names=['k{:05}'.format(i) for i in range(3000)]+['Zeta','alpha','\u00e9t\u00e9']
+    HiveWriter().write(filename,('ROOT',(),[(name,) for name in names]))
+    with HiveBackend(filename,r'HKLM\Software') as backend:
+        decoded=[]
+        nk_name=backend._nk_name
+        backend._nk_name=lambda offset:decoded.append(offset) or nk_name(offset)
+        p=RegPath(r'HKLM\Software',backend=backend)
+        assert (p/'K01234').exists()
+        assert (p/'ALPHA').exists()
+        assert (p/'zeta').exists()
+        assert (p/'\u00c9T\u00c9').exists()
+        assert not (p/'k99999').exists()
+        # a binary search of the list, with names decoded once per key rather than once per lookup
+        assert len(decoded)<100
+        assert len(list(p.walk()))==len(names)+1
+        assert len(decoded)==len(set(decoded))==len(names)
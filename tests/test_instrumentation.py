@@ -0,0 +1,74 @@
+import io
+
+from winreglib import Instrumentation, MemoryBackend, RegPath, TraceRecorder, read_trace
+
+
+TEST=r'HKCU\Software\winreglib\test'
+
+
+def test_counts(memory_backend):
+    with Instrumentation() as stats:
+        list(RegPath(TEST).subkeys())
+    assert stats.counts()=={'open_key':1,'query_info_key':1,'enum_key':3,'close_key':1}
+    assert stats.calls==6
+    assert stats['enum_key'].total_time>0
+    assert sum(stats['enum_key'].histogram)==3
+
+def test_bytes_and_errors(memory_backend):
+    with Instrumentation() as stats:
+        RegPath(TEST).value('data').set(b'12345')
+        assert RegPath(TEST).value('data').get()==b'12345'
+        assert not RegPath(TEST+r'\nonExistent').value('x').exists()
+    assert stats['set_value'].bytes==5
+    assert stats['query_value'].bytes==5
+    assert stats['open_key'].errors==1
+
+def test_disable_restores(memory_backend):
+    stats=Instrumentation(memory_backend)
+    stats.enable()
+    assert stats.enabled
+    assert 'open_key' in memory_backend.__dict__
+    stats.disable()
+    assert memory_backend.__dict__.keys().isdisjoint(Instrumentation.PRIMITIVES)
+    RegPath(TEST).exists()
+    assert stats.calls==0
+    # only that backend is instrumented
+    with stats:
+        RegPath(TEST,backend=MemoryBackend()).exists()
+    assert stats.calls==0
+
+def test_nested(memory_backend):
+    with Instrumentation() as outer:
+        with Instrumentation() as inner:
+            RegPath(TEST).exists()
+        RegPath(TEST).exists()
+    assert inner['open_key'].calls==1
+    assert outer['open_key'].calls==2
+    assert memory_backend.__dict__.keys().isdisjoint(Instrumentation.PRIMITIVES)
+
+def test_hooks(memory_backend):
+    calls=[]
+    stats=Instrumentation(hooks=[lambda *args:calls.append(args)])
+    with stats:
+        RegPath(TEST).value('AnotherValue').get()
+    assert [(name,size,error) for name,elapsed,size,error in calls]==[('open_key',0,None),('query_value',4,None),('close_key',0,None)]
+    stats.reset()
+    assert stats.calls==0
+
+def test_out_of_order(memory_backend):
+    trace=io.BytesIO()
+    stats=Instrumentation()
+    recorder=TraceRecorder(trace)
+    stats.enable()
+    recorder.start()
+    stats.disable()
+    RegPath(TEST).exists()
+    assert stats.calls==0
+    stats.enable()
+    recorder.stop()
+    RegPath(TEST).exists()
+    assert stats['open_key'].calls==1
+    stats.disable()
+    assert memory_backend.__dict__.keys().isdisjoint(Instrumentation.PRIMITIVES)
+    trace.seek(0)
+    assert [r.op for r in read_trace(trace)]==['start','open_key','close_key']
@@ -0,0 +1,44 @@
+import pytest
+
+import winreglib
+from winreglib import RegPath
+
+
+def test_counts(memory_backend):
+    p=RegPath(r'HKCU\Software\winreglib\test')
+    assert p.subkey_count()==3
+    assert p.value_count()==2
+    assert len(p)==5
+    assert len(p/'subkey2')==0
+    assert p/'subkey2'
+
+def test_info(memory_backend):
+    p=RegPath(r'HKCU\Software\winreglib\test')
+    info=p.info()
+    assert info.max_subkey_name_length==7
+    assert info.max_value_name_length==len('AnotherValue')
+    assert info.max_value_data_length==(len('this is default')+1)*2
+
+def test_last_write_time(memory_backend):
+    p=RegPath(r'HKCU\Software\winreglib\test')
+    before=p.last_write_time()
+    (p/'subkey1').value('newValue').set(1)
+    assert p.last_write_time()==before
+    p.value('newValue').set(1)
+    assert p.last_write_time()>=before
+    assert p.value_count()==3
+
+def test_non_existent(memory_backend):
+    with pytest.raises(OSError):
+        RegPath(r'HKCU\Software\winreglib\nonExistent').subkey_count()
+
+def test_enumeration_doesnt_run_past_count(memory_backend):
+    calls=[]
+    class Backend(winreglib.MemoryBackend):
+        def enum_key(self,handle,index):
+            calls.append(index)
+            return super().enum_key(handle,index)
+    p=RegPath(r'HKCU\Software\test',backend=Backend())
+    for name in 'abc': (p/name).create()
+    assert [k.name for k in p.subkeys()]==['a','b','c']
+    assert calls==[0,1,2]
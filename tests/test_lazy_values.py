@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+import winreglib
+from winreglib import AsyncRegPath, RegPath, ValueInfo
+
+
+TEST=r'HKCU\Software\winreglib\test'
+
+
+def data_reads(backend):
+    return backend.calls['enum_value'].calls+backend.calls['query_value'].calls
+
+
+@pytest.fixture
+def backend(counting_backend):
+    backend=counting_backend
+    p=RegPath(TEST,backend=backend)
+    p.value('blob').set(bytes(1000))
+    p.value('text').set('abc')
+    p.value('multi').set(['a','bc'])
+    (p/'sub').value('n').set(5)
+    backend.calls.reset()
+    return backend
+
+
+def test_subvalues_without_data(backend):
+    values=list(RegPath(TEST,backend=backend).subvalues(data=False))
+    assert [(v.name,v.type,v.size) for v in values]==[('blob',winreglib.REG_BINARY,1000),('text',winreglib.REG_SZ,8),('multi',winreglib.REG_MULTI_SZ,12)]
+    assert data_reads(backend)==0
+    # data is read when it's first used
+    assert values[1].value=='abc'
+    assert values[1].value=='abc'
+    assert data_reads(backend)==1
+
+def test_walk_without_data(backend):
+    entries=list(RegPath(TEST,backend=backend).walk(data=False))
+    assert [v.name for path,names,values in entries for v in values]==['blob','text','multi','n']
+    assert data_reads(backend)==0
+    assert entries[1][2][0].value==5
+
+def test_search_names_without_data(backend):
+    assert [v.name for v in RegPath(TEST,backend=backend).search('^b',in_data=False)]==['blob']
+    assert data_reads(backend)==0
+
+def test_stat(backend):
+    value=RegPath(TEST,backend=backend).value('blob')
+    assert value.stat()==ValueInfo('blob',winreglib.REG_BINARY,1000)
+    assert value.stat().size==value.size==1000
+    assert value.exists()
+    assert data_reads(backend)==0
+    with pytest.raises(FileNotFoundError):
+        RegPath(TEST,backend=backend).value('missing').stat()
+    assert not RegPath(TEST,backend=backend).value('missing').exists()
+
+def test_base_backend_info(memory_backend):
+    # MemoryBackend computes sizes from the stored data
+    value=RegPath(TEST).value('')
+    assert value.stat()==ValueInfo('',winreglib.REG_SZ,len('this is default')*2+2)
+
+def test_async_subvalues_without_data(backend):
+    async def main():
+        p=AsyncRegPath(TEST,backend=backend)
+        values=[v async for v in p.subvalues(data=False)]
+        info=await values[0].stat()
+        return [v.size for v in values],info
+
+    sizes,info=asyncio.run(main())
+    assert sizes==[1000,8,12]
+    assert info.size==1000
+    assert data_reads(backend)==0
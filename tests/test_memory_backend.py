@@ -0,0 +1,114 @@
+import pytest
+
+import winreglib
+from winreglib import MemoryBackend, RegPath, RegValue
+
+
+# keys
+def test_exists(memory_backend):
+    p=RegPath(r'HKCU\Software\winreglib\test')
+    assert p.exists()
+    assert p.value('AnotherValue').exists()
+    assert not (p/'AnotherValue').exists()
+    assert (p/'subkey1').exists()
+    assert not (p/'DoesNotExist').exists()
+
+def test_enumerate_key(memory_backend):
+    p=RegPath(r'HKCU\Software\winreglib\test')
+    (p/'Subkey0').create()
+    assert [k.name for k in p.subkeys()]==['Subkey0','subkey1','subkey2','subkey3']
+
+def test_enumerate_key_values(memory_backend):
+    p=RegPath(r'HKCU\Software\winreglib\test')
+    p.value('zValue').set(1)
+    p.value('aValue').set(2)
+    assert [v.name for v in p.subvalues()]==['','AnotherValue','zValue','aValue']
+
+def test_case_insensitive_key(memory_backend):
+    p=RegPath(r'HKCU\Software\winreglib\test')/'newKey'
+    p.create()
+    assert (p.parent/'NEWKEY').exists()
+    assert [k.name for k in p.parent.subkeys()].count('newKey')==1
+
+def test_delete_key_recurse(memory_backend):
+    p=RegPath(r'HKCU\Software\winreglib\test')/'newKey'/'twoDeep'
+    p.create()
+    with pytest.raises(OSError):
+        p.parent.delete()
+    p.parent.delete(recurse=True)
+    assert not p.parent.exists()
+
+def test_deleted_key_handle(memory_backend):
+    p=RegPath(r'HKCU\Software\winreglib\test')/'newKey'
+    p.create()
+    handle=memory_backend.open_key(p.hkey_constant,p.path)
+    p.delete()
+    with pytest.raises(OSError) as e:
+        memory_backend.enum_key(handle,0)
+    assert e.value.winerror==winreglib.ERROR_KEY_DELETED
+
+
+# values
+def test_value_types(memory_backend):
+    p=RegPath(r'HKCU\Software\winreglib\test')
+    v=p.value('expandValue')
+    v.set(RegValue.ExpandingString('%TEMP%'))
+    v=p.value('EXPANDVALUE')
+    assert v.get()=='%TEMP%'
+    assert v.type==winreglib.REG_EXPAND_SZ
+    assert isinstance(v.value,RegValue.ExpandingString)
+    v.set(b'\x00\x01')
+    assert p.value('expandValue').get()==b'\x00\x01'
+    assert [v.name for v in p.subvalues()][-1]=='expandValue'
+
+@pytest.mark.parametrize('type,value,error',[
+    (winreglib.REG_DWORD,-1,OverflowError),
+    (winreglib.REG_DWORD,2**32,OverflowError),
+    (winreglib.REG_QWORD,2**64,OverflowError),
+    (winreglib.REG_DWORD,'1',TypeError),
+    (winreglib.REG_QWORD,1.5,TypeError),
+    (winreglib.REG_SZ,1,TypeError),
+    (winreglib.REG_EXPAND_SZ,b'x',TypeError),
+    (winreglib.REG_MULTI_SZ,'ab',TypeError),
+    (winreglib.REG_MULTI_SZ,['a',1],TypeError),
+    (winreglib.REG_BINARY,'x',TypeError),
+    (winreglib.REG_NONE,1,TypeError),
+])
+def test_set_value_checks(memory_backend,type,value,error):
+    handle=memory_backend.open_key(winreglib.HKEY_CURRENT_USER,r'Software\winreglib\test')
+    with pytest.raises(error):
+        memory_backend.set_value(handle,'checked',type,value)
+    with pytest.raises(FileNotFoundError):
+        memory_backend.query_value(handle,'checked')
+
+def test_set_value_none(memory_backend):
+    handle=memory_backend.open_key(winreglib.HKEY_CURRENT_USER,r'Software\winreglib\test')
+    for type,expected in ((winreglib.REG_DWORD,0),(winreglib.REG_QWORD,0),(winreglib.REG_SZ,''),(winreglib.REG_MULTI_SZ,[]),(winreglib.REG_BINARY,None)):
+        memory_backend.set_value(handle,'none',type,None)
+        assert memory_backend.query_value(handle,'none')==(expected,type)
+    memory_backend.set_value(handle,'max',winreglib.REG_QWORD,2**64-1)
+    assert memory_backend.query_value(handle,'max')==(2**64-1,winreglib.REG_QWORD)
+
+def test_get_value_non_existent(memory_backend):
+    v=RegPath(r'HKCU\Software\winreglib\test\nonExistent').value('nonExistent')
+    assert not v.exists()
+    with pytest.raises(FileNotFoundError):
+        v.get()
+    v.delete()
+
+def test_last_write_time(memory_backend):
+    p=RegPath(r'HKCU\Software\winreglib\test')
+    node=memory_backend.open_key(p.hkey_constant,p.path)
+    before=node.last_write
+    p.value('newValue').set('test')
+    assert node.last_write>=before
+
+
+# backend selection
+def test_explicit_backend(memory_backend):
+    other=MemoryBackend()
+    p=RegPath(r'HKCU\Software\other',backend=other)
+    (p/'child').create()
+    assert (p/'child').exists()
+    assert (p/'child').parent.backend is other
+    assert not RegPath(r'HKCU\Software\other').exists()
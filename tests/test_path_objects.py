@@ -0,0 +1,75 @@
+import pickle
+import tracemalloc
+import uuid
+
+import pytest
+
+from winreglib import RegPath
+
+
+def test_immutable():
+    p=RegPath(r'HKCU\Software\winreglib')
+    with pytest.raises(AttributeError):
+        p.path='Software'
+    with pytest.raises(AttributeError):
+        p.other=1
+    with pytest.raises(AttributeError):
+        del p.hkey_constant
+
+def test_equality_and_hashing():
+    p=RegPath(r'HKCU\Software\winreglib')
+    assert p==RegPath(r'HKCU\SOFTWARE\WinRegLib')
+    assert p==RegPath(r'HKCU\Software')/'winreglib'
+    assert p!=RegPath(r'HKLM\Software\winreglib')
+    assert p!=RegPath(r'HKCU\Software')
+    assert len({p,RegPath(r'HKEY_CURRENT_USER\software\winreglib'),RegPath(r'HKCU\Software')})==2
+    assert {p:1}[RegPath(r'HKCU\software\WINREGLIB')]==1
+
+def test_derived_properties():
+    p=RegPath(r'HKCU\Software\winreglib\test')
+    assert p.name=='test'
+    assert p.parts==('Software','winreglib','test')
+    assert p.parent==RegPath(r'HKCU\Software\winreglib')
+    assert p.parent is p.parent
+    assert (p/'a'/'b').parts==('Software','winreglib','test','a','b')
+    assert (p/r'a\b').name=='b'
+    assert (p/r'a\b').path==r'Software\winreglib\test\a\b'
+
+class BaselinePath(object):
+    """How paths were held before RegPath had slots: an object with a __dict__ of the HKEY and path."""
+    def __init__(self,hkey_constant,path):
+        self.hkey_constant=hkey_constant
+        self.path=path
+
+def memory_per_path(make,count=20000):
+    tracemalloc.start()
+    try:
+        before=tracemalloc.get_traced_memory()[0]
+        paths=[make(i) for i in range(count)]
+        return (tracemalloc.get_traced_memory()[0]-before)/len(paths)
+    finally:
+        tracemalloc.stop()
+
+def test_memory():
+    base=RegPath(r'HKLM\Software\Microsoft\Windows\CurrentVersion\Uninstall')
+    guids=[str(uuid.UUID(int=i)) for i in range(20000)]
+    used=memory_per_path(lambda i:base/guids[i]/'sub')
+    baseline=memory_per_path(lambda i:BaselinePath(base.hkey_constant,base.path+'\\'+guids[i]+'\\sub'))
+    # paths don't keep the keys above them alive or copies of their names
+    assert used<baseline
+
+def test_root():
+    p=RegPath('HKCU')
+    assert p.path==''
+    assert p.name==''
+    assert p.parts==()
+    assert p.parent is p
+    assert (p/'Software').path=='Software'
+    assert (p/'Software').parent==p
+    assert RegPath('HKCU\\Software').parent==p
+    assert RegPath('HKCU\\Software\\').path=='Software'
+
+def test_repr_and_pickle():
+    p=RegPath(r'HKCU\Software\winreglib')
+    assert repr(p)==r"RegPath('HKCU\\Software\\winreglib')"
+    assert pickle.loads(pickle.dumps(p))==p
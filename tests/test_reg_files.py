@@ -0,0 +1,168 @@
+import io
+import os
+
+import pytest
+
+import winreglib
+from winreglib import MemoryBackend, RegOperation, RegPath, apply_reg, import_reg, parse_reg
+
+
+DATA_REG=os.path.join(os.path.dirname(__file__),'data.reg')
+
+
+def reg(text,encoding='utf-16'):
+    return io.BytesIO(text.encode(encoding))
+
+
+def test_parse_data_reg():
+    ops=list(parse_reg(DATA_REG))
+    assert ops[:4]==[
+        RegOperation('delete_key',r'HKEY_CURRENT_USER\Software\winreglib\test',None,None,None),
+        RegOperation('create_key',r'HKEY_CURRENT_USER\Software\winreglib\test',None,None,None),
+        RegOperation('set_value',r'HKEY_CURRENT_USER\Software\winreglib\test','',winreglib.REG_SZ,'this is default'),
+        RegOperation('set_value',r'HKEY_CURRENT_USER\Software\winreglib\test','AnotherValue',winreglib.REG_DWORD,3),
+    ]
+    assert len(ops)==8
+
+def test_value_types():
+    ops=list(parse_reg(reg('\r\n'.join([
+        'Windows Registry Editor Version 5.00',
+        '',
+        '; a comment',
+        r'[HKEY_CURRENT_USER\Software\test]',
+        r'@="default \"quoted\" C:\\path\\"',
+        r'"bin"=hex:00,01,ff',
+        r'"expand"=hex(2):25,00,54,00,4d,00,50,00,25,00,00,00',
+        '"multi"=hex(7):61,00,00,00,62,00,63,00,00,00,\\',
+        r'  00,00',
+        r'"qword"=hex(b):00,00,00,00,01,00,00,00',
+        r'"none"=hex(0):',
+        r'"gone"=-',
+        r'[-HKEY_CURRENT_USER\Software\old]',
+    ]))))
+    values={op.name:(op.type,op.value) for op in ops if op.op=='set_value'}
+    assert values==({
+        '':(winreglib.REG_SZ,r'default "quoted" C:\path'+'\\'),
+        'bin':(winreglib.REG_BINARY,b'\x00\x01\xff'),
+        'expand':(winreglib.REG_EXPAND_SZ,'%TMP%'),
+        'multi':(winreglib.REG_MULTI_SZ,['a','bc']),
+        'qword':(winreglib.REG_QWORD,2**32),
+        'none':(winreglib.REG_NONE,None),
+    })
+    assert ops[-2]==RegOperation('delete_value',r'HKEY_CURRENT_USER\Software\test','gone',None,None)
+    assert ops[-1]==RegOperation('delete_key',r'HKEY_CURRENT_USER\Software\old',None,None,None)
+
+def test_regedit4():
+    ops=list(parse_reg(reg('REGEDIT4\n\n[HKEY_LOCAL_MACHINE\\Software\\test]\n"a"=hex(2):41,42,00\n','cp1252')))
+    assert ops[-1].value=='AB'
+
+def test_errors():
+    with pytest.raises(ValueError):
+        list(parse_reg(reg('not a reg file')))
+    with pytest.raises(ValueError) as e:
+        list(parse_reg(reg('REGEDIT4\n[HKEY_NOWHERE\\x]\n')))
+    assert 'line 2' in str(e.value)
+    with pytest.raises(ValueError):
+        list(parse_reg(reg('REGEDIT4\n"a"="b"\n')))
+
+def test_lazy():
+    def lines():
+        yield 'REGEDIT4\n'
+        i=0
+        while True:
+            yield '[HKEY_CURRENT_USER\\Software\\k{}]\n'.format(i)
+            i+=1
+    ops=parse_reg(io.TextIOWrapper(io.BytesIO(b'REGEDIT4\n[HKEY_CURRENT_USER\\x]\n')))
+    assert [op.path for op in ops]==['HKEY_CURRENT_USER\\x']
+    ops=winreglib._parse_reg_lines(lines())
+    assert next(ops).path==r'HKEY_CURRENT_USER\Software\k0'
+    assert next(ops).path==r'HKEY_CURRENT_USER\Software\k1'
+
+def test_caller_file_not_closed():
+    fin=reg('REGEDIT4\n')
+    assert list(parse_reg(fin))==[]
+    assert not fin.closed
+
+
+def test_import(memory_backend):
+    p=RegPath(r'HKCU\Software\winreglib\test')
+    (p/'extra').create()
+    assert import_reg(DATA_REG)==8
+    assert [k.name for k in p.subkeys()]==['subkey1','subkey2','subkey3']
+    assert p.read_all()=={'':('this is default',winreglib.REG_SZ),'AnotherValue':(3,winreglib.REG_DWORD)}
+    assert (p/'subkey1').value('').get()=='with stuff'
+
+def test_apply_reuses_handle():
+    class Backend(MemoryBackend):
+        creates=0
+        def create_key(self,key,sub_key,access=winreglib.KEY_WRITE):
+            Backend.creates+=1
+            return super().create_key(key,sub_key,access)
+    backend=Backend()
+    ops=[RegOperation('create_key',r'HKCU\Software\test',None,None,None)]
+    ops+=[RegOperation('set_value',r'HKCU\Software\test','v{}'.format(i),winreglib.REG_DWORD,i) for i in range(100)]
+    ops+=[RegOperation('delete_value',r'HKCU\Software\test','v0',None,None),RegOperation('delete_value',r'HKCU\Software\missing','v0',None,None)]
+    assert apply_reg(ops,backend)==103
+    assert Backend.creates==1
+    assert RegPath(r'HKCU\Software\test',backend=backend).value_count()==99
+
+def test_apply_recreates_deleted_key():
+    backend=MemoryBackend()
+    text='Windows Registry Editor Version 5.00\n\n[HKEY_CURRENT_USER\\A]\n"x"="1"\n\n[-HKEY_CURRENT_USER\\A]\n\n[HKEY_CURRENT_USER\\A]\n"y"="2"\n'
+    apply_reg(parse_reg(reg(text)),backend)
+    assert RegPath(r'HKCU\A',backend=backend).read_all()=={'y':('2',winreglib.REG_SZ)}
+
+
+# exporting
+def test_export(memory_backend):
+    p=RegPath(r'HKCU\Software\winreglib\test')
+    fout=io.BytesIO()
+    p.export_reg(fout)
+    assert not fout.closed
+    text=fout.getvalue().decode('utf-16')
+    assert text.split('\r\n')==[
+        'Windows Registry Editor Version 5.00',
+        '',
+        r'[HKEY_CURRENT_USER\Software\winreglib\test]',
+        '@="this is default"',
+        '"AnotherValue"=dword:00000003',
+        '',
+        r'[HKEY_CURRENT_USER\Software\winreglib\test\subkey1]',
+        '@="with stuff"',
+        '',
+        r'[HKEY_CURRENT_USER\Software\winreglib\test\subkey2]',
+        '',
+        r'[HKEY_CURRENT_USER\Software\winreglib\test\subkey3]',
+        '',
+        '',
+    ]
+
+def test_export_not_recursive(memory_backend):
+    fout=io.BytesIO()
+    RegPath(r'HKCU\Software\winreglib\test').export_reg(fout,recursive=False)
+    assert 'subkey1' not in fout.getvalue().decode('utf-16')
+
+def test_export_round_trip(memory_backend,tmpdir):
+    p=RegPath(r'HKCU\Software\winreglib\test')
+    values={
+        'str':('with "quotes" and \\ backslashes',winreglib.REG_SZ),
+        'lines':('two\r\nlines',winreglib.REG_SZ),
+        'expand':('%TEMP%\\x',winreglib.REG_EXPAND_SZ),
+        'bin':(bytes(range(256)),winreglib.REG_BINARY),
+        'multi':(['a','b c','d'],winreglib.REG_MULTI_SZ),
+        'qword':(2**40+5,winreglib.REG_QWORD),
+        'none':(b'\x01',winreglib.REG_NONE),
+        'dword':(0xffffffff,winreglib.REG_DWORD),
+        '"odd" \\ name':('x',winreglib.REG_SZ),
+    }
+    for name,(value,type) in values.items():
+        (p/'subkey2'/'deeper').value(name).set(value,type)
+    file_name=str(tmpdir.join('export.reg'))
+    p.export_reg(file_name)
+    backend=MemoryBackend()
+    import_reg(file_name,backend)
+    copy=RegPath(r'HKCU\Software\winreglib\test',backend=backend)
+    assert [str(path) for path,names,values in copy.walk()]==[str(path) for path,names,values in p.walk()]
+    assert (copy/'subkey2'/'deeper').read_all()==values
+    with open(file_name,'rb') as fin:
+        assert max(len(line) for line in fin.read().decode('utf-16').split('\r\n'))<=80
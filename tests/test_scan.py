@@ -0,0 +1,63 @@
+import threading
+
+import pytest
+
+from winreglib import MemoryBackend, RegPath
+
+
+@pytest.fixture
+def tree(memory_backend):
+    p=RegPath(r'HKCU\Software\winreglib\scan')
+    for i in range(20):
+        for j in range(5):
+            (p/'k{:02}'.format(i)/'c{}'.format(j)).value('v').set(i*j)
+    return p
+
+
+def test_scan_unordered(tree):
+    expected=sorted(str(path) for path,names,values in tree.walk())
+    assert sorted(str(path) for path,names,values in tree.scan(workers=4))==expected
+
+def test_scan_ordered(tree):
+    expected=[(str(path),names,[(v.name,v.value) for v in values]) for path,names,values in tree.walk()]
+    scanned=[(str(path),names,[(v.name,v.value) for v in values]) for path,names,values in tree.scan(workers=4,ordered=True,queue_size=2)]
+    assert scanned==expected
+
+def test_scan_max_depth(tree):
+    assert len(list(tree.scan(max_depth=0)))==1
+    assert len(list(tree.scan(max_depth=1,ordered=True)))==21
+
+def test_scan_cancel(tree):
+    with tree.scan(workers=2,queue_size=1) as scan:
+        first=[next(scan) for i in range(3)]
+        scan.cancel()
+        assert list(scan)==[]
+    assert scan.cancelled
+    assert len(first)==3
+
+def test_scan_close(tree):
+    scan=tree.scan(workers=2,ordered=True,queue_size=1)
+    next(scan)
+    next(scan)
+    scan.close()
+    assert list(scan)==[]
+    assert not [t for t in threading.enumerate() if t.name.startswith('ThreadPoolExecutor') and t.is_alive()]
+
+def test_scan_error(tree):
+    class FailingBackend(MemoryBackend):
+        def query_info_key(self,handle):
+            if handle.name=='k05': raise OSError('failed')
+            return super().query_info_key(handle)
+    backend=FailingBackend()
+    p=RegPath(r'HKCU\Software\scan',backend=backend)
+    for i in range(10): (p/'k{:02}'.format(i)).create()
+    with pytest.raises(OSError):
+        list(p.scan(workers=3))
+    errors=[]
+    assert len(list(p.scan(workers=3,onerror=errors.append)))==10
+    assert len(errors)==1
+
+def test_scan_non_existent(memory_backend):
+    errors=[]
+    assert list(RegPath(r'HKCU\Software\nonExistent').scan(onerror=errors.append))==[]
+    assert len(errors)==1
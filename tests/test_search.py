@@ -0,0 +1,68 @@
+import re
+
+import winreglib
+from winreglib import Instrumentation, RegPath, RegTransaction
+
+
+GUID='{8A69D345-D564-463C-AFF1-A69D9E530F96}'
+
+
+def setup_tree():
+    with RegTransaction() as tx:
+        for i in range(30):
+            key=r'HKCU\Software\search\k%d\sub'%(i%5)
+            tx.set(key,'plain%d'%i,'nothing here')
+            tx.set(key,'count%d'%i,i)
+        tx.set(r'HKCU\Software\search\k1','ProductCode',GUID.lower())
+        tx.set(r'HKCU\Software\search\k2\sub','Products',[r'C:\Program Files\App',GUID],winreglib.REG_MULTI_SZ)
+        tx.set(r'HKCU\Software\search\k3',GUID,b'binary')
+        tx.set(r'HKCU\Software\search\k4','blob',GUID.encode())
+    return RegPath(r'HKCU\Software\search')
+
+
+def found(values):
+    return sorted((v.path.path,v.name) for v in values)
+
+
+def test_search_names_and_data(memory_backend):
+    p=setup_tree()
+    assert found(p.search(re.escape(GUID)))==[
+        (r'Software\search\k1','ProductCode'),
+        (r'Software\search\k2\sub','Products'),
+        (r'Software\search\k3',GUID),
+    ]
+    assert found(p.search(re.escape(GUID),in_names=False))==[(r'Software\search\k1','ProductCode'),(r'Software\search\k2\sub','Products')]
+    assert found(p.search(re.escape(GUID),in_data=False))==[(r'Software\search\k3',GUID)]
+    assert found(p.search(re.escape(GUID),ignore_case=False))==[(r'Software\search\k2\sub','Products'),(r'Software\search\k3',GUID)]
+
+def test_search_types(memory_backend):
+    p=setup_tree()
+    assert found(p.search(re.escape(GUID),types=[winreglib.REG_MULTI_SZ]))==[(r'Software\search\k2\sub','Products')]
+    assert found(p.search('^29$',in_names=False))==[(r'Software\search\k4\sub','count29')]
+
+def test_search_limit(memory_backend):
+    p=setup_tree()
+    assert len(list(p.search('plain')))==30
+    assert len(list(p.search('plain',limit=7)))==7
+    assert list(p.search('plain',limit=0))==[]
+
+def test_search_compiled_pattern(memory_backend):
+    p=setup_tree()
+    assert len(list(p.search(re.compile('NOTHING'),in_names=False)))==0
+    assert len(list(p.search(re.compile('NOTHING',re.I),in_names=False)))==30
+
+def test_search_reads_only_candidate_data(memory_backend):
+    p=setup_tree()
+    with RegTransaction() as tx:
+        for i in range(5): tx.set(r'HKCU\Software\search\blobs','blob%d'%i,bytes(100000))
+        tx.set(r'HKCU\Software\search\blobs','text','match me')
+    with Instrumentation() as stats:
+        assert found(p.search('match',types=[winreglib.REG_SZ]))==[(r'Software\search\blobs','text')]
+    # names and types are checked before any data is read, and binary data is never read
+    assert stats['enum_value'].calls==0
+    # the string values: 30 plain, ProductCode and text
+    assert stats['query_value'].calls==32
+    assert stats['query_value'].bytes<1000
+    with Instrumentation() as stats:
+        assert len(list(p.search('^blob',in_data=False)))==6
+    assert stats['query_value'].calls==stats['enum_value'].calls==0
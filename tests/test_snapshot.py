@@ -0,0 +1,56 @@
+import winreglib
+from winreglib import RegPath, diff
+
+
+def changes(a,b,**kwargs):
+    return [(d.change,d.path.path,d.name,d.old,d.new) for d in diff(a,b,**kwargs)]
+
+
+def test_no_changes(memory_backend):
+    p=RegPath(r'HKCU\Software\winreglib')
+    assert changes(p.snapshot(),p.snapshot())==[]
+
+def test_changes(memory_backend):
+    p=RegPath(r'HKCU\Software\winreglib')
+    (p/r'test\subkey3\old').value('v').set(1)
+    before=p.snapshot()
+    (p/r'test\subkey1').value('').set('changed')
+    (p/r'test\subkey2\new\deeper').value('n').set(2)
+    (p/r'test\subkey3\old').delete(recurse=True)
+    p.value('z').set(b'\x00')
+    (p/'test').value('AnotherValue').delete()
+    assert changes(before,p.snapshot())==[
+        ('value_added',r'Software\winreglib','z',None,(b'\x00',winreglib.REG_BINARY)),
+        ('value_removed',r'Software\winreglib\test','AnotherValue',(3,winreglib.REG_DWORD),None),
+        ('value_modified',r'Software\winreglib\test\subkey1','',('with stuff',winreglib.REG_SZ),('changed',winreglib.REG_SZ)),
+        ('key_added',r'Software\winreglib\test\subkey2\new',None,None,None),
+        ('key_added',r'Software\winreglib\test\subkey2\new\deeper',None,None,None),
+        ('value_added',r'Software\winreglib\test\subkey2\new\deeper','n',None,(2,winreglib.REG_DWORD)),
+        ('key_removed',r'Software\winreglib\test\subkey3\old',None,None,None),
+        ('value_removed',r'Software\winreglib\test\subkey3\old','v',(1,winreglib.REG_DWORD),None),
+    ]
+
+def test_case_insensitive(memory_backend):
+    a=RegPath(r'HKCU\Software\a')
+    b=RegPath(r'HKCU\Software\b')
+    for p,names in ((a,('Key','other')),(b,('KEY','OTHER'))):
+        for name in names: (p/name).value(name.lower()).set(1)
+    assert changes(a.snapshot(),b.snapshot(),skip_unchanged=False)==[]
+
+def test_skips_unchanged_subtrees(memory_backend):
+    p=RegPath(r'HKCU\Software\winreglib')
+    before=p.snapshot()
+    after=p.snapshot()
+    # hide a change in a subtree whose times and counts haven't changed
+    subkey1=after.root.subkeys[0].subkeys[0]
+    subkey1.values=((subkey1.values[0][0],'','hidden',winreglib.REG_SZ),)
+    assert changes(before,after)==[]
+    assert len(changes(before,after,skip_unchanged=False))==1
+
+def test_subtree_last_write(memory_backend):
+    p=RegPath(r'HKCU\Software\winreglib')
+    before=p.snapshot()
+    (p/r'test\subkey2').value('v').set(1)
+    after=p.snapshot()
+    assert after.root.last_write==before.root.last_write
+    assert after.root.subtree_last_write>before.root.subtree_last_write
@@ -0,0 +1,169 @@
+import io
+import os
+import threading
+import time
+
+import pytest
+
+import winreglib
+from winreglib import HandlePool, MemoryBackend, RegPath, TraceRecorder, import_reg, read_trace, replay_trace
+
+
+TEST=r'HKCU\Software\winreglib\test'
+
+
+def workload():
+    p=RegPath(TEST)
+    p.value('AnotherValue').get()
+    p.value('new').set('twelve chars')
+    list(p.subkeys())
+    (p/'subkey1').value('').exists()
+    p.value('missing').exists()
+    (p/'subkey3').delete()
+
+
+def test_record(memory_backend):
+    trace=io.BytesIO()
+    with TraceRecorder(trace):
+        workload()
+    assert memory_backend.__dict__.keys().isdisjoint(winreglib.Instrumentation.PRIMITIVES)
+    trace.seek(0)
+    records=list(read_trace(trace))
+    assert records[0].op=='start'
+    assert abs(records[0].time-time.time())<60
+    ops=[(r.op,r.path,r.name) for r in records[1:]]
+    assert ops[:4]==[
+        ('open_key',r'HKEY_CURRENT_USER\Software\winreglib\test',r'Software\winreglib\test'),
+        ('query_value',r'HKEY_CURRENT_USER\Software\winreglib\test','AnotherValue'),
+        ('close_key',r'HKEY_CURRENT_USER\Software\winreglib\test',''),
+        ('create_key',r'HKEY_CURRENT_USER\Software\winreglib\test',r'Software\winreglib\test'),
+    ]
+    set_value=[r for r in records if r.op=='set_value'][0]
+    assert (set_value.name,set_value.type,set_value.size)==('new',winreglib.REG_SZ,26)
+    assert [r.name for r in records if r.op=='enum_key']==['subkey1','subkey2','subkey3']
+    missing=[r for r in records if r.op=='query_value_info' and r.name=='missing'][0]
+    assert missing.error==winreglib.ERROR_FILE_NOT_FOUND
+    assert ('delete_key',r'HKEY_CURRENT_USER\Software\winreglib\test\subkey3','subkey3') in ops
+    assert all(r.thread==0 for r in records)
+    assert records[1:]==sorted(records[1:],key=lambda r:r.time)
+
+def test_record_appends(memory_backend,tmpdir):
+    filename=str(tmpdir.join('workload.trace'))
+    for i in range(2):
+        with TraceRecorder(filename):
+            RegPath(TEST).exists()
+    assert [r.op for r in read_trace(filename)]==['start','open_key','close_key']*2
+
+def test_not_a_trace():
+    with pytest.raises(ValueError):
+        list(read_trace(io.BytesIO(b'something else')))
+
+def test_replay(memory_backend):
+    trace=io.BytesIO()
+    with TraceRecorder(trace):
+        workload()
+    trace.seek(0)
+    backend=MemoryBackend()
+    RegPath(TEST,backend=backend).create()
+    calls,errors=replay_trace(trace,backend)
+    assert calls==len(list(read_trace(io.BytesIO(trace.getvalue()))))-1
+    # missing values and keys missing from the new backend
+    assert errors>0
+    value=RegPath(TEST,backend=backend).value('new')
+    assert value.get()=='x'*12 and value.type==winreglib.REG_SZ
+
+def test_replay_speed(memory_backend):
+    trace=io.BytesIO()
+    with TraceRecorder(trace):
+        RegPath(TEST).exists()
+        time.sleep(0.1)
+        RegPath(TEST).exists()
+    trace.seek(0)
+    records=list(read_trace(trace))
+    start=time.perf_counter()
+    replay_trace(records,MemoryBackend(),speed=2)
+    assert time.perf_counter()-start>=0.04
+
+def test_replay_threads(memory_backend):
+    memory_backend.handle_pool=HandlePool(memory_backend)
+    trace=io.BytesIO()
+    barrier=threading.Barrier(4)
+    def read():
+        for i in range(20): RegPath(TEST).value('AnotherValue').get()
+        # keep every thread alive until they've all finished, so none reuses another's ident
+        barrier.wait()
+    with TraceRecorder(trace):
+        threads=[threading.Thread(target=read) for i in range(4)]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+    trace.seek(0)
+    records=list(read_trace(trace))
+    assert len({r.thread for r in records[1:]})==4
+    backend=MemoryBackend()
+    RegPath(TEST,backend=backend).value('AnotherValue').set(3)
+    assert replay_trace(records,backend,threads=True)==(len(records)-1,0)
+
+def test_reopened_handles(memory_backend):
+    # MemoryBackend returns the same object from each open of a key, so the lazy values' opens are nested in the
+    # subvalues' open of the same handle
+    trace=io.BytesIO()
+    with TraceRecorder(trace):
+        for value in RegPath(TEST).subvalues(data=False): value.value
+        handle=memory_backend.open_key(winreglib.HKEY_CURRENT_USER,r'Software\winreglib\test',winreglib.KEY_READ)
+        memory_backend.close_key(memory_backend.open_key(winreglib.HKEY_CURRENT_USER,r'Software\winreglib\test',winreglib.KEY_READ))
+        memory_backend.query_value(handle,'AnotherValue')
+        memory_backend.close_key(handle)
+    trace.seek(0)
+    records=list(read_trace(trace))
+    opens=[r.handle for r in records if r.op=='open_key']
+    assert len(set(opens))==len(opens)
+    query=[r for r in records if r.op=='query_value'][-1]
+    assert (query.key,query.path)==(opens[-2],'HKEY_CURRENT_USER\\Software\\winreglib\\test')
+    backend=MemoryBackend()
+    import_reg(os.path.join(os.path.dirname(__file__),'data.reg'),backend)
+    assert replay_trace(records,backend)==(len(records)-1,0)
+
+def test_record_pooled_handles(memory_backend):
+    memory_backend.handle_pool=HandlePool(memory_backend)
+    value=RegPath(TEST).value('AnotherValue')
+    # opened into the pool before recording
+    value.get()
+    trace=io.BytesIO()
+    with TraceRecorder(trace):
+        for i in range(3): value.get()
+    trace.seek(0)
+    records=list(read_trace(trace))
+    assert [r.op for r in records]==['start','open_key']+['query_value']*3
+    # the pool keeps paths casefolded
+    assert all(r.path.casefold()=='hkey_current_user\\software\\winreglib\\test' for r in records[1:])
+    for threads in (False,True):
+        backend=MemoryBackend()
+        import_reg(os.path.join(os.path.dirname(__file__),'data.reg'),backend)
+        start=time.perf_counter()
+        assert replay_trace(records,backend,threads=threads)==(4,0)
+        assert time.perf_counter()-start<0.5
+
+def test_replay_unknown_handle():
+    record=winreglib.TraceRecord(0,0,'query_value','','name',-1,0,0,0,0,0,0)
+    start=time.perf_counter()
+    assert replay_trace([record],MemoryBackend(),threads=True)==(1,1)
+    assert time.perf_counter()-start<0.5
+
+def test_record_access(memory_backend):
+    trace=io.BytesIO()
+    with TraceRecorder(trace):
+        RegPath(TEST).value('AnotherValue').delete()
+        RegPath(TEST).exists()
+    trace.seek(0)
+    records=list(read_trace(trace))
+    assert [(r.op,r.access) for r in records if r.op=='open_key']==[('open_key',winreglib.KEY_WRITE),('open_key',winreglib.KEY_READ)]
+    opened=[]
+    class AccessBackend(MemoryBackend):
+        def open_key(self,key,sub_key,access=winreglib.KEY_READ):
+            opened.append(access)
+            return super().open_key(key,sub_key,access)
+    backend=AccessBackend()
+    import_reg(os.path.join(os.path.dirname(__file__),'data.reg'),backend)
+    del opened[:]
+    assert replay_trace(records,backend)==(len(records)-1,0)
+    assert opened==[winreglib.KEY_WRITE,winreglib.KEY_READ]
@@ -0,0 +1,84 @@
+import pytest
+
+import winreglib
+from winreglib import MemoryBackend, RegPath, RegTransaction
+
+
+TEST=r'HKCU\Software\winreglib\test'
+
+
+class FailingBackend(MemoryBackend):
+    def set_value(self,handle,name,type,value):
+        if name=='fail': raise PermissionError(13,'Access is denied')
+        super().set_value(handle,name,type,value)
+
+
+def test_transaction_applies(memory_backend):
+    with RegTransaction() as tx:
+        tx.set(TEST,'a',1)
+        tx.set(TEST+r'\new\deeper','b','text')
+        tx.delete(TEST,'AnotherValue')
+        tx.delete(TEST,'nonExistent')
+        tx.create(TEST+r'\empty')
+    p=RegPath(TEST)
+    assert p.read_all()=={'':('this is default',winreglib.REG_SZ),'a':(1,winreglib.REG_DWORD)}
+    assert (p/'new'/'deeper').value('b').get()=='text'
+    assert (p/'empty').exists()
+
+def test_transaction_coalesces(memory_backend):
+    tx=RegTransaction()
+    for i in range(100):
+        tx.set(TEST,'counter',i)
+    tx.set(TEST.upper(),'COUNTER',100)
+    tx.set(TEST,'gone',1)
+    tx.delete(TEST,'gone')
+    assert len(tx)==2
+    assert tx.commit()==2
+    assert RegPath(TEST).value('counter').get()==100
+    assert not RegPath(TEST).value('gone').exists()
+
+def test_transaction_one_handle_per_key(counting_backend):
+    backend=counting_backend
+    RegPath(r'HKCU\Software\a',backend=backend).create()
+    RegPath(r'HKCU\Software\b',backend=backend).create()
+    tx=RegTransaction(backend)
+    for i in range(50):
+        tx.set(r'HKCU\Software\a','v%d'%i,i)
+        tx.set(r'HKCU\Software\b','v%d'%i,i)
+    backend.calls.reset()
+    tx.commit()
+    assert backend.calls['open_key'].calls==2
+    assert RegPath(r'HKCU\Software\b',backend=backend).value_count()==50
+
+def test_transaction_discarded_on_exception(memory_backend):
+    with pytest.raises(KeyError):
+        with RegTransaction() as tx:
+            tx.set(TEST,'a',1)
+            raise KeyError
+    assert not RegPath(TEST).value('a').exists()
+
+def test_transaction_rolls_back():
+    backend=FailingBackend()
+    p=RegPath(TEST,backend=backend)
+    p.value('keep').set('old')
+    p.value('removed').set(2)
+    tx=RegTransaction(backend)
+    tx.set(p,'keep','new')
+    tx.delete(p,'removed')
+    tx.set(p,'added',1)
+    tx.set(r'HKCU\Software\created\deeper','x',1)
+    tx.set(r'HKCU\Software\zzz','fail',1)
+    with pytest.raises(PermissionError):
+        tx.commit()
+    assert p.read_all()=={'keep':('old',winreglib.REG_SZ),'removed':(2,winreglib.REG_DWORD)}
+    assert not RegPath(r'HKCU\Software\created',backend=backend).exists()
+    assert not RegPath(r'HKCU\Software\zzz',backend=backend).exists()
+
+def test_transaction_default_value(memory_backend):
+    with RegTransaction() as tx:
+        tx.set(TEST,None,'first')
+        tx.set(TEST,'','second')
+    assert RegPath(TEST).value('').get()=='second'
+    with RegTransaction() as tx:
+        tx.delete(TEST,None)
+    assert not RegPath(TEST).value('').exists()
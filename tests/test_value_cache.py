@@ -0,0 +1,149 @@
+import io
+import time
+
+import pytest
+
+from winreglib import MemoryBackend, RegPath, RegTransaction, ValueCache, apply_reg, parse_reg
+
+
+TEST=r'HKCU\Software\winreglib\test'
+
+
+def queries(backend):
+    return backend.calls['query_value'].calls
+
+
+@pytest.fixture
+def backend(counting_backend):
+    backend=counting_backend
+    RegPath(TEST,backend=backend).value('a').set('one')
+    backend.value_cache=ValueCache(backend,max_size=3,ttl=60)
+    backend.calls.reset()
+    return backend
+
+
+def test_cache_hits(backend):
+    value=RegPath(TEST,backend=backend).value('a')
+    assert value.get()=='one'
+    assert value.get()=='one'
+    assert value.exists()
+    assert queries(backend)==1
+    assert (backend.value_cache.hits,backend.value_cache.misses)==(2,1)
+
+def test_cache_missing_values(backend):
+    value=RegPath(TEST,backend=backend).value('missing')
+    with pytest.raises(FileNotFoundError):
+        value.get()
+    assert not value.exists()
+    assert not RegPath(TEST+r'\missing',backend=backend).value('a').exists()
+    assert queries(backend)==1
+
+def test_cache_ttl(backend):
+    backend.value_cache.ttl=0.01
+    value=RegPath(TEST,backend=backend).value('a')
+    value.get()
+    time.sleep(0.02)
+    value.get()
+    assert queries(backend)==2
+
+def test_cache_lru(backend):
+    p=RegPath(TEST,backend=backend)
+    for name in ('a','b','c','a','d'):
+        p.value(name).exists()
+    assert len(backend.value_cache)==3
+    assert backend.value_cache.evictions==1
+    backend.calls.reset()
+    # b was least recently used
+    p.value('a').exists()
+    p.value('b').exists()
+    assert queries(backend)==1
+
+def test_cache_invalidated_by_writes(backend):
+    p=RegPath(TEST,backend=backend)
+    value=p.value('a')
+    value.get()
+    RegPath(TEST.upper(),backend=backend).value('A').set('two')
+    assert value.get()=='two'
+    value.delete()
+    assert not value.exists()
+    with RegTransaction(backend) as tx:
+        tx.set(p,'a','three')
+    assert value.get()=='three'
+    (p/'sub').value('x').set(1)
+    assert (p/'sub').value('x').get()==1
+    p.delete(recurse=True)
+    assert not value.exists()
+    assert not (p/'sub').value('x').exists()
+    apply_reg(parse_reg(io.StringIO('Windows Registry Editor Version 5.00\n\n[HKEY_CURRENT_USER\\Software\\winreglib\\test]\n"a"="four"\n')),backend)
+    assert value.get()=='four'
+
+def test_cache_watch():
+    backend=MemoryBackend()
+    RegPath(TEST,backend=backend).value('a').set('one')
+    backend.value_cache=ValueCache(backend,ttl=None,watch=True,interval=0.01)
+    value=RegPath(TEST,backend=backend).value('a')
+    try:
+        assert value.get()=='one'
+        # a write that bypasses the cache, as another process's would
+        handle=backend.open_key(value.path.hkey_constant,value.path.path)
+        backend.set_value(handle,'a',1,'changed')
+        deadline=time.monotonic()+5
+        while value.get()!='changed' and time.monotonic()<deadline:
+            time.sleep(0.01)
+        assert value.get()=='changed'
+    finally:
+        backend.value_cache.clear()
+
+def test_cache_watches_closed():
+    backend=MemoryBackend()
+    p=RegPath(TEST,backend=backend)
+    p.value('a').set('one')
+    (p/'sub').value('b').set('two')
+    cache=backend.value_cache=ValueCache(backend,max_size=2,ttl=None,watch=True,interval=0.01)
+    try:
+        p.value('a').get()
+        p.value('missing').exists()
+        watch=cache._watches[(p.hkey_constant,TEST.split('\\',1)[1].casefold())]
+        # the key's watch stays until its last entry goes
+        p.value('a').set('three')
+        assert not watch.closed
+        (p/'sub').value('b').get()
+        (p/'sub').value('c').exists()
+        assert cache.evictions==1
+        assert watch.closed
+        assert len(cache._watches)==1
+        (p/'sub').delete(recurse=True)
+        assert not cache._watches
+    finally:
+        cache.clear()
+
+def test_cache_max_watches():
+    backend=MemoryBackend()
+    p=RegPath(TEST,backend=backend)
+    p.value('a').set('one')
+    (p/'sub').value('b').set('two')
+    cache=backend.value_cache=ValueCache(backend,ttl=None,watch=True,interval=0.05,max_watches=1)
+    try:
+        p.value('a').get()
+        value=(p/'sub').value('b')
+        value.get()
+        assert len(cache._watches)==1
+        # the unwatched key's entries expire after interval instead
+        handle=backend.open_key(value.path.hkey_constant,value.path.path)
+        backend.set_value(handle,'b',1,'changed')
+        assert value.get()=='two'
+        time.sleep(0.06)
+        assert value.get()=='changed'
+    finally:
+        cache.clear()
+
+def test_cache_default_value(backend):
+    p=RegPath(TEST,backend=backend)
+    p.value('').set('default')
+    assert p.value(None).get()=='default'
+    assert p.value('').get()=='default'
+    assert queries(backend)==1
+    p.value(None).set('changed')
+    assert p.value('').get()=='changed'
+    backend.value_cache.invalidate(p.hkey_constant,p.path,'')
+    assert p.value(None).get()=='changed'
@@ -0,0 +1,102 @@
+import array
+import struct
+
+import pytest
+
+import winreglib
+from winreglib import RegPath, RegValue
+
+
+TEST=r'HKCU\Software\winreglib\test'
+
+
+@pytest.mark.parametrize('value,type',[
+    ('text',winreglib.REG_SZ),
+    (RegValue.ExpandingString('%TEMP%'),winreglib.REG_EXPAND_SZ),
+    (b'\x00\x01',winreglib.REG_BINARY),
+    (bytearray(b'\x02'),winreglib.REG_BINARY),
+    (memoryview(b'\x03'),winreglib.REG_BINARY),
+    (7,winreglib.REG_DWORD),
+    (0xFFFFFFFF,winreglib.REG_DWORD),
+    (0x100000000,winreglib.REG_QWORD),
+    (2**64-1,winreglib.REG_QWORD),
+    (RegValue.QWord(1),winreglib.REG_QWORD),
+    (RegValue.DWordBigEndian(0x01020304),winreglib.REG_DWORD_BIG_ENDIAN),
+    (['a','b'],winreglib.REG_MULTI_SZ),
+    (('a',),winreglib.REG_MULTI_SZ),
+    (RegValue.MultiString(),winreglib.REG_MULTI_SZ),
+    (None,winreglib.REG_NONE),
+])
+def test_determine_value_type(value,type):
+    assert RegValue._determine_value_type(value)==type
+
+def test_determine_value_type_unknown():
+    with pytest.raises(TypeError):
+        RegValue._determine_value_type(1.5)
+    with pytest.raises(TypeError):
+        RegValue._determine_value_type(['a',1])
+
+@pytest.mark.parametrize('value',[-1,2**64])
+def test_determine_value_type_out_of_range(memory_backend,value):
+    with pytest.raises(OverflowError):
+        RegValue._determine_value_type(value)
+    with pytest.raises(OverflowError):
+        RegPath(TEST).value('outOfRange').set(value)
+
+
+@pytest.mark.parametrize('value,marker',[
+    (RegValue.QWord(5),RegValue.QWord),
+    (0x123456789,RegValue.QWord),
+    (RegValue.DWordBigEndian(0x01020304),RegValue.DWordBigEndian),
+    (['a','b'],RegValue.MultiString),
+    (RegValue.ExpandingString('%PATH%'),RegValue.ExpandingString),
+])
+def test_round_trip(memory_backend,value,marker):
+    p=RegPath(TEST)
+    p.value('typed').set(value)
+    read=p.value('typed')
+    assert read.get()==(list(value) if isinstance(value,list) else value)
+    assert isinstance(read.value,marker)
+    # writing what was read back keeps the type
+    p.value('copy').set(read.value)
+    copy=p.value('copy')
+    assert copy.get()==read.value
+    assert copy.type==read.type
+    assert p.read_all()['typed'][0].__class__ is marker
+    assert [v for v in p.subvalues() if v.name=='typed'][0].value.__class__ is marker
+
+def test_big_endian_is_stored_as_bytes(memory_backend):
+    p=RegPath(TEST)
+    p.value('be').set(RegValue.DWordBigEndian(0x01020304))
+    handle=memory_backend.open_key(p.hkey_constant,p.path)
+    assert memory_backend.query_value(handle,'be')==(b'\x01\x02\x03\x04',winreglib.REG_DWORD_BIG_ENDIAN)
+
+def test_binary_views(memory_backend):
+    p=RegPath(TEST)
+    records=array.array('I',range(10))
+    p.value('table').set(memoryview(records))
+    value=p.value('table')
+    view=value.view()
+    assert view.readonly
+    assert bytes(view)==records.tobytes()
+    assert value.as_array().tolist()==list(range(10))
+    assert value.as_array(winreglib.REG_QWORD).tolist()==list(struct.unpack('5Q',records.tobytes()))
+    # the views share the value's memory
+    assert value.as_array().obj is value.value
+
+def test_binary_views_errors(memory_backend):
+    p=RegPath(TEST)
+    p.value('odd').set(b'\x00\x01\x02')
+    with pytest.raises(ValueError):
+        p.value('odd').as_array()
+    with pytest.raises(TypeError):
+        p.value('AnotherValue').view()
+
+def test_as_numpy(memory_backend):
+    numpy=pytest.importorskip('numpy')
+    p=RegPath(TEST)
+    p.value('table').set(struct.pack('<4I',1,2,3,4))
+    value=p.value('table')
+    assert value.as_numpy().tolist()==[1,2,3,4]
+    records=value.as_numpy(numpy.dtype([('a','<u4'),('b','<u4')]))
+    assert records['b'].tolist()==[2,4]
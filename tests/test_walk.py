@@ -0,0 +1,58 @@
+import pytest
+
+from winreglib import RegPath
+
+
+@pytest.fixture
+def tree(memory_backend):
+    p=RegPath(r'HKCU\Software\winreglib\walk')
+    for path in (r'a\a1\a11',r'a\a2',r'b',r'c\c1'):
+        (p/path).create()
+    (p/'a').value('v').set(1)
+    return p
+
+
+def test_walk_topdown(tree):
+    walked=[(str(path),names,[v.name for v in values]) for path,names,values in tree.walk()]
+    assert walked==[
+        (r'HKCU\Software\winreglib\walk',['a','b','c'],[]),
+        (r'HKCU\Software\winreglib\walk\a',['a1','a2'],['v']),
+        (r'HKCU\Software\winreglib\walk\a\a1',['a11'],[]),
+        (r'HKCU\Software\winreglib\walk\a\a1\a11',[],[]),
+        (r'HKCU\Software\winreglib\walk\a\a2',[],[]),
+        (r'HKCU\Software\winreglib\walk\b',[],[]),
+        (r'HKCU\Software\winreglib\walk\c',['c1'],[]),
+        (r'HKCU\Software\winreglib\walk\c\c1',[],[]),
+    ]
+
+def test_walk_bottomup(tree):
+    walked=[path.path[len(tree.path)+1:] for path,names,values in tree.walk(topdown=False)]
+    assert walked==[r'a\a1\a11',r'a\a1',r'a\a2','a','b',r'c\c1','c','']
+
+def test_walk_max_depth(tree):
+    assert [path.name for path,names,values in tree.walk(max_depth=0)]==['walk']
+    assert [path.name for path,names,values in tree.walk(max_depth=1)]==['walk','a','b','c']
+
+def test_walk_prune(tree):
+    walked=[]
+    for path,names,values in tree.walk():
+        walked.append(path.name)
+        if 'a' in names: names.remove('a')
+    assert walked==['walk','b','c','c1']
+
+def test_walk_onerror(memory_backend):
+    p=RegPath(r'HKCU\Software\winreglib\nonExistent')
+    with pytest.raises(OSError):
+        list(p.walk())
+    errors=[]
+    assert list(p.walk(onerror=errors.append))==[]
+    assert len(errors)==1
+
+def test_walk_deleted_during_walk(tree):
+    errors=[]
+    walked=[]
+    for path,names,values in tree.walk(onerror=errors.append):
+        walked.append(path.name)
+        if path.name=='walk': (tree/'b').delete()
+    assert walked==['walk','a','a1','a11','a2','c','c1']
+    assert len(errors)==1
@@ -0,0 +1,103 @@
+import asyncio
+import time
+
+import winreglib
+from winreglib import RegPath, RegChange, REG_NOTIFY_CHANGE_NAME
+
+
+def next_change(watch,timeout=5):
+    """`next_change(watch)`, but failing instead of hanging the tests if no change is reported."""
+    change=watch._queue.get(timeout=timeout)
+    assert change is not None,'the watch was closed'
+    return change
+
+
+def test_watch_value_change(memory_backend):
+    path=RegPath('HKCU\\Software\\winreglib\\test')
+    with path.watch(interval=0.01,debounce=0.05) as watch:
+        path.value('Watched').set('one')
+        change=next_change(watch)
+    assert isinstance(change,RegChange)
+    assert change.path==path
+    assert change.count>=1
+
+
+def test_watch_debounces_bursts(memory_backend):
+    path=RegPath('HKCU\\Software\\winreglib\\test')
+    with path.watch(interval=0.01,debounce=0.2) as watch:
+        for i in range(5):
+            path.value('Burst').set(i)
+            time.sleep(0.02)
+        change=next_change(watch)
+        assert change.count>1
+        assert watch._queue.empty()
+
+
+def test_watch_recursive(memory_backend):
+    path=RegPath('HKCU\\Software')
+    with path.watch(recursive=True,interval=0.01,debounce=0.02) as watch:
+        (path/'winreglib'/'test').value('Deep').set(1)
+        assert next_change(watch).path==path
+
+
+def test_watch_name_filter_ignores_values(memory_backend):
+    path=RegPath('HKCU\\Software\\winreglib\\test')
+    with path.watch(filter=REG_NOTIFY_CHANGE_NAME,interval=0.01,debounce=0.02) as watch:
+        path.value('Ignored').set(1)
+        time.sleep(0.1)
+        assert watch._queue.empty()
+        (path/'NewKey').create()
+        next_change(watch)
+
+
+def test_watch_close_ends_iteration(memory_backend):
+    watch=RegPath('HKCU\\Software\\winreglib\\test').watch(interval=0.01)
+    watch.close()
+    assert list(watch)==[]
+
+
+def test_watch_async(memory_backend):
+    path=RegPath('HKCU\\Software\\winreglib\\test')
+
+    async def main():
+        with path.watch(interval=0.01,debounce=0.02) as watch:
+            asyncio.get_running_loop().call_later(0.05,path.value('Async').set,'x')
+            async def first():
+                async for change in watch:
+                    return change
+            return await asyncio.wait_for(first(),5)
+
+    assert asyncio.run(main()).path==path
+
+
+def test_watch_callback_errors(memory_backend,caplog):
+    path=RegPath('HKCU\\Software\\winreglib\\test')
+    def fail(change):
+        raise ValueError('callback failed')
+    failing=path.watch(interval=0.01,debounce=0.01,callback=fail)
+    try:
+        path.value('Fail').set(1)
+        time.sleep(0.1)
+        # the worker survived and other watches, including new ones, still get events
+        with path.watch(interval=0.01,debounce=0.01) as watch:
+            path.value('Fail').set(2)
+            next_change(watch)
+    finally:
+        failing.close()
+    assert 'callback failed' in caplog.text
+
+def test_watch_thread_restarts(memory_backend,monkeypatch):
+    path=RegPath('HKCU\\Software\\winreglib\\test')
+    manager=winreglib._watch_manager
+    # the worker thread dying from an unexpected error
+    monkeypatch.setattr(manager,'_wait',lambda native,timeout:1/0)
+    dead=path.watch(interval=0.01)
+    deadline=time.monotonic()+5
+    while manager._thread is not None and time.monotonic()<deadline:
+        time.sleep(0.01)
+    assert manager._thread is None
+    monkeypatch.undo()
+    dead.close()
+    with path.watch(interval=0.01,debounce=0.01) as watch:
+        path.value('Restart').set(1)
+        next_change(watch)
@@ -6,7 +6,57 @@ VALUE - like a file, has a name, a type and a value (for want of a better word)
 
 Keys and values are case insensitive.
 """
-import winreg
+import asyncio
+import bisect
+import collections
+import concurrent.futures
+import contextlib
+import errno
+import fnmatch
+import functools
+import io
+import logging
+import mmap
+import queue
+import re
+import struct
+import threading
+import time
+
+_logger=logging.getLogger('winreglib')
+
+try:
+    import numpy
+except ImportError:
+    # optional, only needed for `RegValue.as_numpy`
+    numpy=None
+
+try:
+    import winreg
+except ImportError:
+    # not on Windows, only non-native backends (eg. `MemoryBackend`) are available
+    winreg=None
+
+if winreg is not None:
+    # for the registry functions winreg doesn't expose
+    import ctypes
+    from ctypes import wintypes
+    _advapi32=ctypes.WinDLL('advapi32')
+    _kernel32=ctypes.WinDLL('kernel32',use_last_error=True)
+    _advapi32.RegQueryInfoKeyW.restype=wintypes.LONG
+    _advapi32.RegQueryInfoKeyW.argtypes=[wintypes.HKEY,wintypes.LPWSTR,wintypes.LPDWORD,wintypes.LPDWORD,wintypes.LPDWORD,wintypes.LPDWORD,wintypes.LPDWORD,wintypes.LPDWORD,wintypes.LPDWORD,wintypes.LPDWORD,wintypes.LPDWORD,ctypes.POINTER(wintypes.FILETIME)]
+    _advapi32.RegEnumValueW.restype=wintypes.LONG
+    _advapi32.RegEnumValueW.argtypes=[wintypes.HKEY,wintypes.DWORD,wintypes.LPWSTR,wintypes.LPDWORD,wintypes.LPDWORD,wintypes.LPDWORD,wintypes.LPBYTE,wintypes.LPDWORD]
+    _advapi32.RegQueryValueExW.restype=wintypes.LONG
+    _advapi32.RegQueryValueExW.argtypes=[wintypes.HKEY,wintypes.LPCWSTR,wintypes.LPDWORD,wintypes.LPDWORD,wintypes.LPBYTE,wintypes.LPDWORD]
+    _advapi32.RegNotifyChangeKeyValue.restype=wintypes.LONG
+    _advapi32.RegNotifyChangeKeyValue.argtypes=[wintypes.HKEY,wintypes.BOOL,wintypes.DWORD,wintypes.HANDLE,wintypes.BOOL]
+    _kernel32.CreateEventW.restype=wintypes.HANDLE
+    _kernel32.CreateEventW.argtypes=[wintypes.LPVOID,wintypes.BOOL,wintypes.BOOL,wintypes.LPCWSTR]
+    _kernel32.SetEvent.argtypes=[wintypes.HANDLE]
+    _kernel32.CloseHandle.argtypes=[wintypes.HANDLE]
+    _kernel32.WaitForMultipleObjects.restype=wintypes.DWORD
+    _kernel32.WaitForMultipleObjects.argtypes=[wintypes.DWORD,ctypes.POINTER(wintypes.HANDLE),wintypes.BOOL,wintypes.DWORD]
 
 
 __version__   = "0.1.0"
@@ -14,279 +64,3478 @@ __author__    = "Adam Kerz"
 __copyright__ = "Copyright (C) 2016-17 Adam Kerz"
 
 
-__ALL__=['RegPath','RegValue']
+__ALL__=['RegPath','RegValue','Backend','WinregBackend','MemoryBackend','HiveBackend','HandlePool','ValueCache','Instrumentation','OperationStats','assert_backend_calls','KeyInfo','ValueInfo','RegScan','AsyncRegPath','AsyncRegValue','RegOperation','parse_reg','apply_reg','import_reg','TraceRecorder','TraceRecord','read_trace','replay_trace','RegTransaction','RegSnapshot','RegDiff','diff','RegWatch','RegChange','get_backend','set_backend','get_async_executor','set_async_executor']
+
+
+# ----------------------------------------
+# Constants
+# ----------------------------------------
+# these have the same values as their winreg counterparts so they're available on hosts without winreg
+HKEY_CLASSES_ROOT=0x80000000
+HKEY_CURRENT_USER=0x80000001
+HKEY_LOCAL_MACHINE=0x80000002
+HKEY_USERS=0x80000003
+HKEY_CURRENT_CONFIG=0x80000005
+
+KEY_READ=0x20019
+KEY_WRITE=0x20006
+KEY_ALL_ACCESS=0xF003F
+KEY_NOTIFY=0x0010
+
+# what `RegPath.watch` notifies about
+REG_NOTIFY_CHANGE_NAME=0x1
+REG_NOTIFY_CHANGE_ATTRIBUTES=0x2
+REG_NOTIFY_CHANGE_LAST_SET=0x4
+REG_NOTIFY_CHANGE_SECURITY=0x8
+
+REG_NONE=0
+REG_SZ=1
+REG_EXPAND_SZ=2
+REG_BINARY=3
+REG_DWORD=4
+REG_DWORD_BIG_ENDIAN=5
+REG_LINK=6
+REG_MULTI_SZ=7
+REG_RESOURCE_LIST=8
+REG_FULL_RESOURCE_DESCRIPTOR=9
+REG_RESOURCE_REQUIREMENTS_LIST=10
+REG_QWORD=11
+
+# Windows system error codes raised by the registry functions
+ERROR_FILE_NOT_FOUND=2
+ERROR_ACCESS_DENIED=5
+ERROR_INVALID_HANDLE=6
+ERROR_NO_MORE_ITEMS=259
+ERROR_KEY_DELETED=1018
+
+KeyInfo=collections.namedtuple('KeyInfo','subkey_count value_count last_write max_subkey_name_length max_value_name_length max_value_data_length')
+KeyInfo.__doc__="""The result of `Backend.query_info_key`. `last_write` is a Windows FILETIME, name lengths are in characters and data lengths in bytes."""
+ValueInfo=collections.namedtuple('ValueInfo','name type size')
+ValueInfo.__doc__="""The result of `RegValue.stat`, a value's name, reg type and data size in bytes."""
+
+_WINERROR_EXCEPTIONS={
+    ERROR_FILE_NOT_FOUND:(FileNotFoundError,errno.ENOENT),
+    ERROR_ACCESS_DENIED:(PermissionError,errno.EACCES),
+}
 
 
 # ----------------------------------------
 # Helper functions
 # ----------------------------------------
+def _winerror(e):
+    """Returns the Windows error code of an OSError, or None if it doesn't have one."""
+    return getattr(e,'winerror',None)
+
+def _registry_error(winerror,message):
+    """Creates an OSError that looks like the one winreg would raise for the given Windows error code."""
+    cls,code=_WINERROR_EXCEPTIONS.get(winerror,(OSError,None))
+    e=cls(code,message)
+    e.winerror=winerror
+    return e
+
 def _ignore_file_not_found_error(fn,finallyFn=None):
     """Tries to execute fn and returns None if it raises a FileNotFoundError: [WinError 2]. Raises all other exceptions. Optional function to call on finally."""
     try:
         return fn()
     except OSError as e:
         # FileNotFoundError
-        if e.winerror==2: return None
+        if _winerror(e)==ERROR_FILE_NOT_FOUND: return None
         raise
     finally:
         if callable(finallyFn): finallyFn()
 
-def _open_key(reg_path,access=winreg.KEY_READ,error_on_non_existent=True):
-    """Tries to open the key with the given security access and returns a winreg.handle object. Errors if not found, unless error_on_non_existent is True, in which case None is returned."""
-    fn=lambda: winreg.OpenKey(reg_path.hkey_constant,reg_path.path,0,access)
+def _open_key(reg_path,access=KEY_READ,error_on_non_existent=True,create=False):
+    """
+    Tries to open the key with the given security access and returns a backend handle. Errors if not found, unless error_on_non_existent is True, in which case None is returned.
+    Creates the key (and all parent keys) instead if `create` is True. The handle comes from the backend's handle pool if it has one and must be closed with `_close_key`.
+    """
+    backend=reg_path.backend
+    pool=backend.handle_pool
+    if pool is not None:
+        fn=lambda: pool.acquire(reg_path.hkey_constant,reg_path.path,access,create)
+    elif create:
+        fn=lambda: backend.create_key(reg_path.hkey_constant,reg_path.path,access)
+    else:
+        fn=lambda: backend.open_key(reg_path.hkey_constant,reg_path.path,access)
     if error_on_non_existent: return fn()
     return _ignore_file_not_found_error(fn)
 
+def _close_key(reg_path,handle):
+    """Closes a handle returned by `_open_key`, or returns it to the handle pool if it came from there."""
+    backend=reg_path.backend
+    pool=backend.handle_pool
+    if pool is None or not pool.release(handle): backend.close_key(handle)
+
+def _invalidate_values(reg_path,name=None):
+    """Drops the value `name` (or all the values of the key and the keys below it) from the backend's value cache, after a write."""
+    cache=reg_path.backend.value_cache
+    if cache is not None: cache.invalidate(reg_path.hkey_constant,reg_path.path,name)
+
+def _iter_subkey_names(backend,handle):
+    """Yields the name of each subkey of an open key."""
+    # query the count up front rather than iterating until a no more data exception
+    for i in range(backend.query_info_key(handle).subkey_count):
+        try:
+            name=backend.enum_key(handle,i)
+        except OSError as e:
+            # subkeys were deleted while enumerating
+            if _winerror(e)==ERROR_NO_MORE_ITEMS: return
+            raise
+        yield name
+
+def _iter_values(backend,handle):
+    """Yields a (name, value, type) tuple for each value of an open key."""
+    # query the count up front rather than iterating until a no more data exception
+    for i in range(backend.query_info_key(handle).value_count):
+        try:
+            entry=backend.enum_value(handle,i)
+        except OSError as e:
+            # values were deleted while enumerating
+            if _winerror(e)==ERROR_NO_MORE_ITEMS: return
+            raise
+        yield entry
+
+def _iter_value_infos(backend,handle):
+    """Yields a (name, type, data size) tuple for each value of an open key, without reading the data where the backend can."""
+    for i in range(backend.query_info_key(handle).value_count):
+        try:
+            entry=backend.enum_value_info(handle,i)
+        except OSError as e:
+            # values were deleted while enumerating
+            if _winerror(e)==ERROR_NO_MORE_ITEMS: return
+            raise
+        yield entry
+
+def _delete_subkeys(backend,handle):
+    """
+    Deletes everything below the open key `handle`. Walks the tree iteratively in post-order, listing the subkeys of
+    each key once (deleting while enumerating would skip over keys as the indexes shift) and deleting them by name
+    through the handle to their parent.
+    """
+    # (handle, names of the subkeys left to delete) for each key down to the one being deleted
+    stack=[(handle,list(_iter_subkey_names(backend,handle)))]
+    try:
+        while stack:
+            handle,names=stack[-1]
+            if names:
+                child=_ignore_file_not_found_error(lambda:backend.open_key(handle,names[-1],KEY_READ))
+                if child is None: names.pop()
+                else: stack.append((child,list(_iter_subkey_names(backend,child))))
+                continue
+            # all the subkeys of this key have gone so delete it through its parent
+            stack.pop()
+            if not stack: break
+            backend.close_key(handle)
+            parent,parent_names=stack[-1]
+            name=parent_names.pop()
+            _ignore_file_not_found_error(lambda:backend.delete_key(parent,name))
+    finally:
+        for handle,names in stack[1:]: backend.close_key(handle)
+
+def _delete_subkeys_parallel(backend,handle,workers):
+    """Deletes everything below the open key `handle`, spreading the subtrees of its subkeys over `workers` threads."""
+    def delete(name):
+        child=_ignore_file_not_found_error(lambda:backend.open_key(handle,name,KEY_READ))
+        if child is None: return
+        try:
+            _delete_subkeys(backend,child)
+        finally:
+            backend.close_key(child)
+        _ignore_file_not_found_error(lambda:backend.delete_key(handle,name))
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        # list() to raise the first exception
+        list(executor.map(delete,list(_iter_subkey_names(backend,handle))))
+
+@functools.lru_cache(maxsize=256)
+def _compile_glob(pattern):
+    """Splits a glob pattern into a tuple of literal names, `**` and compiled case insensitive regular expressions."""
+    parts=[]
+    for part in pattern.split('\\'):
+        if not part: raise ValueError('Unacceptable pattern: {!r}'.format(pattern))
+        if part=='**':
+            # repeated `**`s match the same as one
+            if parts and parts[-1]=='**': continue
+        elif '**' in part:
+            raise ValueError('Invalid pattern: \'**\' can only be an entire component')
+        elif any(c in part for c in '*?['):
+            part=re.compile(fnmatch.translate(part),re.IGNORECASE|re.DOTALL)
+        parts.append(part)
+    return tuple(parts)
+
+# the types whose data `RegPath.search` matches
+_SEARCHABLE_TYPES=frozenset((REG_SZ,REG_EXPAND_SZ,REG_MULTI_SZ,REG_DWORD,REG_QWORD,REG_DWORD_BIG_ENDIAN))
+
+def _search_data(pattern,value,type):
+    """Whether `pattern` matches a value's data, see `RegPath.search`."""
+    if type in (REG_SZ,REG_EXPAND_SZ): return value is not None and pattern.search(value) is not None
+    if type==REG_MULTI_SZ: return any(pattern.search(s) for s in value or ())
+    if type in (REG_DWORD,REG_QWORD) or (type==REG_DWORD_BIG_ENDIAN and isinstance(value,int)):
+        return value is not None and pattern.search(str(value)) is not None
+    return False
+
+def _copy_key(backend,handle,dest_backend,dest_handle,recursive):
+    """Copies the values (and the subkeys if `recursive`) of one open key to another, which can be of another backend."""
+    for name,value,type in _iter_values(backend,handle):
+        dest_backend.set_value(dest_handle,name,type,value)
+    if not recursive: return
+    for name in list(_iter_subkey_names(backend,handle)):
+        child=backend.open_key(handle,name,KEY_READ)
+        try:
+            dest_child=dest_backend.create_key(dest_handle,name,KEY_WRITE)
+            try:
+                _copy_key(backend,child,dest_backend,dest_child,recursive)
+            finally:
+                dest_backend.close_key(dest_child)
+        finally:
+            backend.close_key(child)
+
+def _value_size(value,type):
+    """The size in bytes of a value's data as the registry stores it."""
+    if value is None: return 0
+    if type in (REG_SZ,REG_EXPAND_SZ): return (len(value)+1)*2
+    if type==REG_MULTI_SZ: return (sum(len(s)+1 for s in value)+1)*2
+    if type in (REG_DWORD,REG_DWORD_BIG_ENDIAN): return 4
+    if type==REG_QWORD: return 8
+    return len(value)
+
+def _decode_data(type,data,encoding='utf-16-le'):
+    """Converts raw registry data to the value winreg would return for it."""
+    if type in (REG_DWORD,REG_QWORD):
+        return int.from_bytes(data,'little')
+    if type in (REG_SZ,REG_EXPAND_SZ):
+        return bytes(data).decode(encoding,'replace').split('\0',1)[0]
+    if type==REG_MULTI_SZ:
+        strings=bytes(data).decode(encoding,'replace').split('\0')
+        while strings and not strings[-1]: strings.pop()
+        return strings
+    return bytes(data) if len(data) else None
+
+def _check_value(value,type):
+    """
+    Checks a value can be stored as the reg type as `winreg.SetValueEx` does, raising TypeError or OverflowError if it
+    can't. Returns the value the registry would then return, None being stored as 0 or empty.
+    """
+    if type in (REG_DWORD,REG_QWORD):
+        if value is None: return 0
+        if not isinstance(value,int): raise TypeError('Could not convert the data to the specified type.')
+        if value<0: raise OverflowError('can\'t convert negative int to unsigned')
+        if value>=1<<(32 if type==REG_DWORD else 64): raise OverflowError('int too big to convert')
+        return int(value)
+    if type in (REG_SZ,REG_EXPAND_SZ):
+        if value is None: return ''
+        if not isinstance(value,str): raise TypeError('Could not convert the data to the specified type.')
+        return value
+    if type==REG_MULTI_SZ:
+        if value is None: return []
+        if not isinstance(value,list) or not all(isinstance(s,str) for s in value): raise TypeError('Could not convert the data to the specified type.')
+        return list(value)
+    if value is None: return None
+    try:
+        return bytes(memoryview(value))
+    except TypeError:
+        raise TypeError('Objects of type \'{}\' can not be used as binary registry values'.format(value.__class__.__name__)) from None
+
+def _encode_data(type,value,encoding='utf-16-le'):
+    """Converts a value (as winreg would accept it) to raw registry data."""
+    if type==REG_DWORD:
+        return (value or 0).to_bytes(4,'little')
+    if type==REG_QWORD:
+        return (value or 0).to_bytes(8,'little')
+    if type==REG_DWORD_BIG_ENDIAN and isinstance(value,int):
+        return value.to_bytes(4,'big')
+    if type in (REG_SZ,REG_EXPAND_SZ):
+        return ((value or '')+'\0').encode(encoding)
+    if type==REG_MULTI_SZ:
+        return ''.join(s+'\0' for s in (value or [])+['']).encode(encoding)
+    return bytes(value or b'')
+
+def _filetime_now():
+    """The current time as a Windows FILETIME (100ns intervals since 1601-01-01), the format of key last write times."""
+    return time.time_ns()//100+116444736000000000
+
 
 
 # ----------------------------------------
-# RegPath class
+# Backends
 # ----------------------------------------
-class RegPath(object):
-    """Represents a particular path in the registry."""
+class Backend(object):
+    """
+    The registry primitives that `RegPath` and `RegValue` dispatch through.
 
-    HKEY_CONSTANTS={
-        'HKEY_CURRENT_USER':winreg.HKEY_CURRENT_USER,
-        'HKEY_LOCAL_MACHINE':winreg.HKEY_LOCAL_MACHINE,
-        'HKEY_CLASSES_ROOT':winreg.HKEY_CLASSES_ROOT,
-        'HKEY_USERS':winreg.HKEY_USERS,
-        'HKEY_CURRENT_CONFIG':winreg.HKEY_CURRENT_CONFIG,
-    }
-    HKEY_CONSTANTS_SHORT={
-        'HKCU':winreg.HKEY_CURRENT_USER,
-        'HKLM':winreg.HKEY_LOCAL_MACHINE,
-        'HKCR':winreg.HKEY_CLASSES_ROOT,
-        'HKU':winreg.HKEY_USERS,
-        'HKCC':winreg.HKEY_CURRENT_CONFIG,
-    }
-    HKEY_CONSTANTS.update(HKEY_CONSTANTS_SHORT)
-    HKEYS={value:key for key,value in HKEY_CONSTANTS.items()}
-    for key,value in HKEY_CONSTANTS_SHORT.items(): HKEYS[value]=key
-    UNSET_VALUE=object()
+    The methods mirror the winreg functions of the same name. `key` arguments are either an HKEY constant or a handle
+    returned by `open_key`/`create_key`, and errors are raised as an OSError with the `winerror` winreg would give.
 
+    Set `handle_pool` to a `HandlePool` to have `RegPath` and `RegValue` reuse open handles instead of opening and
+    closing the key on every call, and `value_cache` to a `ValueCache` to cache the values `RegValue.get` reads.
+    """
+    handle_pool=None
+    value_cache=None
 
-    # ----------------------------------------
-    # Construction
-    # ----------------------------------------
-    def __init__(self,path,hkey_constant=None):
-        # accept RegPath objects
-        if isinstance(path,RegPath):
-            self.hkey_constant=hkey_constant if hkey_constant else path.hkey_constant
-            self.path=path.path
-        else:
-            # and strings
-            path.rstrip('\\')
-            if hkey_constant:
-                self.hkey_constant=hkey_constant
-                self.path=path
-            else:
-                self.hkey_constant,self.path=self._split_path(path)
+    def open_key(self,key,sub_key,access=KEY_READ):
+        """Opens `sub_key` relative to `key` and returns a handle to it."""
+        raise NotImplementedError
 
+    def create_key(self,key,sub_key,access=KEY_WRITE):
+        """Opens `sub_key` relative to `key`, creating it (and all parent keys) if it doesn't exist, and returns a handle to it."""
+        raise NotImplementedError
 
-    def __truediv__(self,path):
-        """
-        Creates a new reg path by appending the given path component.
+    def close_key(self,handle):
+        """Closes a handle returned by `open_key`/`create_key`."""
+        raise NotImplementedError
 
-            p=RegPath(r'HKCU\Software')/'longer'
-            assert p.name=='longer'
-        """
-        return RegPath(self.path+'\\'+path,self.hkey_constant)
+    def enum_key(self,handle,index):
+        """Returns the name of the subkey at `index`."""
+        raise NotImplementedError
 
+    def enum_value(self,handle,index):
+        """Returns a (name, value, type) tuple for the value at `index`."""
+        raise NotImplementedError
 
-    # ----------------------------------------
-    # properties
-    # ----------------------------------------
-    # TODO: cache results of these functions - path objects should be considered immutable
-    @property
-    def hkey(self):
-        """Short string version of this path's HKEY."""
-        return self.HKEYS[self.hkey_constant]
+    def query_value(self,handle,name):
+        """Returns a (value, type) tuple for the value `name`."""
+        raise NotImplementedError
 
-    @property
-    def name(self):
-        """The key name."""
-        return self.path.rsplit('\\',1)[-1]
+    def enum_value_info(self,handle,index):
+        """Returns a (name, type, data size) tuple for the value at `index`. Backends that can should do this without reading the data."""
+        name,value,type=self.enum_value(handle,index)
+        return name,type,_value_size(value,type)
 
-    @property
-    def parent(self):
-        """A `RegPath` object that is the parent of this key."""
-        return RegPath(self.path.rsplit('\\',1)[0],self.hkey_constant)
+    def query_value_info(self,handle,name):
+        """Returns a (type, data size) tuple for the value `name`. Backends that can should do this without reading the data."""
+        value,type=self.query_value(handle,name)
+        return type,_value_size(value,type)
+
+    def set_value(self,handle,name,type,value):
+        """Sets the value `name` to `value` with the reg type `type`."""
+        raise NotImplementedError
+
+    def delete_key(self,key,sub_key):
+        """Deletes `sub_key`, which must not have any subkeys."""
+        raise NotImplementedError
+
+    def delete_value(self,handle,name):
+        """Deletes the value `name`."""
+        raise NotImplementedError
+
+    def query_info_key(self,handle):
+        """Returns a `KeyInfo` with the key's subkey and value counts, last write time and maximum name and data lengths."""
+        raise NotImplementedError
+
+    # whether `notify_change` is implemented, otherwise watches poll last write times
+    native_notifications=False
+
+    def notify_change(self,handle,recursive,filter,event):
+        """Asks for the Win32 `event` to be signalled when the key changes, like RegNotifyChangeKeyValue."""
+        raise NotImplementedError
+
+
+
+class WinregBackend(Backend):
+    """Backend that calls the native `winreg` module, the default on Windows."""
+
+    def __init__(self):
+        if winreg is None:
+            raise RuntimeError('The winreg module is not available on this platform, use a non-native backend such as MemoryBackend')
+
+    def open_key(self,key,sub_key,access=KEY_READ):
+        return winreg.OpenKey(key,sub_key,0,access)
+
+    def create_key(self,key,sub_key,access=KEY_WRITE):
+        return winreg.CreateKeyEx(key,sub_key,0,access)
+
+    def close_key(self,handle):
+        handle.Close()
+
+    def enum_key(self,handle,index):
+        return winreg.EnumKey(handle,index)
+
+    def enum_value(self,handle,index):
+        return winreg.EnumValue(handle,index)
+
+    def query_value(self,handle,name):
+        return winreg.QueryValueEx(handle,name)
+
+    def enum_value_info(self,handle,index):
+        # passing no data buffer gets the type and size without transferring the data
+        name=ctypes.create_unicode_buffer(16384)
+        name_length,type,size=wintypes.DWORD(len(name)),wintypes.DWORD(),wintypes.DWORD()
+        rc=_advapi32.RegEnumValueW(getattr(handle,'handle',handle),index,name,ctypes.byref(name_length),None,ctypes.byref(type),None,ctypes.byref(size))
+        if rc: raise ctypes.WinError(rc)
+        return name.value,type.value,size.value
+
+    def query_value_info(self,handle,name):
+        type,size=wintypes.DWORD(),wintypes.DWORD()
+        rc=_advapi32.RegQueryValueExW(getattr(handle,'handle',handle),name,None,ctypes.byref(type),None,ctypes.byref(size))
+        if rc: raise ctypes.WinError(rc)
+        return type.value,size.value
+
+    def set_value(self,handle,name,type,value):
+        winreg.SetValueEx(handle,name,0,type,value)
+
+    def delete_key(self,key,sub_key):
+        winreg.DeleteKey(key,sub_key)
+
+    def delete_value(self,handle,name):
+        winreg.DeleteValue(handle,name)
+
+    def query_info_key(self,handle):
+        subkeys,max_subkey,values,max_value_name,max_value_data=(wintypes.DWORD() for i in range(5))
+        last_write=wintypes.FILETIME()
+        rc=_advapi32.RegQueryInfoKeyW(getattr(handle,'handle',handle),None,None,None,ctypes.byref(subkeys),ctypes.byref(max_subkey),None,
+            ctypes.byref(values),ctypes.byref(max_value_name),ctypes.byref(max_value_data),None,ctypes.byref(last_write))
+        if rc: raise ctypes.WinError(rc)
+        return KeyInfo(subkeys.value,values.value,(last_write.dwHighDateTime<<32)|last_write.dwLowDateTime,max_subkey.value,max_value_name.value,max_value_data.value)
+
+    native_notifications=True
+
+    def notify_change(self,handle,recursive,filter,event):
+        rc=_advapi32.RegNotifyChangeKeyValue(getattr(handle,'handle',handle),recursive,filter,event,True)
+        if rc: raise ctypes.WinError(rc)
+
+
+
+class _MemoryKey(object):
+    """A key node in a `MemoryBackend` tree. Also used as the handle to the key."""
+    __slots__=('name','subkeys','values','last_write','deleted','_subkey_order','_value_order','_info')
+
+    def __init__(self,name):
+        self.name=name
+        # casefolded name -> _MemoryKey
+        self.subkeys={}
+        # casefolded name -> (name, value, type)
+        self.values={}
+        self.last_write=_filetime_now()
+        self.deleted=False
+        # enumeration order caches, rebuilt after modification
+        self._subkey_order=None
+        self._value_order=None
+        self._info=None
+
+    def touch(self):
+        self.last_write=_filetime_now()
+        self._info=None
+
+    def info(self):
+        if self._info is None:
+            self._info=KeyInfo(len(self.subkeys),len(self.values),self.last_write,
+                max((len(k.name) for k in self.subkeys.values()),default=0),
+                max((len(name) for name,value,type in self.values.values()),default=0),
+                max((_value_size(value,type) for name,value,type in self.values.values()),default=0))
+        return self._info
+
+
+
+class MemoryBackend(Backend):
+    """
+    Pure-Python backend that keeps keys and values in an in-memory tree.
+
+    Keys and value names are case insensitive, values keep their reg type and keys track their last write time. Subkeys
+    enumerate in case insensitive sorted order and values in the order they were created, as they do in a real hive.
+    """
+
+    def __init__(self):
+        self._roots={hkey:_MemoryKey(name) for name,hkey in RegPath.HKEY_CONSTANTS.items() if name.startswith('HKEY_')}
+        self._lock=threading.RLock()
 
 
     # ----------------------------------------
-    # Key manipulation
+    # helper methods
     # ----------------------------------------
-    def exists(self):
-        """Returns True if the key exists."""
-        # open (and then close) the key to see if it exists
+    def _resolve(self,key):
+        if isinstance(key,_MemoryKey):
+            if key.deleted: raise _registry_error(ERROR_KEY_DELETED,'Illegal operation attempted on a registry key that has been marked for deletion')
+            return key
         try:
-            handle=_open_key(self)
-        except OSError as e:
-            if e.winerror==2: return False
-            raise
-        else:
-            handle.Close()
-            return True
+            return self._roots[key]
+        except KeyError:
+            raise _registry_error(ERROR_INVALID_HANDLE,'The handle is invalid') from None
 
+    def _find(self,key,sub_key):
+        node=self._resolve(key)
+        if sub_key:
+            for part in sub_key.split('\\'):
+                if not part: continue
+                node=node.subkeys.get(part.casefold())
+                if node is None: raise _registry_error(ERROR_FILE_NOT_FOUND,'The system cannot find the file specified')
+        return node
 
-    def create(self):
-        """Ensures the key (and all parent keys) exist, creating them if they don't."""
-        # this either creates the key (and all parent keys) if it doesn't exist or just opens the handle if it does
-        handle=winreg.CreateKey(self.hkey_constant,self.path)
-        handle.Close()
 
+    # ----------------------------------------
+    # primitives
+    # ----------------------------------------
+    def open_key(self,key,sub_key,access=KEY_READ):
+        with self._lock:
+            return self._find(key,sub_key)
 
-    def delete(self,recurse=False):
-        """Deletes an existing key and any values it has. Will only delete subkeys if `recurse` is True otherwise will error."""
-        # delete subkeys if recurse
-        if recurse:
-            for k in self.subkeys():
-                k.delete(recurse=True)
-        # then delete this key, ignoring it not existing
-        handle=_open_key(self.parent,error_on_non_existent=False)
-        if not handle: return
-        _ignore_file_not_found_error(lambda:winreg.DeleteKey(handle,self.name),finallyFn=lambda:handle.Close())
+    def create_key(self,key,sub_key,access=KEY_WRITE):
+        with self._lock:
+            node=self._resolve(key)
+            if sub_key:
+                for part in sub_key.split('\\'):
+                    if not part: continue
+                    child=node.subkeys.get(part.casefold())
+                    if child is None:
+                        child=node.subkeys[part.casefold()]=_MemoryKey(part)
+                        node._subkey_order=None
+                        node.touch()
+                    node=child
+            return node
 
+    def close_key(self,handle):
+        pass
 
-    def subkeys(self):
-        """A generator that yields a `RegPath` for each subkey in this key"""
-        # open the key and make sure it exists
-        handle=_open_key(self)
-        try:
-            # iterate until an exception is raised, telling us we have no more data
-            i=0
-            while True:
-                yield self/winreg.EnumKey(handle,i)
-                i+=1
-        except OSError as e:
-            # 259=No more data is available
-            if e.winerror==259: return
-            raise
-        finally:
-            handle.Close()
+    def enum_key(self,handle,index):
+        with self._lock:
+            node=self._resolve(handle)
+            if node._subkey_order is None:
+                node._subkey_order=sorted(node.subkeys)
+            try:
+                return node.subkeys[node._subkey_order[index]].name
+            except IndexError:
+                raise _registry_error(ERROR_NO_MORE_ITEMS,'No more data is available') from None
 
+    def enum_value(self,handle,index):
+        with self._lock:
+            node=self._resolve(handle)
+            if node._value_order is None:
+                node._value_order=list(node.values.values())
+            try:
+                return node._value_order[index]
+            except IndexError:
+                raise _registry_error(ERROR_NO_MORE_ITEMS,'No more data is available') from None
 
-    def subvalues(self):
-        """A generator that yields a `RegPath` for each subvalue in this key"""
-        # open the key and make sure it exists
-        handle=_open_key(self)
-        try:
-            # iterate until an exception is raised, telling us we have no more data
-            i=0
-            while True:
-                (name,value,type)=winreg.EnumValue(handle,i)
-                v=RegValue(self,name,value,type)
-                yield v
-                i+=1
-        except OSError as e:
-            # 259=No more data is available
-            if e.winerror==259: return
-            raise
-        finally:
-            handle.Close()
+    def query_value(self,handle,name):
+        with self._lock:
+            node=self._resolve(handle)
+            try:
+                _,value,type=node.values[(name or '').casefold()]
+            except KeyError:
+                raise _registry_error(ERROR_FILE_NOT_FOUND,'The system cannot find the file specified') from None
+            return value,type
+
+    # sizes come from the stored values, called through the class so instrumentation doesn't count a data read too
+    def enum_value_info(self,handle,index):
+        name,value,type=MemoryBackend.enum_value(self,handle,index)
+        return name,type,_value_size(value,type)
+
+    def query_value_info(self,handle,name):
+        value,type=MemoryBackend.query_value(self,handle,name)
+        return type,_value_size(value,type)
+
+    def set_value(self,handle,name,type,value):
+        name=name or ''
+        # which also copies mutable values, as winreg would
+        value=_check_value(value,type)
+        with self._lock:
+            node=self._resolve(handle)
+            # keep the originally cased name when overwriting
+            existing=node.values.get(name.casefold())
+            if existing: name=existing[0]
+            node.values[name.casefold()]=(name,value,type)
+            node._value_order=None
+            node.touch()
+
+    def query_info_key(self,handle):
+        with self._lock:
+            return self._resolve(handle).info()
+
+    def delete_key(self,key,sub_key):
+        with self._lock:
+            parent_path,_,name=sub_key.rpartition('\\')
+            parent=self._find(key,parent_path)
+            node=parent.subkeys.get(name.casefold())
+            if node is None: raise _registry_error(ERROR_FILE_NOT_FOUND,'The system cannot find the file specified')
+            if node.subkeys: raise _registry_error(ERROR_ACCESS_DENIED,'Access is denied')
+            del parent.subkeys[name.casefold()]
+            node.deleted=True
+            parent._subkey_order=None
+            parent.touch()
+
+    def delete_value(self,handle,name):
+        with self._lock:
+            node=self._resolve(handle)
+            try:
+                del node.values[(name or '').casefold()]
+            except KeyError:
+                raise _registry_error(ERROR_FILE_NOT_FOUND,'The system cannot find the file specified') from None
+            node._value_order=None
+            node.touch()
+
+
+
+def _hive_upper(name):
+    """Upper cases a key name the way hives sort them, which only maps a character if it maps to a single character."""
+    if name.isascii(): return name.upper()
+    return ''.join(c if len(c.upper())!=1 else c.upper() for c in name)
+
+
+class _HiveKey(object):
+    """A key in a `HiveBackend`, either an nk cell or one of the keys above where the hive is mounted. Also used as the handle to the key."""
+    __slots__=('offset','name','depth')
+
+    def __init__(self,offset,name,depth=None):
+        # the nk cell offset, None for keys above the mount point
+        self.offset=offset
+        self.name=name
+        # for keys above the mount point, how many levels below the HKEY they are
+        self.depth=depth
+
+
+
+class HiveBackend(Backend):
+    """
+    Read-only backend for an offline registry hive file (regf format), eg. a copy of NTUSER.DAT or SOFTWARE.
+
+    The hive's root key is mounted at `mount`, so a SOFTWARE hive mounted at HKLM\\Software is read with the usual
+    `RegPath(r'HKLM\\Software\\...',backend=backend)`. The file is memory mapped and cells are read in place as they're
+    navigated, with value data only decoded when it's queried. Writes raise an access denied OSError. Transaction
+    logs aren't replayed, so a dirty hive is read as it was last flushed.
+    """
+    _NK=struct.Struct('<2sHQ4x4xI4xI4xII4x4xI4xII4xHH')
+    _VK=struct.Struct('<2sHIIIH2x')
+    _NK_COMP_NAME=0x0020
+    _VK_COMP_NAME=0x0001
+    _BIG_DATA_SEGMENT=16344
+    # how many keys' subkey lists are kept decoded
+    _SUBKEY_CACHE_SIZE=256
+
+    def __init__(self,filename,mount):
+        self.filename=filename
+        self.mount_hkey,mount_path=RegPath._split_path(mount)
+        self.mount_parts=[part for part in mount_path.split('\\') if part]
+        with open(filename,'rb') as fin:
+            self._mmap=mmap.mmap(fin.fileno(),0,access=mmap.ACCESS_READ)
+        self._data=memoryview(self._mmap)
+        if bytes(self._data[:4])!=b'regf':
+            self.close()
+            raise ValueError('Not a registry hive file: {}'.format(filename))
+        self._minor_version,=struct.unpack_from('<I',self._data,0x18)
+        root_offset,=struct.unpack_from('<I',self._data,0x24)
+        # nk cell offset -> (subkey nk cell offsets, subkey names decoded so far), shared by every handle to the key
+        self._subkey_cache=collections.OrderedDict()
+        self._subkey_cache_lock=threading.Lock()
+        self._root=_HiveKey(root_offset,self._nk(root_offset)[-1])
+
+
+    def close(self):
+        """Releases the memory mapped file. Handles can't be used after it's closed."""
+        self._data.release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc_info):
+        self.close()
 
 
     # ----------------------------------------
-    # Value manipulation
+    # cell access
     # ----------------------------------------
-    def value(self,name):
-        """Returns a `RegValue` object for the value `name` at this path."""
-        return RegValue(self,name)
+    def _cell(self,offset):
+        """A memoryview of the data of the cell at `offset` (relative to the first hbin)."""
+        start=0x1000+offset
+        size,=struct.unpack_from('<i',self._data,start)
+        return self._data[start+4:start+abs(size)]
+
+    def _nk(self,offset):
+        """Returns (flags, last_write, subkey_count, subkey_list, value_count, value_list, max_subkey_name, max_value_name, max_value_data, name) for an nk cell."""
+        cell=self._cell(offset)
+        sig,flags,last_write,subkey_count,subkey_list,value_count,value_list,max_subkey_name,max_value_name,max_value_data,name_length,_=self._NK.unpack_from(cell)
+        if sig!=b'nk': raise _registry_error(ERROR_FILE_NOT_FOUND,'Corrupt hive, expected a key cell at {:#x}'.format(offset))
+        name=bytes(cell[self._NK.size:self._NK.size+name_length]).decode('latin-1' if flags&self._NK_COMP_NAME else 'utf-16-le')
+        return flags,last_write,subkey_count,subkey_list,value_count,value_list,max_subkey_name,max_value_name,max_value_data,name
+
+    def _nk_name(self,offset):
+        cell=self._cell(offset)
+        flags,=struct.unpack_from('<H',cell,2)
+        name_length,=struct.unpack_from('<H',cell,0x48)
+        return bytes(cell[0x4C:0x4C+name_length]).decode('latin-1' if flags&self._NK_COMP_NAME else 'utf-16-le')
+
+    def _subkeys(self,key):
+        """
+        Returns (offsets, names) for a key's subkeys in the hive's order, which is sorted by upper cased name. `names`
+        holds the names decoded so far, see `_subkey_name`.
+        """
+        with self._subkey_cache_lock:
+            entry=self._subkey_cache.get(key.offset)
+            if entry is not None:
+                self._subkey_cache.move_to_end(key.offset)
+                return entry
+        offsets=[]
+        _,_,subkey_count,subkey_list,*_=self._nk(key.offset)
+        if subkey_count: self._read_subkey_list(subkey_list,offsets)
+        entry=(offsets,[None]*len(offsets))
+        with self._subkey_cache_lock:
+            self._subkey_cache[key.offset]=entry
+            if len(self._subkey_cache)>self._SUBKEY_CACHE_SIZE: self._subkey_cache.popitem(last=False)
+        return entry
+
+    def _subkey_name(self,subkeys,index):
+        offsets,names=subkeys
+        name=names[index]
+        if name is None: name=names[index]=self._nk_name(offsets[index])
+        return name
+
+    def _read_subkey_list(self,offset,offsets):
+        cell=self._cell(offset)
+        sig,count=struct.unpack_from('<2sH',cell)
+        if sig in (b'lf',b'lh'):
+            offsets.extend(struct.unpack_from('<{}I'.format(count*2),cell,4)[::2])
+        elif sig==b'li':
+            offsets.extend(struct.unpack_from('<{}I'.format(count),cell,4))
+        elif sig==b'ri':
+            for sublist in struct.unpack_from('<{}I'.format(count),cell,4):
+                self._read_subkey_list(sublist,offsets)
+        else:
+            raise _registry_error(ERROR_FILE_NOT_FOUND,'Corrupt hive, unknown subkey list {!r} at {:#x}'.format(sig,offset))
+
+    def _vk_offsets(self,key):
+        _,_,_,_,value_count,value_list,*_=self._nk(key.offset)
+        if not value_count: return ()
+        return struct.unpack_from('<{}I'.format(value_count),self._cell(value_list))
+
+    def _vk(self,offset):
+        """Returns (name, type, data_size, data_offset) for a vk cell."""
+        cell=self._cell(offset)
+        sig,name_length,data_size,data_offset,type,flags=self._VK.unpack_from(cell)
+        if sig!=b'vk': raise _registry_error(ERROR_FILE_NOT_FOUND,'Corrupt hive, expected a value cell at {:#x}'.format(offset))
+        name=bytes(cell[self._VK.size:self._VK.size+name_length]).decode('latin-1' if flags&self._VK_COMP_NAME else 'utf-16-le')
+        return name,type,data_size,data_offset
+
+    def _vk_data(self,offset,data_size,data_offset):
+        """The raw data of a value, a view of the hive unless it's split across big data segments."""
+        if data_size&0x80000000:
+            # small data is stored in the data offset field itself
+            cell=self._cell(offset)
+            return cell[8:8+(data_size&0x7FFFFFFF)]
+        cell=self._cell(data_offset)
+        if data_size>self._BIG_DATA_SEGMENT and self._minor_version>=4 and bytes(cell[:2])==b'db':
+            count,segments=struct.unpack_from('<HI',cell,2)
+            data=b''.join(self._cell(segment)[:self._BIG_DATA_SEGMENT] for segment in struct.unpack_from('<{}I'.format(count),self._cell(segments)))
+            return memoryview(data)[:data_size]
+        return cell[:data_size]
+
+    def _find_value(self,key,name):
+        name=(name or '').casefold()
+        for offset in self._vk_offsets(key):
+            vk=self._vk(offset)
+            if vk[0].casefold()==name: return offset,vk
+        raise _registry_error(ERROR_FILE_NOT_FOUND,'The system cannot find the file specified')
 
 
     # ----------------------------------------
     # helper methods
     # ----------------------------------------
-    @classmethod
-    def _split_path(cls,keyPath):
-        hkey,path=keyPath.split('\\',1)
-        if hkey not in cls.HKEY_CONSTANTS:
-            raise Exception('HKEY not recognised: {}'.format(hkey))
-        return cls.HKEY_CONSTANTS[hkey],path
+    def _resolve(self,key):
+        if isinstance(key,_HiveKey): return key
+        if key!=self.mount_hkey: raise _registry_error(ERROR_FILE_NOT_FOUND,'The system cannot find the file specified')
+        return self._mount_key(0,'')
 
+    def _mount_key(self,depth,name):
+        """The key `depth` levels below the HKEY, on the way to (or at) the mount point."""
+        if depth==len(self.mount_parts): return self._root
+        return _HiveKey(None,name,depth)
 
+    def _child(self,key,name):
+        folded=name.casefold()
+        if key.offset is None:
+            if self.mount_parts[key.depth].casefold()!=folded: raise _registry_error(ERROR_FILE_NOT_FOUND,'The system cannot find the file specified')
+            return self._mount_key(key.depth+1,name)
+        # binary search the sorted list, decoding only the names compared with
+        subkeys=self._subkeys(key)
+        offsets=subkeys[0]
+        upper=_hive_upper(name)
+        low,high=0,len(offsets)
+        while low<high:
+            middle=(low+high)//2
+            if _hive_upper(self._subkey_name(subkeys,middle))<upper: low=middle+1
+            else: high=middle
+        if low<len(offsets) and self._subkey_name(subkeys,low).casefold()==folded:
+            return _HiveKey(offsets[low],self._subkey_name(subkeys,low))
+        if not name.isascii():
+            # Windows upper cases a few characters differently from Python, so they might not be where they're searched for
+            for i in range(len(offsets)):
+                if self._subkey_name(subkeys,i).casefold()==folded: return _HiveKey(offsets[i],self._subkey_name(subkeys,i))
+        raise _registry_error(ERROR_FILE_NOT_FOUND,'The system cannot find the file specified')
 
-    def __str__(self):
-        return '{}\\{}'.format(self.HKEYS[self.hkey_constant],self.path)
+    def _read_only(self,*args,**kwargs):
+        raise _registry_error(ERROR_ACCESS_DENIED,'Access is denied, {} is read-only'.format(self.filename))
+
+
+    # ----------------------------------------
+    # primitives
+    # ----------------------------------------
+    def open_key(self,key,sub_key,access=KEY_READ):
+        if access&~KEY_READ&0xFFFF: self._read_only()
+        node=self._resolve(key)
+        if sub_key:
+            for part in sub_key.split('\\'):
+                if part: node=self._child(node,part)
+        return node
+
+    create_key=_read_only
+    set_value=_read_only
+    delete_key=_read_only
+    delete_value=_read_only
+
+    def close_key(self,handle):
+        pass
+
+    def enum_key(self,handle,index):
+        if handle.offset is None:
+            if index==0: return self.mount_parts[handle.depth]
+        else:
+            subkeys=self._subkeys(handle)
+            if index<len(subkeys[0]): return self._subkey_name(subkeys,index)
+        raise _registry_error(ERROR_NO_MORE_ITEMS,'No more data is available')
+
+    def enum_value(self,handle,index):
+        offsets=self._vk_offsets(handle) if handle.offset is not None else ()
+        if index>=len(offsets): raise _registry_error(ERROR_NO_MORE_ITEMS,'No more data is available')
+        name,type,data_size,data_offset=self._vk(offsets[index])
+        return name,_decode_data(type,self._vk_data(offsets[index],data_size,data_offset)),type
 
+    def query_value(self,handle,name):
+        if handle.offset is None: raise _registry_error(ERROR_FILE_NOT_FOUND,'The system cannot find the file specified')
+        offset,(_,type,data_size,data_offset)=self._find_value(handle,name)
+        return _decode_data(type,self._vk_data(offset,data_size,data_offset)),type
+
+    def enum_value_info(self,handle,index):
+        offsets=self._vk_offsets(handle) if handle.offset is not None else ()
+        if index>=len(offsets): raise _registry_error(ERROR_NO_MORE_ITEMS,'No more data is available')
+        name,type,data_size,data_offset=self._vk(offsets[index])
+        return name,type,data_size&0x7FFFFFFF
+
+    def query_value_info(self,handle,name):
+        if handle.offset is None: raise _registry_error(ERROR_FILE_NOT_FOUND,'The system cannot find the file specified')
+        offset,(_,type,data_size,data_offset)=self._find_value(handle,name)
+        return type,data_size&0x7FFFFFFF
+
+    def query_info_key(self,handle):
+        if handle.offset is None:
+            return KeyInfo(1,0,0,len(self.mount_parts[handle.depth]),0,0)
+        _,last_write,subkey_count,_,value_count,_,max_subkey_name,max_value_name,max_value_data,_=self._nk(handle.offset)
+        # name lengths are stored in bytes (with flags in the high bits), KeyInfo has them in characters
+        return KeyInfo(subkey_count,value_count,last_write,(max_subkey_name&0xFFFF)//2,max_value_name//2,max_value_data)
 
 
 # ----------------------------------------
-# RegValue class
+# Handle pool
 # ----------------------------------------
-class RegValue(object):
-    """Represents a value at a particular path in the registry."""
+class _PooledHandle(object):
+    __slots__=('key','handle','refs','evicted')
 
-    class ExpandingString(str):
-        """Subclass of `str` that indicates the reg type to use: `REG_EXPAND_SZ`"""
-        def __init__(self,value):
-            # somehow, magically, `value` is extended and not needed to be passed to the constructor
-            super(RegValue.ExpandingString,self).__init__()
+    def __init__(self,key,handle):
+        self.key=key
+        self.handle=handle
+        self.refs=0
+        self.evicted=False
 
 
-    def __init__(self,path,name,value=None,type=None):
-        self.path=path
-        self.name=name
-        self.value=value
-        self.type=type
 
+class HandlePool(object):
+    """
+    A thread-safe, reference counted cache of open key handles for a backend, keyed by (hkey, path, access mask).
 
-    def exists(self):
-        """Tries to get this value to see if it exists."""
-        try:
-            self.get()
+    Idle handles are closed least recently used first once there are more than `max_size` of them; handles still in use
+    are only closed once they're released. Enable it by setting it as the backend's `handle_pool`:
+
+        backend=get_backend()
+        backend.handle_pool=HandlePool(backend)
+
+    Keys deleted through `RegPath.delete` are dropped from the pool, but a key deleted by another process leaves its
+    pooled handles stale until `invalidate` or `close_all` is called.
+    """
+
+    def __init__(self,backend,max_size=64):
+        self.backend=backend
+        self.max_size=max_size
+        self.hits=0
+        self.misses=0
+        # (hkey, casefolded path, access) -> _PooledHandle, least recently used first
+        self._entries=collections.OrderedDict()
+        # id(handle) -> [_PooledHandle], the entries with a handle currently acquired
+        self._leased={}
+        self._lock=threading.Lock()
+
+
+    def acquire(self,hkey_constant,path,access=KEY_READ,create=False):
+        """Returns an open handle to the key, opening it (or creating it if `create` is True) if there isn't one in the pool. Each call must be paired with a `release`."""
+        key=(hkey_constant,path.casefold(),access)
+        with self._lock:
+            entry=self._entries.get(key)
+            if entry is not None:
+                self.hits+=1
+                self._entries.move_to_end(key)
+                return self._lease(entry)
+            self.misses+=1
+        # open outside the lock so slow opens don't block other threads
+        if create: handle=self.backend.create_key(hkey_constant,path,access)
+        else: handle=self.backend.open_key(hkey_constant,path,access)
+        with self._lock:
+            entry=self._entries.get(key)
+            if entry is not None:
+                # another thread opened it at the same time, use theirs
+                self.backend.close_key(handle)
+            else:
+                entry=self._entries[key]=_PooledHandle(key,handle)
+            handle=self._lease(entry)
+            self._evict()
+            return handle
+
+
+    def release(self,handle):
+        """Returns a handle from `acquire` to the pool. Returns False if the handle didn't come from this pool."""
+        with self._lock:
+            leased=self._leased.get(id(handle))
+            if not leased: return False
+            entry=leased.pop()
+            if not leased: del self._leased[id(handle)]
+            entry.refs-=1
+            if entry.refs==0:
+                if entry.evicted: self.backend.close_key(entry.handle)
+                else: self._evict()
             return True
-        except OSError as e:
-            if e.winerror==2: return False
-            raise
 
 
-    def get(self):
-        """Returns the value or raises an exception if the key or value do not exist."""
-        handle=_open_key(self.path)
-        try:
-            self.value,self.type=winreg.QueryValueEx(handle,self.name)
-            if self.type==winreg.REG_EXPAND_SZ:
-                self.value=RegValue.ExpandingString(self.value)
-        finally:
-            handle.Close()
-        return self.value
+    def invalidate(self,hkey_constant,path):
+        """Drops the handles of the key and all keys below it, closing them once they're no longer in use."""
+        path=path.casefold()
+        prefix=path+'\\'
+        with self._lock:
+            for key in [key for key in self._entries if key[0]==hkey_constant and (key[1]==path or key[1].startswith(prefix))]:
+                self._remove(key)
 
 
-    def set(self,value,type=None):
-        """
-        Sets the value and creates the key if it doesn't exist.
-        If not provided, determines the type by examining the type of `value`:
-            str - REG_SZ
-            bytes - REG_BINARY
-            int - REG_DWORD
-        """
-        handle=winreg.CreateKey(self.path.hkey_constant,self.path.path)
-        if type is None: type=self._determine_value_type(value)
-        try:
-            winreg.SetValueEx(handle,self.name,0,type,value)
-            self.value=value
-            self.type=type
-        finally:
-            handle.Close()
+    def close_all(self):
+        """Drops every handle, closing them once they're no longer in use."""
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
 
 
-    def delete(self):
-        """Deletes a value. Just returns if it wasn't found or the key doesn't exist."""
-        handle=_open_key(self.path,winreg.KEY_WRITE,error_on_non_existent=False)
-        if not handle: return
-        _ignore_file_not_found_error(lambda:winreg.DeleteValue(handle,self.name),finallyFn=lambda:handle.Close())
+    def __len__(self):
+        return len(self._entries)
 
 
-    @classmethod
-    def _determine_value_type(cls,value):
-        # TODO: improve type handling and incorporate other types
-        if isinstance(value,bytes):
-            return winreg.REG_BINARY
-        if isinstance(value,RegValue.ExpandingString):
-            return winreg.REG_EXPAND_SZ
+    # ----------------------------------------
+    # helper methods
+    # ----------------------------------------
+    def _lease(self,entry):
+        entry.refs+=1
+        self._leased.setdefault(id(entry.handle),[]).append(entry)
+        return entry.handle
+
+    def _remove(self,key):
+        entry=self._entries.pop(key)
+        entry.evicted=True
+        if entry.refs==0: self.backend.close_key(entry.handle)
+
+    def _evict(self):
+        if len(self._entries)<=self.max_size: return
+        for key in [key for key,entry in self._entries.items() if entry.refs==0][:len(self._entries)-self.max_size]:
+            self._remove(key)
+
+
+
+
+# ----------------------------------------
+# Value cache
+# ----------------------------------------
+class ValueCache(object):
+    """
+    A thread-safe read-through cache of the values `RegValue.get` and `RegValue.exists` read from a backend, including
+    values that don't exist. Enable it by setting it as the backend's `value_cache`:
+
+        backend=get_backend()
+        backend.value_cache=ValueCache(backend,ttl=5)
+
+    Entries expire `ttl` seconds after they're read (never if it's None) and the least recently used are dropped once
+    there are more than `max_size`. Writes made through this library (`RegValue.set`, `RegValue.delete`,
+    `RegPath.delete`, transactions and copies) drop the entries they affect, but changes made by other processes are
+    only seen once entries expire. With `watch` True each key with cached values is watched instead (see
+    `RegPath.watch`, with `interval` for backends that are polled), its entries being dropped when it changes, so
+    `ttl` can be None. A key's watch is closed once it has no entries left. At most `max_watches` keys are watched,
+    the entries of any more expiring after `ttl` seconds, or `interval` if that's None.
+    """
+    _MISSING=object()
+
+    def __init__(self,backend,max_size=4096,ttl=1.0,watch=False,interval=1.0,max_watches=64):
+        self.backend=backend
+        self.max_size=max_size
+        self.ttl=ttl
+        self.watch=watch
+        self.interval=interval
+        self.max_watches=max_watches
+        self.hits=0
+        self.misses=0
+        self.evictions=0
+        # (hkey, casefolded path, casefolded name) -> (value, type, expiry time), least recently used first
+        self._entries=collections.OrderedDict()
+        # (hkey, casefolded path) -> the number of entries of the key, and -> its RegWatch, with `watch`
+        self._key_entries=collections.Counter()
+        self._watches={}
+        # bumped by every invalidation, so values read while one happens aren't stored
+        self._generation=0
+        self._lock=threading.Lock()
+
+
+    def get(self,hkey_constant,path,name,load):
+        """Returns the (value, type) of a value, calling `load` to read it if it isn't cached. Raises FileNotFoundError if it doesn't exist."""
+        # None and '' are both the default value
+        key=(hkey_constant,path.casefold(),(name or '').casefold())
+        with self._lock:
+            entry=self._entries.get(key)
+            if entry is not None and (entry[2] is None or entry[2]>time.monotonic()):
+                self.hits+=1
+                self._entries.move_to_end(key)
+                if entry[0] is self._MISSING: raise _registry_error(ERROR_FILE_NOT_FOUND,'The system cannot find the file specified')
+                return entry[0],entry[1]
+            self.misses+=1
+            generation=self._generation
+        # watch before reading so no change after the read is missed
+        if self.watch: self._watch(hkey_constant,path,key[:2])
+        try:
+            value,type=load()
+        except OSError as e:
+            if _winerror(e)!=ERROR_FILE_NOT_FOUND: raise
+            self._store(key,self._MISSING,None,generation)
+            raise
+        self._store(key,value,type,generation)
+        return value,type
+
+
+    def invalidate(self,hkey_constant,path,name=None):
+        """Drops the cached value `name`, or if it's None the values of the key and all keys below it."""
+        path=path.casefold()
+        prefix=path+'\\'
+        closing=[]
+        with self._lock:
+            self._generation+=1
+            if name is not None:
+                key=(hkey_constant,path,name.casefold())
+                if key in self._entries: self._remove(key,closing)
+            else:
+                for key in [key for key in self._entries if key[0]==hkey_constant and (key[1]==path or key[1].startswith(prefix))]:
+                    self._remove(key,closing)
+        for watch in closing: watch.close()
+
+
+    def clear(self):
+        """Drops every cached value and stops watching keys."""
+        with self._lock:
+            self._generation+=1
+            self._entries.clear()
+            self._key_entries.clear()
+            watches,self._watches=self._watches,{}
+        for watch in watches.values():
+            if watch is not None: watch.close()
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+    # ----------------------------------------
+    # helper methods
+    # ----------------------------------------
+    def _store(self,key,value,type,generation):
+        watch_key=key[:2]
+        closing=[]
+        with self._lock:
+            if generation!=self._generation:
+                # the key may have been watched just for this read
+                if not self._key_entries[watch_key]: self._unwatch(watch_key,closing)
+            else:
+                ttl=self.ttl
+                # keys beyond max_watches
+                if ttl is None and self.watch and watch_key not in self._watches: ttl=self.interval
+                if key not in self._entries: self._key_entries[watch_key]+=1
+                self._entries[key]=(value,type,None if ttl is None else time.monotonic()+ttl)
+                self._entries.move_to_end(key)
+                while len(self._entries)>self.max_size:
+                    self._remove(next(iter(self._entries)),closing)
+                    self.evictions+=1
+        for watch in closing: watch.close()
+
+    def _remove(self,key,closing):
+        """Drops an entry, adding its key's watch to `closing` if it was the key's last. Called with the lock held."""
+        del self._entries[key]
+        watch_key=key[:2]
+        self._key_entries[watch_key]-=1
+        if not self._key_entries[watch_key]:
+            del self._key_entries[watch_key]
+            self._unwatch(watch_key,closing)
+
+    def _unwatch(self,watch_key,closing):
+        watch=self._watches.pop(watch_key,None)
+        if watch is not None: closing.append(watch)
+
+    def _watch(self,hkey_constant,path,watch_key):
+        with self._lock:
+            if watch_key in self._watches or len(self._watches)>=self.max_watches: return
+            self._watches[watch_key]=None
+        watch=RegWatch(RegPath(path,hkey_constant,self.backend),interval=self.interval,debounce=0,callback=lambda change:self.invalidate(hkey_constant,path))
+        with self._lock:
+            if watch_key in self._watches:
+                self._watches[watch_key]=watch
+                return
+        # cleared while the watch was being set up
+        watch.close()
+
+
+
+
+# ----------------------------------------
+# Instrumentation
+# ----------------------------------------
+class OperationStats(object):
+    """
+    What `Instrumentation` has recorded for one backend primitive. `histogram[i]` counts the calls that took at most
+    `Instrumentation.LATENCY_BUCKETS[i]` seconds (and more than the bucket before), the last item those that took
+    longer. `bytes` is the value data read or written.
+    """
+    __slots__=('name','calls','errors','total_time','max_time','bytes','histogram')
+
+    def __init__(self,name):
+        self.name=name
+        self.calls=0
+        self.errors=0
+        self.total_time=0.0
+        self.max_time=0.0
+        self.bytes=0
+        self.histogram=[0]*(len(Instrumentation.LATENCY_BUCKETS)+1)
+
+    @property
+    def mean_time(self):
+        return self.total_time/self.calls if self.calls else 0.0
+
+    def __repr__(self):
+        return '<OperationStats {} calls={} errors={} total_time={:.6f} bytes={}>'.format(self.name,self.calls,self.errors,self.total_time,self.bytes)
+
+
+class Instrumentation(object):
+    """
+    Counts and times the primitive calls made to a backend, for seeing what high level operations cost:
+
+        with Instrumentation(backend) as stats:
+            RegPath(r'HKCU\\Software\\Example',backend=backend).delete(recurse=True)
+        print(stats['open_key'].calls,stats['delete_key'].total_time)
+
+    While enabled it observes the backend's primitives (see `_add_observer`), recording each call's count, latency (in
+    `OperationStats`) and value bytes, and calls each hook with (name, seconds, bytes, error) where `error` is the
+    exception raised, if one was. Disabled, it costs nothing.
+    """
+    PRIMITIVES=('open_key','create_key','close_key','enum_key','enum_value','enum_value_info','query_value','query_value_info',
+        'set_value','delete_key','delete_value','query_info_key','notify_change')
+    # upper bounds of the latency histogram buckets, in seconds
+    LATENCY_BUCKETS=(1e-6,1e-5,1e-4,1e-3,1e-2,1e-1,1.0)
+
+    def __init__(self,backend=None,hooks=()):
+        self.backend=backend if backend is not None else get_backend()
+        self.hooks=list(hooks)
+        self.stats={name:OperationStats(name) for name in self.PRIMITIVES}
+        self.enabled=False
+        self._lock=threading.Lock()
+
+
+    def enable(self):
+        """Starts recording calls."""
+        if self.enabled: return
+        _add_observer(self.backend,self)
+        self.enabled=True
+
+    def disable(self):
+        """Stops recording calls."""
+        if not self.enabled: return
+        _remove_observer(self.backend,self)
+        self.enabled=False
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self,*exc_info):
+        self.disable()
+
+
+    def add_hook(self,hook):
+        """Adds a function to call with (name, seconds, bytes, error) after every call, eg. to export metrics."""
+        self.hooks.append(hook)
+
+    def remove_hook(self,hook):
+        self.hooks.remove(hook)
+
+
+    def __getitem__(self,name):
+        """The `OperationStats` of the primitive `name`."""
+        return self.stats[name]
+
+    @property
+    def calls(self):
+        """The total number of calls recorded."""
+        return sum(stats.calls for stats in self.stats.values())
+
+    def counts(self):
+        """A dict of primitive name -> number of calls, for the primitives that have been called."""
+        return {name:stats.calls for name,stats in self.stats.items() if stats.calls}
+
+    def reset(self):
+        """Clears everything recorded so far."""
+        with self._lock:
+            self.stats={name:OperationStats(name) for name in self.PRIMITIVES}
+
+
+    # ----------------------------------------
+    # helper methods
+    # ----------------------------------------
+    def _observe(self,name,args,kwargs,result,error,elapsed):
+        size=_call_bytes(name,args,result) if error is None else 0
+        with self._lock:
+            stats=self.stats[name]
+            stats.calls+=1
+            if error is not None: stats.errors+=1
+            stats.total_time+=elapsed
+            if elapsed>stats.max_time: stats.max_time=elapsed
+            stats.bytes+=size
+            stats.histogram[bisect.bisect_left(self.LATENCY_BUCKETS,elapsed)]+=1
+        for hook in self.hooks:
+            hook(name,elapsed,size,error)
+
+
+# the primitives each `assert_backend_calls` budget counts
+_CALL_BUDGETS={
+    'open':('open_key','create_key'),
+    'close':('close_key',),
+    'enum':('enum_key','enum_value','enum_value_info'),
+    'query':('query_value','query_value_info','query_info_key'),
+    'set':('set_value',),
+    'delete':('delete_key','delete_value'),
+    'calls':Instrumentation.PRIMITIVES,
+}
+
+@contextlib.contextmanager
+def assert_backend_calls(backend=None,max_open=None,max_close=None,max_enum=None,max_query=None,max_set=None,max_delete=None,max_calls=None):
+    """
+    A context manager for tests that records the backend primitives the block calls and raises AssertionError when
+    the block exits if it made more calls than a budget allows:
+
+        with assert_backend_calls(max_open=1) as calls:
+            RegPath(r'HKCU\\Software\\Example').value('Name').get()
+        assert calls['query_value'].calls==1
+
+    `max_open` counts open_key and create_key, `max_enum` the enum_* primitives, `max_query` the query_* primitives,
+    `max_delete` delete_key and delete_value and `max_calls` everything. It yields the `Instrumentation` recording the
+    calls, which also has the names of the calls in order in `log`.
+    """
+    budgets={'open':max_open,'close':max_close,'enum':max_enum,'query':max_query,'set':max_set,'delete':max_delete,'calls':max_calls}
+    instrumentation=Instrumentation(backend)
+    instrumentation.log=[]
+    instrumentation.add_hook(lambda name,elapsed,size,error:instrumentation.log.append(name))
+    with instrumentation:
+        yield instrumentation
+    over=[]
+    for budget,limit in budgets.items():
+        if limit is None: continue
+        count=sum(instrumentation[name].calls for name in _CALL_BUDGETS[budget])
+        if count>limit: over.append('{} {} calls, more than the budget of {}'.format(count,budget,limit))
+    if over:
+        log=instrumentation.log if len(instrumentation.log)<=50 else instrumentation.log[:50]+['...']
+        raise AssertionError('{}. The calls were: {}'.format(', '.join(over),', '.join(log)))
+
+
+def _call_bytes(name,args,result):
+    """The value data bytes a primitive call read or wrote."""
+    if name=='query_value': return _value_size(*result)
+    if name=='enum_value': return _value_size(result[1],result[2])
+    if name=='set_value' and len(args)>=4: return _value_size(args[3],args[2])
+    return 0
+
+
+_observers_lock=threading.Lock()
+
+def _add_observer(backend,observer):
+    """
+    Has `observer._observe(name, args, kwargs, result, error, seconds)` called after every call to one of a backend's
+    primitives, `error` being the exception raised, if one was. While a backend has observers its primitives are
+    replaced, on that backend object only, by wrappers that call them all, so observers (`Instrumentation`s and
+    `TraceRecorder`s) can be added and removed in any order.
+    """
+    with _observers_lock:
+        observers=backend.__dict__.get('_observers')
+        if observers:
+            backend._observers=observers+(observer,)
+            return
+        backend._observers=(observer,)
+        # name -> the backend's own attribute that was replaced, or None if it was the class's method
+        backend._unobserved={}
+        for name in Instrumentation.PRIMITIVES:
+            backend._unobserved[name]=backend.__dict__.get(name)
+            setattr(backend,name,_observed(backend,name,getattr(backend,name)))
+
+def _remove_observer(backend,observer):
+    """Stops calling an observer added by `_add_observer`, putting the backend's methods back after its last one."""
+    with _observers_lock:
+        observers=tuple(o for o in backend.__dict__.get('_observers',()) if o is not observer)
+        if observers:
+            backend._observers=observers
+            return
+        for name,replaced in backend.__dict__.pop('_unobserved',{}).items():
+            if replaced is None: delattr(backend,name)
+            else: setattr(backend,name,replaced)
+        backend.__dict__.pop('_observers',None)
+
+def _observed(backend,name,method):
+    perf_counter=time.perf_counter
+    def wrapper(*args,**kwargs):
+        start=perf_counter()
+        try:
+            result=method(*args,**kwargs)
+        except BaseException as e:
+            elapsed=perf_counter()-start
+            for observer in backend.__dict__.get('_observers',()): observer._observe(name,args,kwargs,None,e,elapsed)
+            raise
+        elapsed=perf_counter()-start
+        for observer in backend.__dict__.get('_observers',()): observer._observe(name,args,kwargs,result,None,elapsed)
+        return result
+    wrapper.__wrapped__=method
+    return wrapper
+
+
+
+_default_backend=None
+
+def get_backend():
+    """Returns the backend used by paths that weren't given one, which is a `WinregBackend` unless `set_backend` has been called."""
+    global _default_backend
+    if _default_backend is None: _default_backend=WinregBackend()
+    return _default_backend
+
+def set_backend(backend):
+    """Sets the backend used by paths that weren't given one and returns the previous one (pass None to go back to `WinregBackend`)."""
+    global _default_backend
+    previous,_default_backend=_default_backend,backend
+    return previous
+
+
+
+# ----------------------------------------
+# RegPath class
+# ----------------------------------------
+class RegPath(object):
+    """
+    Represents a particular path in the registry.
+
+    Paths are immutable and hashable, and compare equal (ignoring their backend) when they're the same path ignoring
+    case. They hold just their path string, `name`, `parent` and `parts` being worked out on first use and then kept,
+    so an inventory of millions of paths doesn't also keep every key above them or a copy of each name.
+    """
+    # `_key` is the casefolded path and `_derived` None or a list of the name, parent and parts as they're worked out
+    __slots__=('hkey_constant','path','_backend','_key','_derived')
+
+    HKEY_CONSTANTS={
+        'HKEY_CURRENT_USER':HKEY_CURRENT_USER,
+        'HKEY_LOCAL_MACHINE':HKEY_LOCAL_MACHINE,
+        'HKEY_CLASSES_ROOT':HKEY_CLASSES_ROOT,
+        'HKEY_USERS':HKEY_USERS,
+        'HKEY_CURRENT_CONFIG':HKEY_CURRENT_CONFIG,
+    }
+    HKEY_CONSTANTS_SHORT={
+        'HKCU':HKEY_CURRENT_USER,
+        'HKLM':HKEY_LOCAL_MACHINE,
+        'HKCR':HKEY_CLASSES_ROOT,
+        'HKU':HKEY_USERS,
+        'HKCC':HKEY_CURRENT_CONFIG,
+    }
+    HKEY_CONSTANTS.update(HKEY_CONSTANTS_SHORT)
+    HKEYS={value:key for key,value in HKEY_CONSTANTS.items()}
+    for key,value in HKEY_CONSTANTS_SHORT.items(): HKEYS[value]=key
+    UNSET_VALUE=object()
+
+
+    # ----------------------------------------
+    # Construction
+    # ----------------------------------------
+    def __init__(self,path,hkey_constant=None,backend=None):
+        # accept RegPath objects
+        if isinstance(path,RegPath):
+            _set=object.__setattr__
+            _set(self,'hkey_constant',hkey_constant if hkey_constant else path.hkey_constant)
+            _set(self,'path',path.path)
+            _set(self,'_backend',backend if backend is not None else path._backend)
+            _set(self,'_key',path._key)
+            _set(self,'_derived',None)
+        else:
+            # and strings
+            path=path.rstrip('\\')
+            if not hkey_constant:
+                hkey_constant,path=self._split_path(path)
+            self._init(hkey_constant,path,backend)
+
+
+    def _init(self,hkey_constant,path,backend):
+        _set=object.__setattr__
+        _set(self,'hkey_constant',hkey_constant)
+        _set(self,'path',path)
+        _set(self,'_backend',backend)
+        _set(self,'_key',None)
+        _set(self,'_derived',None)
+
+
+    def __truediv__(self,path):
+        """
+        Creates a new reg path by appending the given path component.
+
+            p=RegPath(r'HKCU\\Software')/'longer'
+            assert p.name=='longer'
+        """
+        if '\\' in path: path='\\'.join(name for name in path.split('\\') if name)
+        p=RegPath.__new__(RegPath)
+        p._init(self.hkey_constant,self.path+'\\'+path if self.path and path else self.path or path,self._backend)
+        return p
+
+
+    def __setattr__(self,name,value):
+        raise AttributeError('RegPath objects are immutable')
+
+    def __delattr__(self,name):
+        raise AttributeError('RegPath objects are immutable')
+
+
+    # ----------------------------------------
+    # properties
+    # ----------------------------------------
+    @property
+    def hkey(self):
+        """Short string version of this path's HKEY."""
+        return self.HKEYS[self.hkey_constant]
+
+    @property
+    def name(self):
+        """The key name, or an empty string for the root of a HKEY."""
+        derived=self._derive()
+        if derived[0] is None: derived[0]=self.path.rsplit('\\',1)[-1]
+        return derived[0]
+
+    @property
+    def parent(self):
+        """A `RegPath` object that is the parent of this key. The root of a HKEY is its own parent."""
+        derived=self._derive()
+        if derived[1] is None:
+            if self.path:
+                parent=RegPath.__new__(RegPath)
+                parent._init(self.hkey_constant,self.path.rsplit('\\',1)[0] if '\\' in self.path else '',self._backend)
+            else:
+                parent=self
+            derived[1]=parent
+        return derived[1]
+
+    @property
+    def parts(self):
+        """A tuple of the key names that make up the path, not including the HKEY."""
+        derived=self._derive()
+        if derived[2] is None: derived[2]=tuple(self.path.split('\\')) if self.path else ()
+        return derived[2]
+
+    @property
+    def backend(self):
+        """The `Backend` this path dispatches through, the default backend (see `get_backend`) if it wasn't given one."""
+        return self._backend if self._backend is not None else get_backend()
+
+
+    # ----------------------------------------
+    # Key manipulation
+    # ----------------------------------------
+    def exists(self):
+        """Returns True if the key exists."""
+        # open (and then close) the key to see if it exists
+        try:
+            handle=_open_key(self)
+        except OSError as e:
+            if _winerror(e)==ERROR_FILE_NOT_FOUND: return False
+            raise
+        else:
+            _close_key(self,handle)
+            return True
+
+
+    def create(self):
+        """Ensures the key (and all parent keys) exist, creating them if they don't."""
+        # this either creates the key (and all parent keys) if it doesn't exist or just opens the handle if it does
+        handle=_open_key(self,KEY_WRITE,create=True)
+        _close_key(self,handle)
+
+
+    def delete(self,recurse=False,workers=None):
+        """
+        Deletes an existing key and any values it has. Will only delete subkeys if `recurse` is True otherwise will error.
+        The subkeys of each key are deleted through one handle to it, and with `workers` the subtrees of this key's
+        subkeys are deleted in parallel by that many threads, which helps with very wide trees.
+        """
+        backend=self.backend
+        if backend.handle_pool is not None: backend.handle_pool.invalidate(self.hkey_constant,self.path)
+        parent=self.parent
+        handle=_open_key(parent,error_on_non_existent=False)
+        if not handle: return
+        try:
+            # delete subkeys if recurse
+            if recurse:
+                # deleting subkeys by name only needs the handle to their parent to be readable
+                key_handle=_ignore_file_not_found_error(lambda:backend.open_key(handle,self.name,KEY_READ))
+                if key_handle is None: return
+                try:
+                    if workers and workers>1: _delete_subkeys_parallel(backend,key_handle,workers)
+                    else: _delete_subkeys(backend,key_handle)
+                finally:
+                    backend.close_key(key_handle)
+            # then delete this key, ignoring it not existing
+            _ignore_file_not_found_error(lambda:backend.delete_key(handle,self.name))
+        finally:
+            _close_key(parent,handle)
+            _invalidate_values(self)
+
+
+    def subkeys(self):
+        """A generator that yields a `RegPath` for each subkey in this key"""
+        # open the key and make sure it exists
+        backend=self.backend
+        handle=_open_key(self)
+        try:
+            for name in _iter_subkey_names(backend,handle):
+                yield self/name
+        finally:
+            _close_key(self,handle)
+
+
+    def subvalues(self,data=True):
+        """
+        A generator that yields a `RegValue` for each subvalue in this key. With `data` False only the names, types and
+        sizes are read, each value's data being read when its `value` is first used.
+        """
+        # open the key and make sure it exists
+        backend=self.backend
+        handle=_open_key(self)
+        try:
+            yield from self._values(backend,handle,data)
+        finally:
+            _close_key(self,handle)
+
+
+    def walk(self,topdown=True,max_depth=None,onerror=None,data=True):
+        """
+        A generator that walks the tree of keys below (and including) this key, like `os.walk`. Yields a
+        (path, subkey_names, values) tuple for each key, where `path` is a `RegPath`, `subkey_names` a list of subkey
+        names and `values` a list of `RegValue` objects.
+
+        When `topdown` is True a key is yielded before its subkeys and the caller can prune the walk by removing names
+        from `subkey_names`. `max_depth` limits how far below this key to go (0 only yields this key). Errors raise,
+        unless `onerror` is given, in which case it's called with the OSError and the walk carries on without that key.
+
+        Only one handle is held per level, with each subkey opened relative to its parent's handle. With `data` False
+        the values' data isn't read until it's used, as with `subvalues`.
+        """
+        backend=self.backend
+        try:
+            handle=_open_key(self)
+        except OSError as e:
+            if onerror is None: raise
+            onerror(e)
+            return
+        try:
+            yield from self._walk(backend,handle,0,topdown,max_depth,onerror,data)
+        finally:
+            _close_key(self,handle)
+
+
+    def info(self):
+        """Returns a `KeyInfo` for this key, without enumerating it."""
+        backend=self.backend
+        handle=_open_key(self)
+        try:
+            return backend.query_info_key(handle)
+        finally:
+            _close_key(self,handle)
+
+    def subkey_count(self):
+        """The number of subkeys in this key."""
+        return self.info().subkey_count
+
+    def value_count(self):
+        """The number of values in this key."""
+        return self.info().value_count
+
+    def last_write_time(self):
+        """When this key (its values or its list of subkeys) was last written to, as a Windows FILETIME (100ns intervals since 1601-01-01)."""
+        return self.info().last_write
+
+    def __len__(self):
+        """The number of subkeys and values in this key."""
+        info=self.info()
+        return info.subkey_count+info.value_count
+
+    def __bool__(self):
+        # paths are always true, even though they have a length
+        return True
+
+
+    def export_reg(self,fileobj,recursive=True):
+        """
+        Writes this key (and its subkeys if `recursive` is True) to a REGEDIT5 (UTF-16) .reg file. `fileobj` is a file
+        name or a file object opened in binary mode. Keys are written as they're walked so the tree is never held in
+        memory.
+        """
+        if isinstance(fileobj,str):
+            with open(fileobj,'wb') as fout:
+                return self.export_reg(fout,recursive)
+        fout=io.TextIOWrapper(fileobj,encoding='utf-16-le',newline='\r\n')
+        try:
+            fout.write('\ufeffWindows Registry Editor Version 5.00\n')
+            for path,names,values in self.walk(max_depth=None if recursive else 0):
+                fout.write('\n[{}]\n'.format(path._reg_name()))
+                for value in values:
+                    fout.write(_format_reg_value(value.name,value.value,value.type))
+            fout.write('\n')
+            fout.flush()
+        finally:
+            # leave the caller's file open
+            fout.detach()
+
+
+    def watch(self,recursive=False,filter=REG_NOTIFY_CHANGE_NAME|REG_NOTIFY_CHANGE_LAST_SET,interval=1.0,debounce=0.1,callback=None):
+        """
+        Watches this key (and everything below it if `recursive` is True) for changes. Returns a `RegWatch`, an
+        iterator (or async iterator) of `RegChange` events, see `RegWatch` for the details.
+        """
+        return RegWatch(self,recursive,filter,interval,debounce,callback)
+
+
+    def glob(self,pattern):
+        """
+        A generator that yields a `RegPath` for each key below this one matching `pattern`, like `pathlib.Path.glob`.
+        Components are separated by backslashes and matched ignoring case, with `*`, `?` and `[...]` wildcards, and
+        `**` matching this key and every key below it. Literal components are opened directly rather than enumerated,
+        so only the levels with wildcards are listed. Keys that can't be opened are skipped.
+        """
+        parts=_compile_glob(pattern)
+        backend=self.backend
+        handle=_open_key(self,error_on_non_existent=False)
+        if not handle: return
+        try:
+            seen=set() if parts.count('**')>1 else None
+            yield from self._glob(backend,handle,parts,0,seen)
+        finally:
+            _close_key(self,handle)
+
+    def rglob(self,pattern):
+        """Like `glob` with `**\\` in front of `pattern`, so matching keys at any depth below this one."""
+        return self.glob('**\\'+pattern)
+
+
+    def search(self,pattern,in_names=True,in_data=True,types=None,limit=None,ignore_case=True,workers=4,onerror=None):
+        """
+        A generator that yields a `RegValue` for each value in this key, or below it, whose name or data matches
+        `pattern` (a regular expression string or compiled pattern, searched for anywhere in the text). String and
+        multi-string data are matched as text and integers as their decimal digits, binary data isn't matched. `types`
+        limits the search to values of those types, and the search stops once `limit` values have matched.
+
+        The tree is walked in parallel like `scan`, with `workers` threads, without reading data. Values are filtered by
+        `types` and their names matched first, and only the data of the text and integer values left is then read, with
+        one open of each key, so a value whose name matches is yielded without its data being read (it's read if it's
+        used). Matches are yielded as they're found (so in no particular order).
+        """
+        if isinstance(pattern,str): pattern=re.compile(pattern,re.IGNORECASE if ignore_case else 0)
+        if types is not None: types=frozenset(types)
+        if limit is not None and limit<=0: return
+        count=0
+        with self.scan(workers=workers,onerror=onerror,data=False) as scan:
+            for path,names,values in scan:
+                matches,unmatched=[],[]
+                for value in values:
+                    if types is not None and value.type not in types: continue
+                    if in_names and pattern.search(value.name): matches.append(value)
+                    elif in_data and value.type in _SEARCHABLE_TYPES: unmatched.append(value)
+                if unmatched:
+                    try:
+                        data=path.get_values([value.name for value in unmatched])
+                    except OSError as e:
+                        # the key was deleted since it was walked
+                        if _winerror(e)==ERROR_FILE_NOT_FOUND: data={}
+                        elif onerror is not None:
+                            onerror(e)
+                            data={}
+                        else:
+                            raise
+                    for value in unmatched:
+                        value_data,type=data.get(value.name,(RegPath.UNSET_VALUE,None))
+                        if value_data is RegPath.UNSET_VALUE or (types is not None and type not in types): continue
+                        if not _search_data(pattern,value_data,type): continue
+                        value.value,value.type=value_data,type
+                        matches.append(value)
+                for value in matches:
+                    yield value
+                    count+=1
+                    if count==limit: return
+
+
+    def copy_to(self,dest,recursive=True):
+        """
+        Copies this key's values (and its subkeys if `recursive` is True) to `dest`, creating keys as needed. Values
+        already at the destination are overwritten and anything else there is left alone. `dest` is a `RegPath`, which
+        can be of another backend (eg. from a `HiveBackend` to the registry), or a path string of this path's backend.
+        Values are written as they're read, through one handle to each key on both sides. Returns the destination
+        `RegPath`.
+        """
+        if not isinstance(dest,RegPath): dest=RegPath(dest,backend=self._backend)
+        backend,dest_backend=self.backend,dest.backend
+        if backend is dest_backend and self._is_within(dest):
+            raise ValueError('Can\'t copy {} into itself'.format(self))
+        handle=_open_key(self)
+        try:
+            dest_handle=dest_backend.create_key(dest.hkey_constant,dest.path,KEY_WRITE)
+            try:
+                _copy_key(backend,handle,dest_backend,dest_handle,recursive)
+            finally:
+                dest_backend.close_key(dest_handle)
+                _invalidate_values(dest)
+        finally:
+            _close_key(self,handle)
+        return dest
+
+    def move_to(self,dest):
+        """Moves this key and everything below it to `dest` (see `copy_to`), then deletes it. Returns the destination `RegPath`."""
+        dest=self.copy_to(dest)
+        self.delete(recurse=True)
+        return dest
+
+    def rename(self,name):
+        """Moves this key to `name` under the same parent. Returns the renamed `RegPath`."""
+        return self.move_to(self.parent/name)
+
+
+    def snapshot(self):
+        """Captures this key and everything below it in a `RegSnapshot`, to compare with another one using `diff`."""
+        backend=self.backend
+        handle=_open_key(self)
+        try:
+            return RegSnapshot(self,_snapshot_key(backend,handle,self.name))
+        finally:
+            _close_key(self,handle)
+
+
+    def scan(self,workers=4,ordered=False,max_depth=None,onerror=None,queue_size=1024,data=True):
+        """
+        Like `walk` (top down), but the subtrees of this key's subkeys are walked in parallel on a pool of `workers`
+        threads. Returns a `RegScan`, an iterator of (path, subkey_names, values) tuples that can be cancelled.
+
+        Results are yielded in the order they're found, unless `ordered` is True, in which case they're in the same
+        order as `walk`. Workers block once `queue_size` results are waiting to be consumed. `onerror` is called from
+        the worker threads. Walks can't be pruned by editing `subkey_names`. `data` is as for `walk`.
+        """
+        return RegScan(self,workers,ordered,max_depth,onerror,queue_size,data)
+
+
+    # ----------------------------------------
+    # Value manipulation
+    # ----------------------------------------
+    def value(self,name):
+        """Returns a `RegValue` object for the value `name` at this path."""
+        return RegValue(self,name)
+
+
+    def get_values(self,names):
+        """
+        Opens the key once and returns a dict of name -> (value, type) for each of `names`. Names that don't exist are
+        reported as (RegPath.UNSET_VALUE, None) rather than raising. Raises an exception if the key doesn't exist.
+        """
+        backend=self.backend
+        handle=_open_key(self)
+        try:
+            values={}
+            for name in names:
+                try:
+                    value,type=backend.query_value(handle,name)
+                except OSError as e:
+                    if _winerror(e)!=ERROR_FILE_NOT_FOUND: raise
+                    values[name]=(self.UNSET_VALUE,None)
+                    continue
+                values[name]=(RegValue._wrap(value,type),type)
+            return values
+        finally:
+            _close_key(self,handle)
+
+
+    def read_all(self):
+        """Opens the key once and returns a dict of name -> (value, type) for every value in it. Raises an exception if the key doesn't exist."""
+        backend=self.backend
+        handle=_open_key(self)
+        try:
+            values={}
+            for (name,value,type) in _iter_values(backend,handle):
+                values[name]=(RegValue._wrap(value,type),type)
+            return values
+        finally:
+            _close_key(self,handle)
+
+
+    # ----------------------------------------
+    # helper methods
+    # ----------------------------------------
+    def _values(self,backend,handle,data):
+        """Yields a `RegValue` for each value of the open key, with its data or, if `data` is False, with it to load."""
+        if data:
+            for (name,value,type) in _iter_values(backend,handle):
+                yield RegValue(self,name,RegValue._wrap(value,type),type)
+        else:
+            for (name,type,size) in _iter_value_infos(backend,handle):
+                yield RegValue(self,name,RegValue._UNLOADED,type,size)
+
+
+    def _walk(self,backend,handle,depth,topdown,max_depth,onerror,data):
+        try:
+            subkey_names=list(_iter_subkey_names(backend,handle))
+            values=list(self._values(backend,handle,data))
+        except OSError as e:
+            if onerror is None: raise
+            onerror(e)
+            return
+        if topdown: yield self,subkey_names,values
+        if max_depth is None or depth<max_depth:
+            for name in subkey_names:
+                try:
+                    child_handle=backend.open_key(handle,name,KEY_READ)
+                except OSError as e:
+                    if onerror is None: raise
+                    onerror(e)
+                    continue
+                try:
+                    yield from (self/name)._walk(backend,child_handle,depth+1,topdown,max_depth,onerror,data)
+                finally:
+                    backend.close_key(child_handle)
+        if not topdown: yield self,subkey_names,values
+
+
+    @classmethod
+    def _split_path(cls,keyPath):
+        hkey,_,path=keyPath.partition('\\')
+        if hkey not in cls.HKEY_CONSTANTS:
+            raise Exception('HKEY not recognised: {}'.format(hkey))
+        return cls.HKEY_CONSTANTS[hkey],path
+
+
+    def _glob(self,backend,handle,parts,i,seen):
+        if i==len(parts):
+            if seen is None: yield self
+            elif self not in seen:
+                seen.add(self)
+                yield self
+            return
+        part=parts[i]
+        if part=='**':
+            # matching no keys then each subkey, which carries on matching the `**`
+            yield from self._glob(backend,handle,parts,i+1,seen)
+            names,i_next=_iter_subkey_names(backend,handle),i
+        elif isinstance(part,str):
+            names,i_next=(part,),i+1
+        else:
+            names,i_next=(name for name in _iter_subkey_names(backend,handle) if part.match(name)),i+1
+        for name in list(names):
+            try:
+                child_handle=backend.open_key(handle,name,KEY_READ)
+            except (FileNotFoundError,PermissionError):
+                continue
+            try:
+                yield from (self/name)._glob(backend,child_handle,parts,i_next,seen)
+            finally:
+                backend.close_key(child_handle)
+
+
+    def _is_within(self,path):
+        """Whether `path` is this path or below it."""
+        if path.hkey_constant!=self.hkey_constant: return False
+        folded,path_folded=self.path.casefold(),path.path.casefold()
+        return not folded or path_folded==folded or path_folded.startswith(folded+'\\')
+
+
+    def _reg_name(self):
+        """The path with the full HKEY name, as used in .reg files."""
+        hkey=_HKEY_NAMES[self.hkey_constant]
+        return hkey+'\\'+self.path if self.path else hkey
+
+
+    def _casefolded(self):
+        """The casefolded path that equality and hashing use, with the HKEY."""
+        if self._key is None:
+            object.__setattr__(self,'_key',self.path.casefold())
+        return self._key
+
+    def _derive(self):
+        """The list `name`, `parent` and `parts` are kept in once they're worked out, made on first use."""
+        if self._derived is None:
+            object.__setattr__(self,'_derived',[None,None,None])
+        return self._derived
+
+
+    def __str__(self):
+        return '{}\\{}'.format(self.HKEYS[self.hkey_constant],self.path)
+
+    def __repr__(self):
+        return 'RegPath({!r})'.format(str(self))
+
+    def __eq__(self,other):
+        if not isinstance(other,RegPath): return NotImplemented
+        return self is other or (self.hkey_constant==other.hkey_constant and self._casefolded()==other._casefolded())
+
+    def __hash__(self):
+        # strings keep their hash, so this doesn't rehash the path
+        return hash((self.hkey_constant,self._casefolded()))
+
+    def __reduce__(self):
+        return (RegPath,(self.path,self.hkey_constant,self._backend))
+
+
+
+# ----------------------------------------
+# RegValue class
+# ----------------------------------------
+class RegValue(object):
+    """
+    Represents a value at a particular path in the registry.
+
+    Values are read as winreg returns them, except that types which `set` couldn't tell from the Python type are
+    returned as one of the marker subclasses below (`ExpandingString`, `QWord`, `MultiString` and `DWordBigEndian`), so
+    what's read can be written back as the same type.
+    """
+
+    class ExpandingString(str):
+        """Subclass of `str` that indicates the reg type to use: `REG_EXPAND_SZ`"""
+        def __init__(self,value):
+            # somehow, magically, `value` is extended and not needed to be passed to the constructor
+            super(RegValue.ExpandingString,self).__init__()
+
+    class QWord(int):
+        """Subclass of `int` that indicates the reg type to use: `REG_QWORD`"""
+
+    class DWordBigEndian(int):
+        """Subclass of `int` that indicates the reg type to use: `REG_DWORD_BIG_ENDIAN`"""
+
+    class MultiString(list):
+        """Subclass of `list` (of `str`) that indicates the reg type to use: `REG_MULTI_SZ`"""
+
+
+    # the value of values whose data hasn't been read yet
+    _UNLOADED=object()
+
+    def __init__(self,path,name,value=None,type=None,size=None):
+        self.path=path
+        self.name=name
+        self.value=value
+        self.type=type
+        self.size=size
+
+
+    @property
+    def value(self):
+        """The value as last read or set. Values from `RegPath.subvalues(data=False)` are read when this is first used."""
+        if self._value is RegValue._UNLOADED: self.get()
+        return self._value
+
+    @value.setter
+    def value(self,value):
+        self._value=value
+
+
+    def stat(self):
+        """Returns a `ValueInfo` with the value's name, type and data size, without reading the data. Raises an exception if the key or value do not exist."""
+        backend=self.path.backend
+        handle=_open_key(self.path)
+        try:
+            self.type,self.size=backend.query_value_info(handle,self.name)
+        finally:
+            _close_key(self.path,handle)
+        return ValueInfo(self.name,self.type,self.size)
+
+
+    def exists(self):
+        """Checks the value exists, with `stat` so its data isn't read (unless the backend has a value cache, which reads it)."""
+        try:
+            if self.path.backend.value_cache is None: self.stat()
+            else: self.get()
+            return True
+        except OSError as e:
+            if _winerror(e)==ERROR_FILE_NOT_FOUND: return False
+            raise
+
+
+    def get(self):
+        """Returns the value or raises an exception if the key or value do not exist."""
+        cache=self.path.backend.value_cache
+        if cache is None: self.value,self.type=self._query()
+        else: self.value,self.type=cache.get(self.path.hkey_constant,self.path.path,self.name,self._query)
+        return self.value
+
+    def _query(self):
+        backend=self.path.backend
+        handle=_open_key(self.path)
+        try:
+            value,type=backend.query_value(handle,self.name)
+            return RegValue._wrap(value,type),type
+        finally:
+            _close_key(self.path,handle)
+
+
+    def set(self,value,type=None):
+        """
+        Sets the value and creates the key if it doesn't exist.
+        If not provided, determines the type by examining the type of `value`:
+            ExpandingString, QWord, DWordBigEndian, MultiString - the type they mark
+            str - REG_SZ
+            bytes, bytearray, memoryview - REG_BINARY
+            int - REG_DWORD, or REG_QWORD if it doesn't fit in 32 bits
+            list or tuple of str - REG_MULTI_SZ
+            None - REG_NONE
+        Raises TypeError for anything else.
+        """
+        backend=self.path.backend
+        if type is None: type=self._determine_value_type(value)
+        data=self._encode(value,type)
+        handle=_open_key(self.path,KEY_WRITE,create=True)
+        try:
+            backend.set_value(handle,self.name,type,data)
+            self.value=value
+            self.type=type
+        finally:
+            _close_key(self.path,handle)
+            _invalidate_values(self.path,self.name)
+
+
+    def delete(self):
+        """Deletes a value. Just returns if it wasn't found or the key doesn't exist."""
+        backend=self.path.backend
+        handle=_open_key(self.path,KEY_WRITE,error_on_non_existent=False)
+        if not handle: return
+        _ignore_file_not_found_error(lambda:backend.delete_value(handle,self.name),finallyFn=lambda:_close_key(self.path,handle))
+        _invalidate_values(self.path,self.name)
+
+
+    def view(self):
+        """Returns the data of a binary value as a read-only `memoryview`, getting the value if it hasn't been. Doesn't copy the data."""
+        if self.type is None: self.get()
+        if not isinstance(self.value,(bytes,bytearray,memoryview)):
+            raise TypeError('The {!r} value isn\'t binary data'.format(self.name))
+        return memoryview(self.value).toreadonly()
+
+    def as_array(self,type=REG_DWORD):
+        """
+        Returns the data of a binary value as a `memoryview` of packed unsigned DWORDs (or QWORDs with `type` REG_QWORD),
+        without copying it. Items are in the machine's byte order, which is the registry's on Windows.
+        """
+        view=self.view()
+        itemsize=_ARRAY_ITEM_SIZES[type]
+        if len(view)%itemsize: raise ValueError('{} bytes of data isn\'t a whole number of {} byte items'.format(len(view),itemsize))
+        return view.cast('I' if itemsize==4 else 'Q')
+
+    def as_numpy(self,dtype='<u4'):
+        """
+        Returns the data of a binary value as a read-only NumPy array of `dtype` (which can be a structured dtype for
+        records), without copying it. Needs NumPy.
+        """
+        if numpy is None: raise ImportError('as_numpy needs numpy')
+        return numpy.frombuffer(self.view(),dtype=dtype)
+
+
+    @classmethod
+    def _determine_value_type(cls,value):
+        for marker,type in _MARKER_TYPES:
+            if isinstance(value,marker): return type
+        if value is None:
+            return REG_NONE
+        if isinstance(value,(bytes,bytearray,memoryview)):
+            return REG_BINARY
         if isinstance(value,str):
-            return winreg.REG_SZ
+            return REG_SZ
         if isinstance(value,int):
-            return winreg.REG_DWORD
+            if value<0 or value>0xFFFFFFFFFFFFFFFF: raise OverflowError('{} is outside the range of the registry\'s integer types, 0 to 2**64-1'.format(value))
+            return REG_DWORD if value<=0xFFFFFFFF else REG_QWORD
+        if isinstance(value,(list,tuple)) and all(isinstance(s,str) for s in value):
+            return REG_MULTI_SZ
+        raise TypeError('Can\'t determine the registry type of a {}, pass the type'.format(value.__class__.__name__))
+
+    @classmethod
+    def _encode(cls,value,type):
+        """Converts a value to what winreg accepts for the type."""
+        if type==REG_DWORD_BIG_ENDIAN and isinstance(value,int):
+            return value.to_bytes(4,'big')
+        if type==REG_MULTI_SZ and isinstance(value,tuple):
+            return list(value)
+        return value
+
+    @classmethod
+    def _wrap(cls,value,type):
+        """Marks a value read from the registry with its type, where the Python type alone wouldn't tell it."""
+        if value is None: return value
+        if type==REG_EXPAND_SZ: return RegValue.ExpandingString(value)
+        if type==REG_QWORD: return RegValue.QWord(value)
+        if type==REG_MULTI_SZ: return RegValue.MultiString(value)
+        if type==REG_DWORD_BIG_ENDIAN and isinstance(value,(bytes,bytearray)) and len(value)==4:
+            return RegValue.DWordBigEndian(int.from_bytes(value,'big'))
+        return value
+
+
+_MARKER_TYPES=(
+    (RegValue.ExpandingString,REG_EXPAND_SZ),
+    (RegValue.QWord,REG_QWORD),
+    (RegValue.DWordBigEndian,REG_DWORD_BIG_ENDIAN),
+    (RegValue.MultiString,REG_MULTI_SZ),
+)
+_ARRAY_ITEM_SIZES={REG_DWORD:4,REG_QWORD:8}
+
+
+
+# ----------------------------------------
+# Transactions
+# ----------------------------------------
+class RegTransaction(object):
+    """
+    Queues writes and applies them together, through one handle per key, when committed:
+
+        with RegTransaction() as tx:
+            tx.set('HKCU\\Software\\Example','Name','value')
+            tx.delete('HKCU\\Software\\Example','Old')
+
+    Writes to the same value are coalesced so only the last one is applied. The values each write replaces are
+    journalled as it's applied and if applying fails part way, the journal is used to put back the values and delete
+    the keys the transaction created before the exception is re-raised. Leaving the `with` block because of an
+    exception discards the queued writes without applying them.
+
+    This isn't atomic to other readers and writers of the registry, which can see the writes being applied.
+    """
+
+    def __init__(self,backend=None):
+        self.backend=backend if backend is not None else get_backend()
+        # RegPath -> {casefolded value name: (name, type, value)}, a type of None means delete the value
+        self._keys={}
+
+
+    def set(self,path,name,value,type=None):
+        """Queues setting a value, creating the key if it doesn't exist. Determines the type like `RegValue.set` if not given."""
+        if type is None: type=RegValue._determine_value_type(value)
+        # None and '' are both the default value
+        name=name or ''
+        self._key(path)[name.casefold()]=(name,type,RegValue._encode(value,type))
+
+    def delete(self,path,name):
+        """Queues deleting a value. Deleting a value that doesn't exist does nothing."""
+        name=name or ''
+        self._key(path)[name.casefold()]=(name,None,None)
+
+    def create(self,path):
+        """Queues creating a key (and all parent keys) if it doesn't exist."""
+        self._key(path)
+
+    def __len__(self):
+        """The number of queued operations after coalescing."""
+        return sum(max(1,len(values)) for values in self._keys.values())
+
+
+    def commit(self):
+        """Applies the queued writes, rolling them back if any fail. Returns the number of operations applied."""
+        keys,self._keys=self._keys,{}
+        count=0
+        # (path, name, old value, old type) for each value written and the keys created, in the order they were
+        journal=[]
+        created=[]
+        try:
+            for path,values in keys.items():
+                count+=self._apply(path,values,journal,created)
+        except BaseException:
+            self._rollback(journal,created)
+            raise
+        return count
+
+    def rollback(self):
+        """Discards the queued writes."""
+        self._keys={}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        if exc_type is None: self.commit()
+        else: self.rollback()
+
+
+    # ----------------------------------------
+    # helper methods
+    # ----------------------------------------
+    def _key(self,path):
+        path=RegPath(path,backend=self.backend)
+        values=self._keys.get(path)
+        if values is None: values=self._keys[path]={}
+        return values
+
+    def _apply(self,path,values,journal,created):
+        backend=self.backend
+        creates=any(type is not None for name,type,value in values.values()) or not values
+        handle=_ignore_file_not_found_error(lambda:backend.open_key(path.hkey_constant,path.path,KEY_READ|KEY_WRITE))
+        if handle is None:
+            # only deleting values, of a key that doesn't exist
+            if not creates: return len(values)
+            created.append(self._first_missing(path))
+            handle=backend.create_key(path.hkey_constant,path.path,KEY_READ|KEY_WRITE)
+        try:
+            for name,type,value in values.values():
+                try:
+                    old_value,old_type=backend.query_value(handle,name)
+                except OSError as e:
+                    if _winerror(e)!=ERROR_FILE_NOT_FOUND: raise
+                    old_value,old_type=None,None
+                    # deleting a value that's already gone
+                    if type is None: continue
+                journal.append((path,name,old_value,old_type))
+                try:
+                    if type is None: backend.delete_value(handle,name)
+                    else: backend.set_value(handle,name,type,value)
+                finally:
+                    _invalidate_values(path,name)
+        finally:
+            backend.close_key(handle)
+        return max(1,len(values))
+
+    def _first_missing(self,path):
+        """The top most key that `create_key` on `path` will create."""
+        while True:
+            parent=path.parent
+            if parent is path or parent.exists(): return path
+            path=parent
+
+    def _rollback(self,journal,created):
+        backend=self.backend
+        for path,name,value,type in reversed(journal):
+            try:
+                handle=backend.open_key(path.hkey_constant,path.path,KEY_WRITE)
+                try:
+                    if type is None: _ignore_file_not_found_error(lambda:backend.delete_value(handle,name))
+                    else: backend.set_value(handle,name,type,value)
+                finally:
+                    backend.close_key(handle)
+                    _invalidate_values(path,name)
+            except OSError:
+                # keep restoring the rest, the original exception is the one that's raised
+                pass
+        for path in reversed(created):
+            try:
+                path.delete(recurse=True)
+            except OSError:
+                pass
+
+
+
+# ----------------------------------------
+# Snapshots
+# ----------------------------------------
+class _SnapshotKey(object):
+    """A key in a `RegSnapshot`. Values and subkeys are sorted by their casefolded names."""
+    __slots__=('name','last_write','subtree_last_write','values','subkeys')
+
+    def __init__(self,name,last_write,values,subkeys):
+        self.name=name
+        self.last_write=last_write
+        # the latest last write time of this key and every key below it, so unchanged subtrees can be skipped
+        self.subtree_last_write=max([last_write]+[subkey.subtree_last_write for subkey in subkeys])
+        # ((casefolded name, name, value, type), ...)
+        self.values=values
+        # (_SnapshotKey, ...)
+        self.subkeys=subkeys
+
+
+def _snapshot_key(backend,handle,name):
+    info=backend.query_info_key(handle)
+    values=tuple(sorted(((n.casefold(),n,v,t) for n,v,t in _iter_values(backend,handle)),key=lambda value:value[0]))
+    subkeys=[]
+    for subkey_name in sorted(_iter_subkey_names(backend,handle),key=str.casefold):
+        subkey_handle=backend.open_key(handle,subkey_name,KEY_READ)
+        try:
+            subkeys.append(_snapshot_key(backend,subkey_handle,subkey_name))
+        finally:
+            backend.close_key(subkey_handle)
+    return _SnapshotKey(name,info.last_write,values,tuple(subkeys))
+
+
+
+class RegSnapshot(object):
+    """The keys and values below a path at a point in time, see `RegPath.snapshot`."""
+
+    def __init__(self,path,root):
+        self.path=path
+        self.root=root
+
+
+
+RegDiff=collections.namedtuple('RegDiff','change path name old new')
+RegDiff.__doc__="""
+A difference found by `diff`. `change` is one of 'key_added', 'key_removed', 'value_added', 'value_removed' or
+'value_modified', `path` is the `RegPath` of the key and, for value changes, `name` is the value name and `old` and
+`new` are the (value, type) tuples before and after (None when the value didn't exist).
+"""
+
+
+def diff(a,b,skip_unchanged=True):
+    """
+    A generator that yields a `RegDiff` for each difference between two `RegSnapshot`s, with paths relative to `b`.
+    Keys added or removed are reported along with every key and value below them.
+
+    Both snapshots are walked together by their sorted names, so it takes linear time. Subtrees whose latest last write
+    time and subkey and value counts are the same in both snapshots are skipped without being compared, unless
+    `skip_unchanged` is False, which is needed to compare snapshots of different trees.
+    """
+    yield from _diff_keys(b.path,a.root,b.root,skip_unchanged)
+
+
+def _diff_keys(path,a,b,skip_unchanged):
+    if skip_unchanged and a.subtree_last_write==b.subtree_last_write and len(a.subkeys)==len(b.subkeys) and len(a.values)==len(b.values):
+        return
+    for old,new in _merge_sorted(a.values,b.values,lambda value:value[0]):
+        if new is None:
+            yield RegDiff('value_removed',path,old[1],old[2:],None)
+        elif old is None:
+            yield RegDiff('value_added',path,new[1],None,new[2:])
+        elif old[2:]!=new[2:]:
+            yield RegDiff('value_modified',path,new[1],old[2:],new[2:])
+    for old,new in _merge_sorted(a.subkeys,b.subkeys,lambda key:key.name.casefold()):
+        if new is None:
+            yield from _diff_subtree('key_removed','value_removed',path/old.name,old)
+        elif old is None:
+            yield from _diff_subtree('key_added','value_added',path/new.name,new)
+        else:
+            yield from _diff_keys(path/new.name,old,new,skip_unchanged)
+
+
+def _diff_subtree(key_change,value_change,path,key):
+    yield RegDiff(key_change,path,None,None,None)
+    for value in key.values:
+        if value_change=='value_added': yield RegDiff(value_change,path,value[1],None,value[2:])
+        else: yield RegDiff(value_change,path,value[1],value[2:],None)
+    for subkey in key.subkeys:
+        yield from _diff_subtree(key_change,value_change,path/subkey.name,subkey)
+
+
+def _merge_sorted(a,b,key):
+    """Yields (a item, b item) pairs from two lists sorted by `key`, with None in place of the item missing from one of them."""
+    i,j=0,0
+    while i<len(a) or j<len(b):
+        if j==len(b):
+            yield a[i],None
+            i+=1
+        elif i==len(a):
+            yield None,b[j]
+            j+=1
+        else:
+            a_key,b_key=key(a[i]),key(b[j])
+            if a_key==b_key:
+                yield a[i],b[j]
+                i+=1
+                j+=1
+            elif a_key<b_key:
+                yield a[i],None
+                i+=1
+            else:
+                yield None,b[j]
+                j+=1
+
+
+
+# ----------------------------------------
+# Watching
+# ----------------------------------------
+RegChange=collections.namedtuple('RegChange','path count time')
+RegChange.__doc__="""A change reported by a `RegWatch`. `path` is the watched `RegPath`, `count` the number of changes coalesced into the event and `time` when it was reported (as from `time.time`)."""
+
+
+class RegWatch(object):
+    """
+    Reports changes to a key as `RegChange` events, see `RegPath.watch`. Iterate over it, or async iterate over it, to
+    receive them, and `close` it (or use it as a context manager) to stop watching.
+
+    Backends with native notifications (the winreg backend) are notified of changes by Windows, other backends are
+    polled every `interval` seconds by comparing last write times. Polling can only tell subkey changes
+    (REG_NOTIFY_CHANGE_NAME) from other changes by subkey counts and can't see attribute or security changes, and
+    polling a recursive watch queries the info of every key below it. Changes are coalesced into one event until
+    there's been no change for `debounce` seconds, or for at most ten times that in a continuous burst.
+
+    All watches share a single worker thread. If `callback` is given it's called with each event on that thread
+    instead of the event being queued for iteration.
+    """
+
+    def __init__(self,path,recursive=False,filter=REG_NOTIFY_CHANGE_NAME|REG_NOTIFY_CHANGE_LAST_SET,interval=1.0,debounce=0.1,callback=None):
+        self.path=path
+        self.recursive=recursive
+        self.filter=filter
+        self.interval=interval
+        self.debounce=debounce
+        self.callback=callback
+        self.closed=False
+        self._queue=queue.Queue()
+        self._loop=None
+        self._async_queue=None
+        self._deliver_lock=threading.Lock()
+        # state managed by the worker thread
+        self._handle=None
+        self._event=None
+        self._poll_state=None
+        self._next_poll=0
+        self._pending=None
+        if not path.backend.native_notifications:
+            # the state to compare the first poll with, so changes straight after this are seen
+            try:
+                self._poll_state=self._state()
+            except OSError:
+                pass
+            self._next_poll=time.monotonic()+interval
+        _watch_manager.add(self)
+
+
+    def close(self):
+        """Stops watching. Iteration finishes once the events already reported have been consumed."""
+        if self.closed: return
+        self.closed=True
+        _watch_manager.wake()
+        self._deliver(None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc_info):
+        self.close()
+
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        change=self._queue.get()
+        if change is None:
+            self._queue.put(None)
+            raise StopIteration
+        return change
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        with self._deliver_lock:
+            if self._async_queue is None:
+                self._loop=asyncio.get_running_loop()
+                self._async_queue=asyncio.Queue()
+                # move across anything reported before async iteration started
+                while not self._queue.empty(): self._async_queue.put_nowait(self._queue.get_nowait())
+        change=await self._async_queue.get()
+        if change is None:
+            self._async_queue.put_nowait(None)
+            raise StopAsyncIteration
+        return change
+
+
+    # ----------------------------------------
+    # helper methods (called on the worker thread)
+    # ----------------------------------------
+    def _deliver(self,change):
+        if self.callback is not None:
+            if change is not None: self.callback(change)
+            return
+        with self._deliver_lock:
+            if self._loop is None:
+                self._queue.put(change)
+                return
+            try:
+                self._loop.call_soon_threadsafe(self._async_queue.put_nowait,change)
+            except RuntimeError:
+                # the event loop has been closed
+                pass
+
+    def _arm(self):
+        """Registers for a native notification, returns False if it can't be (eg. because the key doesn't exist)."""
+        backend=self.path.backend
+        try:
+            if self._handle is None:
+                self._handle=backend.open_key(self.path.hkey_constant,self.path.path,KEY_NOTIFY)
+                self._event=_kernel32.CreateEventW(None,False,False,None)
+            backend.notify_change(self._handle,self.recursive,self.filter,self._event)
+            return True
+        except OSError:
+            self._disarm()
+            return False
+
+    def _disarm(self):
+        if self._handle is not None:
+            self.path.backend.close_key(self._handle)
+            self._handle=None
+        if self._event is not None:
+            _kernel32.CloseHandle(self._event)
+            self._event=None
+
+    def _poll(self,now):
+        self._next_poll=now+self.interval
+        state=self._state()
+        if state!=self._poll_state:
+            self._poll_state=state
+            self._changed(now)
+
+    def _state(self):
+        """What's compared to poll for changes, None if the key doesn't exist."""
+        backend=self.path.backend
+        try:
+            handle=backend.open_key(self.path.hkey_constant,self.path.path,KEY_READ)
+        except OSError as e:
+            if _winerror(e)==ERROR_FILE_NOT_FOUND: return None
+            raise
+        try:
+            return _watch_state(backend,handle,self.recursive,self.filter)
+        finally:
+            backend.close_key(handle)
+
+    def _changed(self,now):
+        if self._pending is None: self._pending=[now,now,1]
+        else:
+            self._pending[1]=now
+            self._pending[2]+=1
+
+    def _flush(self,now):
+        """Reports the pending change once it's settled. Returns when it should next be checked."""
+        if self._pending is None: return None
+        first,last,count=self._pending
+        due=min(last+self.debounce,first+self.debounce*10)
+        if now<due: return due
+        self._pending=None
+        self._deliver(RegChange(self.path,count,time.time()))
         return None
+
+
+def _watch_state(backend,handle,recursive,filter):
+    info=backend.query_info_key(handle)
+    state=[info.subkey_count]
+    if filter&REG_NOTIFY_CHANGE_LAST_SET: state+=[info.last_write,info.value_count]
+    if recursive:
+        for name in list(_iter_subkey_names(backend,handle)):
+            try:
+                subkey_handle=backend.open_key(handle,name,KEY_READ)
+            except OSError:
+                # deleted since it was enumerated, which the parent's state will show
+                continue
+            try:
+                state.append((name.casefold(),_watch_state(backend,subkey_handle,recursive,filter)))
+            finally:
+                backend.close_key(subkey_handle)
+    return state
+
+
+
+class _WatchManager(object):
+    """Runs every `RegWatch` on one worker thread, which exits while there's nothing to watch."""
+    # WaitForMultipleObjects can wait on at most 64 handles, one of which is the wake event
+    MAX_NATIVE=63
+
+    def __init__(self):
+        self._lock=threading.Lock()
+        self._watches=[]
+        self._thread=None
+        self._wake=threading.Event()
+        self._native_wake=None
+
+    def add(self,watch):
+        with self._lock:
+            self._watches.append(watch)
+            if self._thread is None:
+                self._thread=threading.Thread(target=self._run,name='winreglib-watch',daemon=True)
+                self._thread.start()
+        self.wake()
+
+    def wake(self):
+        self._wake.set()
+        if self._native_wake is not None: _kernel32.SetEvent(self._native_wake)
+
+
+    def _run(self):
+        native=[]
+        try:
+            while True:
+                with self._lock:
+                    for watch in [watch for watch in self._watches if watch.closed]:
+                        self._watches.remove(watch)
+                        if watch in native: native.remove(watch)
+                        watch._disarm()
+                    if not self._watches:
+                        self._thread=None
+                        return
+                    watches=list(self._watches)
+                self._wake.clear()
+                now=time.monotonic()
+
+                # natively notified watches, which fall back to polling when they can't be armed
+                for watch in watches:
+                    if watch not in native and now>=watch._next_poll and len(native)<self.MAX_NATIVE and watch.path.backend.native_notifications and watch._arm():
+                        native.append(watch)
+                        if self._native_wake is None: self._native_wake=_kernel32.CreateEventW(None,False,False,None)
+
+                deadlines=[]
+                for watch in watches:
+                    # one watch's errors (including from its callback) mustn't stop the others
+                    try:
+                        if watch not in native and now>=watch._next_poll:
+                            try:
+                                watch._poll(now)
+                            except OSError:
+                                watch._next_poll=now+watch.interval
+                        due=watch._flush(now)
+                    except Exception:
+                        _logger.exception('Error watching %s',watch.path)
+                        watch._next_poll=now+watch.interval
+                        due=None
+                    if watch not in native: deadlines.append(watch._next_poll)
+                    if due is not None: deadlines.append(due)
+                timeout=max(0,min(deadlines)-time.monotonic()) if deadlines else None
+
+                for i in self._wait(native,timeout):
+                    native[i]._changed(time.monotonic())
+                    if not native[i]._arm(): native.pop(i)
+        except Exception:
+            _logger.exception('The registry watch thread failed')
+        finally:
+            with self._lock:
+                # so the next watch added starts a new thread
+                if self._thread is threading.current_thread(): self._thread=None
+            for watch in native: watch._disarm()
+            if self._native_wake is not None:
+                _kernel32.CloseHandle(self._native_wake)
+                self._native_wake=None
+
+
+    def _wait(self,native,timeout):
+        """Waits for a native notification, a wake up or the timeout. Returns the indexes of the notified watches."""
+        if not native:
+            self._wake.wait(timeout)
+            return []
+        handles=(wintypes.HANDLE*(len(native)+1))(self._native_wake,*[watch._event for watch in native])
+        result=_kernel32.WaitForMultipleObjects(len(handles),handles,False,0xFFFFFFFF if timeout is None else int(timeout*1000))
+        if 1<=result<=len(native): return [result-1]
+        return []
+
+
+_watch_manager=_WatchManager()
+
+
+
+# ----------------------------------------
+# RegScan class
+# ----------------------------------------
+class _ScanError(object):
+    __slots__=('error',)
+
+    def __init__(self,error):
+        self.error=error
+
+
+
+class RegScan(object):
+    """
+    The iterator returned by `RegPath.scan`. Call `cancel` (from any thread) or `close` to stop the scan early, or use
+    it as a context manager to stop it when the block exits.
+    """
+    _DONE=object()
+
+    def __init__(self,path,workers=4,ordered=False,max_depth=None,onerror=None,queue_size=1024,data=True):
+        self.path=path
+        self.workers=workers
+        self.ordered=ordered
+        self.max_depth=max_depth
+        self.onerror=onerror
+        self.queue_size=queue_size
+        self.data=data
+        self._cancelled=threading.Event()
+        self._results=self._run()
+
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._results)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc_info):
+        self.close()
+
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """Stops the workers. The iterator finishes at the next result."""
+        self._cancelled.set()
+
+    def close(self):
+        """Stops the workers and waits for them to finish."""
+        self.cancel()
+        self._results.close()
+
+
+    # ----------------------------------------
+    # helper methods
+    # ----------------------------------------
+    def _run(self):
+        root=next(self.path.walk(max_depth=0,onerror=self.onerror,data=self.data),None)
+        if root is None or self.cancelled: return
+        yield root
+        if self.max_depth==0: return
+        subkey_depth=None if self.max_depth is None else self.max_depth-1
+        subkeys=[self.path/name for name in root[1]]
+        executor=concurrent.futures.ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            if self.ordered:
+                # each subtree has its own queue, drained in order. Only a window of subtrees are submitted ahead of
+                # the one being drained, so memory stays bounded while workers run ahead.
+                def submit(path):
+                    results=queue.Queue(self.queue_size)
+                    executor.submit(self._scan_subtree,path,subkey_depth,results)
+                    return results
+                window=2*self.workers
+                pending=collections.deque(submit(path) for path in subkeys[:window])
+                remaining=iter(subkeys[window:])
+                while pending:
+                    results=pending.popleft()
+                    path=next(remaining,None)
+                    if path is not None: pending.append(submit(path))
+                    yield from self._drain(results,1)
+                    if self.cancelled: return
+            else:
+                results=queue.Queue(self.queue_size)
+                for path in subkeys:
+                    executor.submit(self._scan_subtree,path,subkey_depth,results)
+                yield from self._drain(results,len(subkeys))
+        finally:
+            self._cancelled.set()
+            executor.shutdown(wait=True)
+
+
+    def _drain(self,results,tasks):
+        while tasks:
+            try:
+                item=results.get(timeout=0.1)
+            except queue.Empty:
+                if self.cancelled: return
+                continue
+            if self.cancelled: return
+            if item is self._DONE:
+                tasks-=1
+            elif isinstance(item,_ScanError):
+                raise item.error
+            else:
+                yield item
+
+
+    def _put(self,results,item):
+        """Puts an item on a results queue, blocking while it's full. Returns False if the scan was cancelled."""
+        while not self.cancelled:
+            try:
+                results.put(item,timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+
+    def _scan_subtree(self,path,max_depth,results):
+        if self.cancelled: return
+        try:
+            for entry in path.walk(max_depth=max_depth,onerror=self.onerror,data=self.data):
+                if not self._put(results,entry): return
+        except Exception as e:
+            self._put(results,_ScanError(e))
+        self._put(results,self._DONE)
+
+
+
+# ----------------------------------------
+# Asyncio classes
+# ----------------------------------------
+_async_executor=None
+
+def get_async_executor():
+    """Returns the executor the async classes run registry calls on when they weren't given one, a dedicated 16 thread pool unless `set_async_executor` has been called."""
+    global _async_executor
+    if _async_executor is None: _async_executor=concurrent.futures.ThreadPoolExecutor(max_workers=16,thread_name_prefix='winreglib')
+    return _async_executor
+
+def set_async_executor(executor):
+    """Sets the executor the async classes run registry calls on and returns the previous one. Its number of workers limits how many registry calls run at once."""
+    global _async_executor
+    previous,_async_executor=_async_executor,executor
+    return previous
+
+
+async def _run_in_executor(executor,fn,*args,**kwargs):
+    loop=asyncio.get_running_loop()
+    return await loop.run_in_executor(executor if executor is not None else get_async_executor(),functools.partial(fn,*args,**kwargs))
+
+
+def _next_batch(generator,lock,size):
+    with lock:
+        batch=[]
+        for item in generator:
+            batch.append(item)
+            if len(batch)==size: break
+        return batch
+
+def _close_generator(generator,lock):
+    with lock:
+        generator.close()
+
+async def _iterate_in_executor(executor,generator,batch_size):
+    """Runs a (blocking) generator on the executor, `batch_size` items at a time, and yields its items."""
+    # the lock stops the generator being closed while a cancelled batch is still running
+    lock=threading.Lock()
+    try:
+        while True:
+            batch=await _run_in_executor(executor,_next_batch,generator,lock,batch_size)
+            for item in batch: yield item
+            if len(batch)<batch_size: return
+    finally:
+        # not awaited, so it still happens when the finally is run by a cancelled task
+        (executor if executor is not None else get_async_executor()).submit(_close_generator,generator,lock)
+
+
+
+class AsyncRegPath(object):
+    """
+    An asyncio version of `RegPath`. The blocking registry calls run on an executor (see `get_async_executor`) and are
+    awaited, and the generators are async generators that fetch `batch_size` items per executor call.
+
+        p=AsyncRegPath(r'HKLM\\Software')
+        async for k in p.subkeys():
+            print(await k.value('test').get())
+
+    Cancelling an awaiting task cancels the call if it hasn't started yet, otherwise its result is discarded.
+    """
+
+    def __init__(self,path,hkey_constant=None,backend=None,executor=None,batch_size=64):
+        self.reg_path=path if isinstance(path,RegPath) and hkey_constant is None and backend is None else RegPath(path,hkey_constant,backend)
+        self.executor=executor
+        self.batch_size=batch_size
+
+
+    def __truediv__(self,path):
+        return self._wrap(self.reg_path/path)
+
+    def __str__(self):
+        return str(self.reg_path)
+
+
+    # ----------------------------------------
+    # properties
+    # ----------------------------------------
+    @property
+    def hkey(self):
+        return self.reg_path.hkey
+
+    @property
+    def path(self):
+        return self.reg_path.path
+
+    @property
+    def name(self):
+        return self.reg_path.name
+
+    @property
+    def parent(self):
+        return self._wrap(self.reg_path.parent)
+
+
+    # ----------------------------------------
+    # Key manipulation
+    # ----------------------------------------
+    async def exists(self):
+        return await _run_in_executor(self.executor,self.reg_path.exists)
+
+    async def create(self):
+        return await _run_in_executor(self.executor,self.reg_path.create)
+
+    async def delete(self,recurse=False):
+        return await _run_in_executor(self.executor,self.reg_path.delete,recurse)
+
+    async def subkeys(self):
+        """An async generator that yields an `AsyncRegPath` for each subkey in this key"""
+        async for path in _iterate_in_executor(self.executor,self.reg_path.subkeys(),self.batch_size):
+            yield self._wrap(path)
+
+    async def subvalues(self,data=True):
+        """An async generator that yields an `AsyncRegValue` for each subvalue in this key. Use `get` to read the data of values from `data` False."""
+        async for value in _iterate_in_executor(self.executor,self.reg_path.subvalues(data),self.batch_size):
+            yield AsyncRegValue(value,executor=self.executor)
+
+    async def walk(self,topdown=True,max_depth=None,onerror=None,data=True):
+        """An async version of `RegPath.walk`, yielding (path, subkey_names, values) tuples with `path` an `AsyncRegPath`. Pruning `subkey_names` has no effect."""
+        async for path,names,values in _iterate_in_executor(self.executor,self.reg_path.walk(topdown,max_depth,onerror,data),self.batch_size):
+            yield self._wrap(path),names,[AsyncRegValue(value,executor=self.executor) for value in values]
+
+
+    # ----------------------------------------
+    # Value manipulation
+    # ----------------------------------------
+    def value(self,name):
+        """Returns an `AsyncRegValue` object for the value `name` at this path."""
+        return AsyncRegValue(self.reg_path.value(name),executor=self.executor)
+
+    async def get_values(self,names):
+        return await _run_in_executor(self.executor,self.reg_path.get_values,names)
+
+    async def read_all(self):
+        return await _run_in_executor(self.executor,self.reg_path.read_all)
+
+
+    # ----------------------------------------
+    # helper methods
+    # ----------------------------------------
+    def _wrap(self,path):
+        return AsyncRegPath(path,executor=self.executor,batch_size=self.batch_size)
+
+
+
+class AsyncRegValue(object):
+    """An asyncio version of `RegValue`, see `AsyncRegPath`."""
+
+    def __init__(self,value,executor=None):
+        self.reg_value=value
+        self.executor=executor
+
+
+    @property
+    def path(self):
+        return AsyncRegPath(self.reg_value.path,executor=self.executor)
+
+    @property
+    def name(self):
+        return self.reg_value.name
+
+    @property
+    def value(self):
+        return self.reg_value.value
+
+    @property
+    def type(self):
+        return self.reg_value.type
+
+    @property
+    def size(self):
+        return self.reg_value.size
+
+
+    async def stat(self):
+        return await _run_in_executor(self.executor,self.reg_value.stat)
+
+    async def exists(self):
+        return await _run_in_executor(self.executor,self.reg_value.exists)
+
+    async def get(self):
+        return await _run_in_executor(self.executor,self.reg_value.get)
+
+    async def set(self,value,type=None):
+        return await _run_in_executor(self.executor,self.reg_value.set,value,type)
+
+    async def delete(self):
+        return await _run_in_executor(self.executor,self.reg_value.delete)
+
+
+
+# ----------------------------------------
+# .reg files
+# ----------------------------------------
+RegOperation=collections.namedtuple('RegOperation','op path name type value')
+RegOperation.__doc__="""
+An operation from a .reg file. `op` is one of 'create_key', 'delete_key', 'set_value' or 'delete_value', `path` is the
+full key path string and `name`, `type` and `value` are None unless they apply to the operation.
+"""
+
+_HKEY_NAMES={value:key for key,value in RegPath.HKEY_CONSTANTS.items() if key.startswith('HKEY_')}
+
+_REG_HEADERS={
+    'Windows Registry Editor Version 5.00':'utf-16-le',
+    'REGEDIT4':'cp1252',
+}
+
+
+def parse_reg(source):
+    """
+    A generator that yields a `RegOperation` for each key and value in a .reg file, reading it a line at a time.
+    `source` is a file name or a file object opened in binary (or text) mode. Both REGEDIT5 (UTF-16) and REGEDIT4
+    files are supported.
+    """
+    if isinstance(source,str):
+        with open(source,'rb') as fin:
+            yield from parse_reg(fin)
+        return
+    if isinstance(source,io.TextIOBase):
+        yield from _parse_reg_lines(source)
+        return
+    # UTF-16 files start with a byte order mark, REGEDIT4 files are ANSI
+    buffered=io.BufferedReader(source) if not hasattr(source,'peek') else None
+    if buffered is not None: source=buffered
+    encoding='utf-16' if source.peek(2)[:2] in (b'\xff\xfe',b'\xfe\xff') else 'cp1252'
+    lines=io.TextIOWrapper(source,encoding=encoding)
+    try:
+        yield from _parse_reg_lines(lines)
+    finally:
+        # don't close the caller's file when the wrappers are garbage collected
+        lines.detach()
+        if buffered is not None: buffered.detach()
+
+
+def _parse_reg_lines(lines):
+    lines=iter(enumerate(lines,1))
+
+    header=next(lines,(0,''))[1].lstrip('\ufeff').strip()
+    if header not in _REG_HEADERS:
+        raise ValueError('Not a .reg file, unrecognised header: {!r}'.format(header))
+    string_encoding=_REG_HEADERS[header]
+
+    path=None
+    for line_number,line in lines:
+        line=line.strip()
+        if not line or line.startswith(';'): continue
+        try:
+            if line.startswith('['):
+                if not line.endswith(']'): raise ValueError('Unterminated key')
+                path=line[1:-1]
+                if path.startswith('-'):
+                    path=path[1:]
+                    _check_reg_hkey(path)
+                    yield RegOperation('delete_key',path,None,None,None)
+                    path=None
+                else:
+                    _check_reg_hkey(path)
+                    yield RegOperation('create_key',path,None,None,None)
+                continue
+            if path is None: raise ValueError('Value outside of a key')
+            # join continued (hex) lines
+            while line.endswith('\\') and '=hex' in line:
+                line=line[:-1]+next(lines,(0,''))[1].strip()
+            if line.startswith('@'):
+                name,data='',line[1:]
+            else:
+                name,data=_parse_reg_string(line)
+            if not data.startswith('='): raise ValueError('Expected =')
+            type,value=_parse_reg_data(data[1:].strip(),string_encoding)
+            if type is None:
+                yield RegOperation('delete_value',path,name,None,None)
+            else:
+                yield RegOperation('set_value',path,name,type,value)
+        except ValueError as e:
+            raise ValueError('{} on line {}: {}'.format(e,line_number,line)) from None
+
+
+def _check_reg_hkey(path):
+    hkey=path.partition('\\')[0]
+    if hkey not in RegPath.HKEY_CONSTANTS: raise ValueError('HKEY not recognised: {}'.format(hkey))
+
+
+def _parse_reg_string(text):
+    """Parses a quoted, escaped .reg string from the start of `text`. Returns the string and the rest of the text."""
+    if not text.startswith('"'): raise ValueError('Expected a quoted string')
+    chars=[]
+    i=1
+    while i<len(text):
+        c=text[i]
+        if c=='\\' and i+1<len(text):
+            chars.append(text[i+1])
+            i+=2
+            continue
+        if c=='"': return ''.join(chars),text[i+1:]
+        chars.append(c)
+        i+=1
+    raise ValueError('Unterminated string')
+
+
+def _parse_reg_data(data,string_encoding):
+    """Parses the data after the = of a value line. Returns (type, value), where type is None when the value is being deleted."""
+    if data=='-':
+        return None,None
+    if data.startswith('"'):
+        value,rest=_parse_reg_string(data)
+        if rest.strip(): raise ValueError('Unexpected text after string')
+        return REG_SZ,value
+    if data.startswith('dword:'):
+        return REG_DWORD,int(data[6:],16)
+    if data.startswith('hex:'):
+        type,data=REG_BINARY,data[4:]
+    elif data.startswith('hex('):
+        type,_,data=data[4:].partition('):')
+        type=int(type,16)
+    else:
+        raise ValueError('Unrecognised value data')
+    raw=bytes(int(b,16) for b in data.replace(' ','').split(',') if b)
+    return type,_decode_data(type,raw,string_encoding if type in (REG_SZ,REG_EXPAND_SZ,REG_MULTI_SZ) else 'utf-16-le')
+
+
+def _format_reg_string(s):
+    return '"'+s.replace('\\','\\\\').replace('"','\\"')+'"'
+
+
+def _format_reg_value(name,value,type):
+    """Formats a value as a .reg file line (or lines), ending in a new line."""
+    line=('@' if name=='' else _format_reg_string(name))+'='
+    if type==REG_SZ and '\n' not in (value or '') and '\r' not in (value or ''):
+        return line+_format_reg_string(value or '')+'\n'
+    if type==REG_DWORD:
+        return line+'dword:{:08x}\n'.format(value or 0)
+    line+='hex:' if type==REG_BINARY else 'hex({:x}):'.format(type)
+    # wrap long data like regedit does
+    data=_encode_data(type,value)
+    lines=[]
+    for i,b in enumerate(data):
+        if len(line)>76:
+            lines.append(line+'\\')
+            line='  '
+        line+='{:02x}'.format(b)+(',' if i<len(data)-1 else '')
+    lines.append(line)
+    return '\n'.join(lines)+'\n'
+
+
+def apply_reg(operations,backend=None):
+    """
+    Applies `RegOperation`s (eg. from `parse_reg`) to a backend, the default backend if not given. Consecutive value
+    operations on the same key are applied through one handle. Returns the number of operations applied.
+    """
+    backend=backend if backend is not None else get_backend()
+    count=0
+    # the handle of the key the last value operations were applied to
+    path,handle=None,None
+    try:
+        for op in operations:
+            if op.path!=path:
+                if handle is not None: backend.close_key(handle)
+                path,handle=None,None
+            if op.op=='delete_key':
+                # the key (or one above the key) the handle is to may be being deleted
+                if handle is not None: backend.close_key(handle)
+                path,handle=None,None
+                _ignore_file_not_found_error(lambda:RegPath(op.path,backend=backend).delete(recurse=True))
+            elif op.op=='delete_value':
+                if handle is None:
+                    handle=_ignore_file_not_found_error(lambda:backend.open_key(*RegPath._split_path(op.path),access=KEY_WRITE))
+                    if handle is None:
+                        count+=1
+                        continue
+                    path=op.path
+                _ignore_file_not_found_error(lambda:backend.delete_value(handle,op.name))
+            else:
+                if handle is None:
+                    handle=backend.create_key(*RegPath._split_path(op.path),access=KEY_WRITE)
+                    path=op.path
+                if op.op=='set_value': backend.set_value(handle,op.name,op.type,op.value)
+            if backend.value_cache is not None and op.name is not None: backend.value_cache.invalidate(*RegPath._split_path(op.path),op.name)
+            count+=1
+    finally:
+        if handle is not None: backend.close_key(handle)
+    return count
+
+
+def import_reg(source,backend=None):
+    """Imports a .reg file (a file name or file object) into a backend, the default backend if not given. Returns the number of operations applied."""
+    return apply_reg(parse_reg(source),backend)
+
+
+
+# ----------------------------------------
+# Tracing
+# ----------------------------------------
+TraceRecord=collections.namedtuple('TraceRecord','time thread op path name type size index error handle key access')
+TraceRecord.__doc__="""
+A backend call read from a trace by `read_trace`. `time` is in seconds since the recording started, `thread` numbers
+the recording's threads in the order they first made a call and `op` is the primitive's name. `path` is the full path of
+the key the call was on, `name` the value name, subkey name or sub key path, `type` and `size` the reg type and data size
+of the value read or written (-1 and 0 if not applicable) and `index` the enumeration index. `error` is the winerror the
+call failed with, or 0. `handle` and `key` are the trace's ids for the handle returned and the handle (or HKEY) used,
+`key` being 0 for a handle that was opened before recording started and so is unknown. `access` is the access mask
+keys were opened or created with, 0 for other calls.
+
+A recording starts with a 'start' record whose `time` is when it started, as from `time.time`, followed by an open_key
+record for each handle that was in the backend's `HandlePool` then.
+"""
+
+_TRACE_MAGIC=b'winreglib trace\x02'
+_TRACE_OPS=('start',)+tuple(name for name in Instrumentation.PRIMITIVES if name!='notify_change')
+_TRACE_OP_CODES={op:code for code,op in enumerate(_TRACE_OPS)}
+# time, thread, op, key, handle, access, index, type, size, error, name length
+_TRACE_RECORD=struct.Struct('<dHBqqIiiIiI')
+
+
+class TraceRecorder(object):
+    """
+    Records every call made to a backend's primitives (so everything `RegPath` and `RegValue` do with it) to a compact
+    binary trace file, to be read with `read_trace` or replayed against another backend with `replay_trace`:
+
+        with TraceRecorder('workload.trace'):
+            run_workload()
+
+    Records hold the call, the key's path, the value name, type and data size, the time and the thread, but not the
+    values' data. `target` is a file name, which is appended to, or a binary file object. Like `Instrumentation`, it
+    only costs anything while recording.
+    """
+
+    def __init__(self,target,backend=None):
+        self.backend=backend if backend is not None else get_backend()
+        self.target=target
+        self._file=None
+        self._lock=threading.Lock()
+
+
+    def start(self):
+        """Starts recording, appending a new recording to the file."""
+        if self._file is not None: return
+        if isinstance(self.target,str):
+            self._file=open(self.target,'ab')
+            self._close_file=True
+        else:
+            self._file=self.target
+            self._close_file=False
+        if self._file.tell()==0: self._file.write(_TRACE_MAGIC)
+        self._start=time.perf_counter()
+        # id(handle) -> the trace ids of its opens not yet closed, the latest last (backends can return the same
+        # object from each open of a key), and thread ident -> trace thread number
+        self._handle_ids={}
+        self._next_handle_id=1
+        self._threads={}
+        pool=self.backend.handle_pool
+        # holding the pool's lock, so its handles don't change until the recorder sees them
+        with pool._lock if pool is not None else contextlib.nullcontext():
+            with self._lock:
+                self._file.write(_TRACE_RECORD.pack(time.time(),0,0,0,0,0,0,-1,0,0,0))
+                # the pool's handles are used without being opened, so record opens of them
+                for (hkey_constant,path,access),entry in (pool._entries.items() if pool is not None else ()):
+                    self._write_open(hkey_constant,path,access,entry.handle)
+            _add_observer(self.backend,self)
+
+    def stop(self):
+        """Stops recording and flushes (or closes, if it was opened from a file name) the file."""
+        if self._file is None: return
+        _remove_observer(self.backend,self)
+        with self._lock:
+            if self._close_file: self._file.close()
+            else: self._file.flush()
+            self._file=None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self,*exc_info):
+        self.stop()
+
+
+    # ----------------------------------------
+    # helper methods
+    # ----------------------------------------
+    def _observe(self,op,args,kwargs,result,error,seconds):
+        code=_TRACE_OP_CODES.get(op)
+        if code is None: return
+        if error is not None:
+            if not isinstance(error,OSError): return
+            error=_winerror(error) or error.errno or -1
+        else:
+            error=0
+        key,handle,access,index,type,size,name=0,0,0,0,-1,0,''
+        with self._lock:
+            if self._file is None: return
+            elapsed=time.perf_counter()-self._start
+            thread=self._threads.setdefault(threading.get_ident(),len(self._threads))
+            key=self._id(args[0]) if args else 0
+            if op in ('open_key','create_key'):
+                name=args[1]
+                access=args[2] if len(args)>2 else kwargs.get('access',KEY_READ if op=='open_key' else KEY_WRITE)
+                if result is not None: handle=self._new_id(result)
+            elif op=='close_key':
+                ids=self._handle_ids.get(id(args[0]))
+                if ids:
+                    ids.pop()
+                    if not ids: del self._handle_ids[id(args[0])]
+            elif op=='enum_key':
+                index=args[1]
+                if result is not None: name=result
+            elif op in ('enum_value','enum_value_info'):
+                index=args[1]
+                if result is not None:
+                    name,type=result[0],result[-1 if op=='enum_value' else 1]
+                    size=_value_size(result[1],result[2]) if op=='enum_value' else result[2]
+            elif op in ('query_value','query_value_info'):
+                name=args[1] or ''
+                if result is not None:
+                    type=result[1] if op=='query_value' else result[0]
+                    size=_value_size(*result) if op=='query_value' else result[1]
+            elif op=='set_value':
+                name,type,size=args[1] or '',args[2],_value_size(args[3],args[2])
+            elif op in ('delete_key','delete_value'):
+                name=args[1] or ''
+            name=name.encode('utf-8','surrogatepass')
+            self._file.write(_TRACE_RECORD.pack(elapsed,thread,code,key,handle,access,index,type,size,error,len(name)))
+            self._file.write(name)
+
+    def _new_id(self,handle):
+        """Gives a handle that's been opened the next trace id. Called with the lock held."""
+        handle_id=self._next_handle_id
+        self._next_handle_id+=1
+        self._handle_ids.setdefault(id(handle),[]).append(handle_id)
+        return handle_id
+
+    def _write_open(self,hkey_constant,path,access,handle):
+        """Records an open of a handle opened before recording started. Called with the lock held."""
+        thread=self._threads.setdefault(threading.get_ident(),len(self._threads))
+        name=path.encode('utf-8','surrogatepass')
+        self._file.write(_TRACE_RECORD.pack(0,thread,_TRACE_OP_CODES['open_key'],hkey_constant,self._new_id(handle),access,0,-1,0,0,len(name)))
+        self._file.write(name)
+
+    def _id(self,key):
+        """The trace id of a handle, or the HKEY itself."""
+        if isinstance(key,int): return key
+        ids=self._handle_ids.get(id(key))
+        return ids[-1] if ids else 0
+
+
+def read_trace(source):
+    """A generator that yields a `TraceRecord` for each call in a trace file (a file name or binary file object) written by `TraceRecorder`."""
+    if isinstance(source,str):
+        with open(source,'rb') as fin:
+            yield from read_trace(fin)
+        return
+    if source.read(len(_TRACE_MAGIC))!=_TRACE_MAGIC: raise ValueError('Not a winreglib trace')
+    # trace id -> the key's path
+    paths={}
+    while True:
+        header=source.read(_TRACE_RECORD.size)
+        if len(header)<_TRACE_RECORD.size: return
+        elapsed,thread,code,key,handle,access,index,type,size,error,name_length=_TRACE_RECORD.unpack(header)
+        name=source.read(name_length).decode('utf-8','surrogatepass')
+        op=_TRACE_OPS[code]
+        if op=='start': paths={}
+        path=paths.get(key,_HKEY_NAMES.get(key,''))
+        if op in ('open_key','create_key','delete_key'):
+            path=path+'\\'+name if path and name else path or name
+            if handle: paths[handle]=path
+        elif op=='close_key':
+            paths.pop(key,None)
+        yield TraceRecord(elapsed,thread,op,path,name,type,size,index,error,handle,key,access)
+
+
+def replay_trace(source,backend=None,speed=None,threads=False):
+    """
+    Makes the calls recorded in a trace (a file name, binary file object or iterable of `TraceRecord`s) to a backend,
+    the default backend if not given. Written values get data of the recorded type and size. Calls run as fast as
+    possible, unless `speed` is given, in which case they keep to the recording's timing (2 being twice as fast). With
+    `threads` True each recorded thread's calls are made by a thread of their own, otherwise they're made in order by
+    this thread. Calls that fail are counted, not raised. Returns (calls made, calls that failed).
+    """
+    backend=backend if backend is not None else get_backend()
+    records=source if not isinstance(source,(str,io.IOBase)) else read_trace(source)
+    # recordings' trace ids -> backend handles, shared by the threads
+    handles={}
+    opened=threading.Condition()
+    counts=[0,0]
+    counts_lock=threading.Lock()
+
+    def resolve(key,wait):
+        """The backend handle (or HKEY) for a trace id, waiting a little for another thread to open it. 0 is an unknown handle."""
+        with opened:
+            if wait: opened.wait_for(lambda:key in handles,timeout=1)
+            handle=handles.get(key,key)
+        if handle is _REPLAY_FAILED: raise _registry_error(ERROR_INVALID_HANDLE,'The handle is invalid, opening it failed')
+        return handle
+
+    def run(records,start):
+        calls=errors=0
+        for record in records:
+            if speed:
+                delay=start+record.time/speed-time.perf_counter()
+                if delay>0: time.sleep(delay)
+            calls+=1
+            try:
+                _replay_call(backend,record,handles,opened,resolve,threads)
+            except OSError:
+                errors+=1
+        with counts_lock:
+            counts[0]+=calls
+            counts[1]+=errors
+
+    try:
+        for recording in _split_recordings(records):
+            start=time.perf_counter()
+            if not threads:
+                run(recording,start)
+                continue
+            by_thread=collections.defaultdict(list)
+            for record in recording: by_thread[record.thread].append(record)
+            workers=[threading.Thread(target=run,args=(thread_records,start)) for thread_records in by_thread.values()]
+            for worker in workers: worker.start()
+            for worker in workers: worker.join()
+    finally:
+        # handles the recording left open (eg. from a handle pool)
+        for handle in handles.values():
+            if handle is _REPLAY_FAILED: continue
+            try:
+                backend.close_key(handle)
+            except OSError:
+                pass
+    return tuple(counts)
+
+
+_REPLAY_FAILED=object()
+
+def _split_recordings(records):
+    """Yields the records of each recording in a trace, as a list."""
+    recording=[]
+    for record in records:
+        if record.op=='start':
+            if recording: yield recording
+            recording=[]
+        else:
+            recording.append(record)
+    if recording: yield recording
+
+def _replay_call(backend,record,handles,opened,resolve,threads):
+    op=record.op
+    key=resolve(record.key,threads and record.key and record.key not in _HKEY_NAMES)
+    if op in ('open_key','create_key'):
+        try:
+            handle=getattr(backend,op)(key,record.name,record.access)
+        except OSError:
+            # so the calls on the handle fail straight away rather than waiting for it
+            if record.handle:
+                with opened:
+                    handles[record.handle]=_REPLAY_FAILED
+                    opened.notify_all()
+            raise
+        with opened:
+            handles[record.handle]=handle
+            opened.notify_all()
+    elif op=='close_key':
+        with opened:
+            handle=handles.pop(record.key,None)
+        if handle is not None: backend.close_key(handle)
+    elif op in ('enum_key','enum_value','enum_value_info'):
+        getattr(backend,op)(key,record.index)
+    elif op in ('query_value','query_value_info','delete_value'):
+        getattr(backend,op)(key,record.name)
+    elif op=='set_value':
+        backend.set_value(key,record.name,record.type,_replay_value(record.type,record.size))
+    elif op=='delete_key':
+        backend.delete_key(key,record.name)
+    elif op=='query_info_key':
+        backend.query_info_key(key)
+
+def _replay_value(type,size):
+    """A value of the type that's `size` bytes of data."""
+    if type in (REG_SZ,REG_EXPAND_SZ): return 'x'*max(size//2-1,0)
+    if type==REG_MULTI_SZ: return ['x'*max(size//2-2,0)] if size>2 else []
+    if type in (REG_DWORD,REG_QWORD): return 0
+    if type==REG_NONE and not size: return None
+    return bytes(size)